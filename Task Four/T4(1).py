@@ -1,37 +1,59 @@
 import pandas as pd
 import numpy as np
-import zipfile
 import os
+import sys
 
-# 步骤 1：解压并加载沪深300成分股数据
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.archive_reader import ZipArchive, cached_derived
+from common.bootstrap import bootstrap_expected_return, summarize_distribution
+from common.instrumentation import instrument
+
+# 自助法模拟 E(R) 分布的路径数（0 为不模拟）
+bootstrap_paths = 10000
+
+# 沪深300成分股数据压缩包与10年期国债数据
 hs300_zip_path = r"E:\大学\数学建模\2024粤港澳大湾区数学建模\沪深300成分股的数据.zip"
+treasury_data_path = '/mnt/data/十年国债每月数据.xlsx'
+
+# 成分股文件名：hs300stocks_{year}.csv（行情文件 hs300stocks_kdata_{year}.csv 不需要读取）
+CONSTITUENT_PATTERN = r'hs300stocks_(\d{4})\.csv'
+
 
-# 解压缩文件内容到指定目录
-with zipfile.ZipFile(hs300_zip_path, 'r') as zip_ref:
-    zip_ref.extractall("E:/大学/数学建模/2024粤港澳大湾区数学建模/沪深300成分股的数据/extracted_hs300_data")
+# 每年成分股“weight”列的统计量，成员直接从压缩包中读取（只读取 weight 列）
+@instrument()
+def annual_weight_stats(zip_path):
+    rows = []
+    with ZipArchive(zip_path) as archive:
+        for name, match in archive.find(CONSTITUENT_PATTERN):
+            hs300_data = archive.read_csv(name, usecols=lambda column: column == 'weight')
+            if 'weight' in hs300_data.columns:
+                weight = hs300_data['weight']
+                rows.append({'Year': int(match.group(1)), 'Count': int(weight.count()),
+                             'Mean': weight.mean(), 'Std': weight.std()})
+    return pd.DataFrame(rows, columns=['Year', 'Count', 'Mean', 'Std'])
 
-# 加载每年的沪深300数据，并使用“weight”列的均值作为年收益的代理值
-hs300_data_dir = 'E:/大学/数学建模/2024粤港澳大湾区数学建模/沪深300成分股的数据/'
-hs300_annual_files = [f for f in os.listdir(hs300_data_dir) if f.startswith('hs300stocks_') and f.endswith('.csv')]
 
-# 存储年收益率
-annual_returns = {}
-for file_name in hs300_annual_files:
-    year = int(file_name.split('_')[-1].split('.')[0])
-    file_path = os.path.join(hs300_data_dir, file_name)
-    hs300_data = pd.read_csv(file_path)
-    if 'weight' in hs300_data.columns:
-        annual_returns[year] = hs300_data['weight'].mean()
+# 读取10年期国债月度收益率（Excel 序列日期转换为日期）
+@instrument()
+def load_treasury_yields(path):
+    treasury_data = pd.read_excel(path, header=None)
+    treasury_data.columns = ['Date', 'Yield']
+    treasury_data['Date'] = pd.to_datetime('1899-12-30') + pd.to_timedelta(treasury_data['Date'], 'D')
+    return treasury_data
+
+
+# 步骤 1：加载每年的沪深300数据，并使用“weight”列的均值作为年收益的代理值
+# 统计量按压缩包内容缓存，压缩包未变化时不再读取
+weight_stats = cached_derived('hs300_weight_stats', [hs300_zip_path], lambda: annual_weight_stats(hs300_zip_path))
+annual_returns = dict(zip(weight_stats['Year'], weight_stats['Mean']))
 
 # 步骤 2：使用几何平均公式计算市场平均收益率 R_m
 N = len(annual_returns)
 R_m = (np.prod([1 + r for r in annual_returns.values()]) ** (1 / N)) - 1
 
-# 步骤 3：加载并处理10年期国债数据
-treasury_data_path = '/mnt/data/十年国债每月数据.xlsx'
-treasury_data = pd.read_excel(treasury_data_path, header=None)
-treasury_data.columns = ['Date', 'Yield']
-treasury_data['Date'] = pd.to_datetime('1899-12-30') + pd.to_timedelta(treasury_data['Date'], 'D')
+# 步骤 3：加载并处理10年期国债数据（按工作簿内容缓存）
+treasury_data = cached_derived('treasury_yields', [treasury_data_path],
+                               lambda: load_treasury_yields(treasury_data_path))
 R_f = treasury_data['Yield'].mean() / 100  # 转换百分比为小数
 
 # 步骤 4：计算风险溢价 RP
@@ -45,3 +67,10 @@ print("市场平均收益率 (R_m):", R_m)
 print("无风险收益率 (R_f):", R_f)
 print("风险溢价 (RP):", RP)
 print("合理收益预期 (E(R)):", E_R)
+
+# 步骤 6：对年收益率序列做自助法抽样，给出 R_m、RP 和 E(R) 的分布
+if bootstrap_paths:
+    expected_return_paths = bootstrap_expected_return([annual_returns[year] for year in sorted(annual_returns)],
+                                                      R_f, num_paths=bootstrap_paths)
+    print("自助法模拟的分布:")
+    print(summarize_distribution(expected_return_paths))
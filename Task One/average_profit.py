@@ -1,9 +1,39 @@
 import numpy as np
 import pandas as pd
 import os
+import sys
+import warnings
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import instrument
+from common.kdata_cache import iter_kdata_chunks, load_kdata
+from common.panel import Panel
+from common.result_writer import export_excel, write_results
+from common.universe import Universe, load_universe_panel
+from common.year_executor import concat_year_results, run_years
 
 data_folder = "./沪深300成分股的数据/"
 
+# 计算收益率所需的行情列
+RETURN_COLUMNS = ['time', 'code', 'close']
+
+# 设置为行数时按块流式读取行情数据（紧凑类型），内存占用与块大小有关
+chunk_rows = None
+
+# 设置为 True 时每年的收盘价一次展开为 日期×证券 面板（common/panel.py），直接按年计算每日平均收益率；
+# False 时使用长表（按证券分组计算收益率），所有年份拼接后再计算
+use_panel = True
+
+# 设置为 True 时所有年份的收盘价拼接为一个面板（common/universe.py），收益率跨年衔接（每年第一个交易日也有收益率），
+# 每个交易日按当时的成分股及权重计算；False 时按年计算（与原结果一致）
+continuous = False
+
+# 设置为 True 时额外导出 Excel 文件（结果数据集默认以 Parquet 格式按年份分区保存）
+excel_export = False
+
+# 按年份并行处理时的进程数（None 表示使用全部CPU核心，1 表示顺序执行）
+n_jobs = None
+
 
 # 温莎化处理函数
 def winsorize(series, lower_percentile=5, upper_percentile=95):
@@ -12,21 +42,70 @@ def winsorize(series, lower_percentile=5, upper_percentile=95):
     return np.clip(series, lower_limit, upper_limit)
 
 
-# 加载数据的函数，包括成分股信息和行情数据的合并
-def load_data(year):
-    stock_info_path = os.path.join(data_folder, f'hs300stocks_{year}.csv')
-    kdata_path = os.path.join(data_folder, f'hs300stocks_kdata_{year}.csv')
-
-    # 读取CSV文件
-    stock_info = pd.read_csv(stock_info_path)
-    kdata = pd.read_csv(kdata_path)
-
-    # 合并成分股信息和每日行情数据
-    data = pd.merge(kdata, stock_info[['code', 'weight']], on='code')
+# 分块读取某一年的行情并计算每日收益率：每块结束时保存各证券最后的收盘价，供下一块接续
+@instrument()
+def load_daily_returns_chunked(year, chunk_rows):
+    universe = Universe.load([year], data_folder)
+    last_close = pd.Series(dtype=np.float64)
+    frames = []
+    for chunk in iter_kdata_chunks(year, data_folder, columns=RETURN_COLUMNS, chunk_rows=chunk_rows):
+        # 只保留当时的成分股（与 load_data 一致）
+        codes = chunk['code'].astype(str)
+        member, weights = universe.lookup(chunk['time'], codes)
+        chunk, codes, weights = chunk[member], codes[member], weights[member]
+        close = chunk['close'].astype(np.float64)
+
+        prev_close = close.groupby(codes).shift(1)
+        first_rows = ~codes.duplicated()
+        prev_close[first_rows] = codes[first_rows].map(last_close)
+        last_close = close.groupby(codes).last().combine_first(last_close)
+
+        daily_return = (close - prev_close) / prev_close
+        valid = daily_return.notna()
+        frames.append(pd.DataFrame({
+            'time': chunk['time'][valid],
+            'code': chunk['code'][valid],
+            'daily_return': daily_return[valid],
+            'weight': weights[valid.to_numpy()].astype(np.float32),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+# 温莎化处理函数（矩阵版）：对每个交易日（行）在证券维度上按分位数截尾，缺失值保持为NaN
+def winsorize_matrix(matrix, lower_percentile=5, upper_percentile=95):
+    with warnings.catch_warnings():
+        # 整行缺失的交易日返回NaN即可
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lower_limit, upper_limit = np.nanpercentile(matrix, [lower_percentile, upper_percentile], axis=1)
+    return np.clip(matrix, lower_limit[:, None], upper_limit[:, None])
+
+
+# 将长表数据一次性展开为 日期×证券 的稠密矩阵
+def pivot_to_matrix(data, columns):
+    date_index, dates = pd.factorize(data['time'], sort=True)
+    code_index, codes = pd.factorize(data['code'], sort=True)
+    matrices = {}
+    for column in columns:
+        matrix = np.full((len(dates), len(codes)), np.nan)
+        matrix[date_index, code_index] = data[column].to_numpy(dtype=float)
+        matrices[column] = matrix
+    return dates, codes, matrices
+
+
+# 加载数据的函数：读取行情数据（经由共享的列式缓存），按成分股区间索引查出每一行当时的成分股权重，只保留成分股
+@instrument()
+def load_data(year, universe=None):
+    if universe is None:
+        universe = Universe.load([year], data_folder)
+    kdata = load_kdata(year, data_folder, columns=RETURN_COLUMNS)
+
+    member, kdata['weight'] = universe.lookup(kdata['time'], kdata['code'])
+    data = kdata[member].reset_index(drop=True)
     return data
 
 
 # 计算每日收益率的函数
+@instrument()
 def calculate_daily_returns(data):
     # 计算前一日收盘价
     data['prev_close'] = data.groupby('code')['close'].shift(1)
@@ -37,39 +116,95 @@ def calculate_daily_returns(data):
     return data
 
 
-# 计算每日温莎化处理后的平均收益率
-def calculate_daily_average_return(data):
+# 面板上的每日收益率矩阵与权重矩阵：weights 为按证券代码索引的成分股权重，给定时只保留成分股（与 load_data 一致）；
+# 面板带有 weight 字段时（Universe.apply）按每个交易日当时的成分股及权重计算，非成分股的收益率不计入
+def panel_to_matrix(panel, weights=None):
+    matrices = {}
+    if weights is not None:
+        weights = weights[~weights.index.duplicated(keep='last')]
+        panel = panel.select(weights.index.intersection(panel.codes))
+        matrices['weight'] = np.broadcast_to(weights.reindex(panel.codes).to_numpy(dtype=float), panel.shape)
+    daily_return = panel.returns()
+    if weights is None and 'weight' in panel.fields:
+        daily_return = np.where(panel.mask, daily_return, np.nan)
+        matrices['weight'] = panel['weight']
+    # 只保留有收益率的交易日（每个面板的第一个交易日没有收益率）
+    has_return = ~np.isnan(daily_return).all(axis=1)
+    matrices['daily_return'] = daily_return[has_return]
+    if 'weight' in matrices:
+        matrices['weight'] = matrices['weight'][has_return]
+    return panel.dates[has_return], panel.codes, matrices
+
+
+# 计算每日温莎化处理后的平均收益率（等权与成分股权重加权），可一次处理多个年份
+# data 为含 daily_return（及 weight）列的长表，或 Panel（收益率由面板计算，weights 为成分股权重）
+@instrument()
+def calculate_daily_average_return(data, lower_percentile=5, upper_percentile=95, weights=None):
+    if isinstance(data, Panel):
+        dates, _, matrices = panel_to_matrix(data, weights)
+    else:
+        columns = ['daily_return', 'weight'] if 'weight' in data.columns else ['daily_return']
+        dates, _, matrices = pivot_to_matrix(data, columns)
+
     # 温莎化处理每日收益率，消除极端值的影响
-    data['daily_return_winsorized'] = data.groupby('time')['daily_return'].transform(
-        lambda x: winsorize(x, lower_percentile=5, upper_percentile=95)
-    )
-    # 按日期计算温莎化后的每日平均收益率
-    daily_index_returns = data.groupby('time')['daily_return_winsorized'].mean().reset_index()
-    daily_index_returns.columns = ['Date', 'AverageDailyReturn']  # 重命名列
+    winsorized = winsorize_matrix(matrices['daily_return'], lower_percentile, upper_percentile)
+    valid = ~np.isnan(winsorized)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        # 按日期计算温莎化后的每日平均收益率
+        daily_index_returns = pd.DataFrame({
+            'Date': dates,
+            'AverageDailyReturn': np.nanmean(winsorized, axis=1),
+        })
+        if 'weight' in matrices:
+            # 按成分股权重加权（只计入当天有收益率的证券）
+            weights = np.where(valid, np.nan_to_num(matrices['weight']), 0.0)
+            weighted_sum = np.where(valid, winsorized, 0.0) * weights
+            daily_index_returns['WeightedAverageDailyReturn'] = weighted_sum.sum(axis=1) / weights.sum(axis=1)
     return daily_index_returns
 
 
+# 处理某一年的数据：加载并计算每日收益率（按年计算，每年第一个交易日没有收益率）
+def process_year(year):
+    print(f"正在处理{year}年的数据...")
+    if chunk_rows:
+        # 分块读取并计算每日收益率
+        return load_daily_returns_chunked(year, chunk_rows)
+    return calculate_daily_returns(load_data(year))
+
+
+# 处理某一年的数据（面板）：温莎化与平均都在每个交易日内进行，按年计算与所有年份一起计算的结果相同
+def process_year_panel(year):
+    print(f"正在处理{year}年的数据...")
+    panel = Panel.from_kdata(year, data_folder, fields=['close'])
+    return calculate_daily_average_return(Universe.load([year], data_folder).apply(panel))
+
+
 # 主函数，遍历所有年份并计算每日平均收益率
 def main():
-    all_daily_returns = pd.DataFrame()  # 创建一个空的数据框以存储所有年份的每日平均收益率
-
-    # 遍历2014至2024年
-    for year in range(2014, 2025):
-        print(f"正在处理{year}年的数据...")
-        # 加载数据
-        data = load_data(year)
-        # 计算每日收益率
-        data = calculate_daily_returns(data)
-        # 计算每日平均收益率
-        daily_returns_df = calculate_daily_average_return(data)
-        # 将每年的每日收益率数据合并
-        all_daily_returns = pd.concat([all_daily_returns, daily_returns_df], ignore_index=True)
-
-    # 将结果保存到Excel文件
-    output_file = '平均每日收益率_2014_2024.xlsx'
-    all_daily_returns.to_excel(output_file, index=False)
-
-    print(f"每日平均收益率数据已保存至 {output_file}")
+    if continuous:
+        # 2014至2024年的收盘价一次拼接为面板，按当时的成分股及权重计算每日平均收益率
+        panel = load_universe_panel(range(2014, 2025), data_folder, fields=['close'])
+        all_daily_returns = calculate_daily_average_return(panel)
+    elif use_panel and not chunk_rows:
+        # 2014至2024年各年份并行计算每日平均收益率，结果一次性拼接
+        all_daily_returns = concat_year_results(run_years(process_year_panel, range(2014, 2025), n_jobs=n_jobs))
+    else:
+        # 2014至2024年各年份并行处理，结果一次性拼接
+        results = run_years(process_year, range(2014, 2025), n_jobs=n_jobs)
+
+        # 所有年份一次性计算每日平均收益率
+        all_daily_returns = calculate_daily_average_return(concat_year_results(results))
+
+    # 将结果保存到按年份分区的数据集
+    write_results(all_daily_returns, 'average_daily_return')
+    print("每日平均收益率数据已保存至数据集 average_daily_return")
+
+    if excel_export:
+        output_file = '平均每日收益率_2014_2024.xlsx'
+        export_excel('average_daily_return', output_file)
+        print(f"每日平均收益率数据已导出至 {output_file}")
 
 
 # 执行主函数
@@ -0,0 +1,187 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from average_profit import calculate_daily_average_return
+from market_sentiment import calculate_sentiment_indicators
+from common.instrumentation import instrument
+from common.result_writer import export_excel, write_results
+
+# 增量更新的状态目录：state.json 保存运行状态，daily_aggregates.csv 逐日追加
+STATE_FILE = 'state.json'
+DAILY_FILE = 'daily_aggregates.csv'
+DAILY_COLUMNS = ['Date', 'Year', 'volume', 'amount', 'AverageDailyReturn', 'WeightedAverageDailyReturn',
+                 'VIX', 'MFI', 'ISI', 'VaR']
+
+
+def _empty_state():
+    return {
+        'last_date': None,  # 已处理的最后一个交易日
+        'prev_close': {},  # 当年每只成分股的最近收盘价（用于计算下一日收益率）
+        'ranges': {},  # 每年成交量、成交额的运行最小/最大值
+    }
+
+
+# 读取持久化的运行状态
+def load_state(state_folder):
+    path = os.path.join(state_folder, STATE_FILE)
+    if not os.path.exists(path):
+        return _empty_state()
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(state_folder, state):
+    path = os.path.join(state_folder, STATE_FILE)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _stock_info_for(stock_info, year):
+    if isinstance(stock_info, dict):
+        return stock_info[year]
+    return stock_info
+
+
+# 计算新增行情的每日收益率：同一年内接续上次保存的收盘价，跨年时重新开始（与按年计算的批处理一致）
+def _new_daily_returns(kdata, stock_info, state):
+    state_year = pd.Timestamp(state['last_date']).year if state['last_date'] else None
+    frames = []
+    for year, year_data in kdata.groupby(kdata['time'].dt.year, sort=True):
+        info = _stock_info_for(stock_info, year)
+        data = pd.merge(year_data, info[['code', 'weight']], on='code')
+        data['prev_close'] = data.groupby('code')['close'].shift(1)
+        if year == state_year:
+            first_rows = ~data['code'].duplicated()
+            carried = data.loc[first_rows, 'code'].map(state['prev_close']).astype(float)
+            data.loc[first_rows, 'prev_close'] = carried
+        data['daily_return'] = (data['close'] - data['prev_close']) / data['prev_close']
+        frames.append(data.dropna(subset=['daily_return']))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# 摄入新的行情数据（只处理晚于上次更新的交易日），代价与新增行数成正比
+@instrument()
+def update(state_folder, new_kdata, stock_info):
+    os.makedirs(state_folder, exist_ok=True)
+    state = load_state(state_folder)
+
+    kdata = new_kdata.copy()
+    kdata['time'] = pd.to_datetime(kdata['time'])
+    if state['last_date'] is not None:
+        kdata = kdata[kdata['time'] > pd.Timestamp(state['last_date'])]
+    if kdata.empty:
+        return state
+    kdata = kdata.sort_values('time', kind='mergesort').reset_index(drop=True)
+
+    # 流动性：每日成交量与成交额的合计
+    daily = kdata.groupby('time').agg({'volume': 'sum', 'amount': 'sum'})
+    daily['Year'] = daily.index.year
+
+    # 温莎化平均收益率
+    returns = _new_daily_returns(kdata, stock_info, state)
+    if not returns.empty:
+        average_returns = calculate_daily_average_return(returns).set_index('Date')
+        daily = daily.join(average_returns)
+
+    # 情绪指标（与 MATLAB 一致，每年第一个交易日不输出）
+    sentiment = calculate_sentiment_indicators(kdata, skip_first_day=False).set_index('Date')
+    known_years = {pd.Timestamp(state['last_date']).year} if state['last_date'] else set()
+    first_days = daily.groupby('Year').head(1)
+    first_days = first_days[~first_days['Year'].isin(known_years)].index
+    sentiment.loc[sentiment.index.isin(first_days)] = np.nan
+    daily = daily.join(sentiment)
+
+    daily = daily.reset_index().rename(columns={'time': 'Date'}).reindex(columns=DAILY_COLUMNS)
+    daily_path = os.path.join(state_folder, DAILY_FILE)
+    daily.to_csv(daily_path, mode='a', header=not os.path.exists(daily_path), index=False)
+
+    # 更新运行状态：每年的最小/最大值、最后一个交易日、当年最近收盘价
+    for year, year_daily in daily.groupby('Year'):
+        previous = state['ranges'].get(str(year), {})
+        state['ranges'][str(year)] = {
+            column: [min(previous.get(column, [np.inf, -np.inf])[0], float(year_daily[column].min())),
+                     max(previous.get(column, [np.inf, -np.inf])[1], float(year_daily[column].max()))]
+            for column in ('volume', 'amount')
+        }
+    last_date = kdata['time'].iloc[-1]
+    if state['last_date'] is None or pd.Timestamp(state['last_date']).year != last_date.year:
+        state['prev_close'] = {}
+    last_close = kdata[kdata['time'].dt.year == last_date.year].groupby('code')['close'].last()
+    last_close = last_close[last_close.index.isin(_stock_info_for(stock_info, last_date.year)['code'])]
+    state['prev_close'].update({code: float(close) for code, close in last_close.items()})
+    state['last_date'] = last_date.isoformat()
+    _save_state(state_folder, state)
+    return state
+
+
+# 读取每日汇总：daily_aggregates.csv 先于 state.json 写入，两次写入之间中断时文件中会留下晚于 last_date 的行，
+# 下一次 update 会重新追加这些交易日；因此只保留不晚于 last_date 的行，同一交易日保留最后写入的一行
+def _read_daily(state_folder):
+    daily = pd.read_csv(os.path.join(state_folder, DAILY_FILE), parse_dates=['Date'])
+    last_date = load_state(state_folder)['last_date']
+    if last_date is None:
+        return daily.iloc[:0]
+    daily = daily[daily['Date'] <= pd.Timestamp(last_date)]
+    return daily.drop_duplicates('Date', keep='last').sort_values('Date', kind='mergesort').reset_index(drop=True)
+
+
+# 读取每日市场流动性：按年的 Min-Max 标准化在读取时才进行
+def read_daily_liquidity(state_folder):
+    daily = _read_daily(state_folder)
+    state = load_state(state_folder)
+    scaled = []
+    for column in ('volume', 'amount'):
+        ranges = daily['Year'].astype(str).map(lambda year: state['ranges'][year][column])
+        low = ranges.str[0]
+        span = ranges.str[1] - low
+        scaled.append(((daily[column] - low) / span.where(span > 0)).fillna(0.0))
+    # 换手率近似值是成交量除以全年总量，Min-Max 标准化后与成交量相同
+    market_liquidity = (scaled[0] + scaled[1] + scaled[0]) / 3
+    return pd.DataFrame({'Date': daily['Date'], 'MarketLiquidity': market_liquidity})
+
+
+# 读取每日温莎化平均收益率
+def read_daily_average_return(state_folder):
+    daily = _read_daily(state_folder)
+    return daily.dropna(subset=['AverageDailyReturn'])[['Date', 'AverageDailyReturn', 'WeightedAverageDailyReturn']]
+
+
+# 读取每日情绪指标
+def read_sentiment_indicators(state_folder):
+    daily = _read_daily(state_folder)
+    return daily.dropna(subset=['VIX'])[['Date', 'VIX', 'MFI', 'ISI', 'VaR']].reset_index(drop=True)
+
+
+# 从状态目录导出与批处理脚本相同的结果数据集（只重写涉及的年份分区），excel=True 时再导出 Excel
+@instrument()
+def export_results(state_folder, years=None, excel=False):
+    results = {
+        'daily_liquidity': (read_daily_liquidity(state_folder), '市场流动性每日指标.xlsx'),
+        'average_daily_return': (read_daily_average_return(state_folder), '平均每日收益率_2014_2024.xlsx'),
+        'market_sentiment': (read_sentiment_indicators(state_folder), 'Combined_Market_Sentiment_Indicators.xlsx'),
+    }
+    for name, (df, output_file) in results.items():
+        if years is not None:
+            df = df[df['Date'].dt.year.isin(years)]
+        write_results(df, name)
+        if excel:
+            export_excel(name, output_file)
+
+
+# 主程序：摄入当年行情文件中尚未处理的交易日，并导出结果
+if __name__ == "__main__":
+    from common.kdata_cache import load_kdata, load_stock_info
+
+    data_folder = './沪深300成分股的数据/'
+    state_folder = './incremental_state/'
+    year = int(sys.argv[1]) if len(sys.argv) > 1 else pd.Timestamp.today().year
+
+    state = update(state_folder, load_kdata(year, data_folder), load_stock_info(year, data_folder))
+    export_results(state_folder, years=[year])
+    print(f"已更新至 {state['last_date']}，结果已导出。")
@@ -1,21 +1,30 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import instrument
+from common.intraday import intraday_indicators, load_intraday_daily
+from common.kdata_cache import iter_kdata_chunks
+from common.panel import Panel
+from common.result_writer import export_excel, write_results
+from common.year_executor import concat_year_results, run_years
 
 data_folder = './沪深300成分股的数据/'
 
+# 设置为行数时按块流式读取行情数据，逐块汇总每日成交量与成交额，内存占用与块大小有关
+chunk_rows = None
 
-def load_data(year):
-    stock_info_path = os.path.join(data_folder, f'hs300stocks_{year}.csv')
-    kdata_path = os.path.join(data_folder, f'hs300stocks_kdata_{year}.csv')
+# 设置为 True 时额外导出 Excel 文件（结果数据集默认以 Parquet 格式按年份分区保存）
+excel_export = False
 
-    # 读取CSV文件
-    stock_info = pd.read_csv(stock_info_path)
-    kdata = pd.read_csv(kdata_path)
+# 设置为 True 时使用分钟线（data_folder 下的 hs300stocks_minute_{year}*.csv）流式汇总得到的每日成交量与成交额，
+# 并增加基于分钟线的 Amihud 非流动性指标
+intraday = False
 
-    # 合并成分股信息和每日行情数据
-    data = pd.merge(kdata, stock_info[['code', 'weight']], on='code', how='left')
-    return data
+# 按年份并行处理时的进程数（None 表示使用全部CPU核心，1 表示顺序执行）
+n_jobs = None
 
 
 def min_max_scaling(series):
@@ -24,7 +33,12 @@ def min_max_scaling(series):
     return (series - series.min()) / (series.max() - series.min())
 
 
+# stocks_data 为含 time、volume、amount 列的长表，或 Panel
+@instrument()
 def calculate_daily_liquidity_index(stocks_data):
+    if isinstance(stocks_data, Panel):
+        return calculate_liquidity_from_daily_totals(stocks_data.daily_totals())
+
     # 确保时间列存在并转换为日期格式
     if 'time' not in stocks_data.columns:
         raise KeyError("数据中缺少 'time' 列，请检查数据格式。")
@@ -40,7 +54,22 @@ def calculate_daily_liquidity_index(stocks_data):
         'volume': 'sum',
         'amount': 'sum'
     }).reset_index()
+    return calculate_liquidity_from_daily_totals(grouped_data)
+
+
+# 分块读取某一年的行情，逐块汇总每日成交量和成交额后计算流动性指标
+@instrument()
+def calculate_daily_liquidity_index_chunked(year, chunk_rows=1_000_000):
+    grouped_data = None
+    for chunk in iter_kdata_chunks(year, data_folder, columns=['time', 'volume', 'amount'], chunk_rows=chunk_rows):
+        partial = chunk.groupby('time')[['volume', 'amount']].sum()
+        grouped_data = partial if grouped_data is None else grouped_data.add(partial, fill_value=0)
+    grouped_data.index = pd.to_datetime(grouped_data.index).astype('datetime64[ns]')
+    return calculate_liquidity_from_daily_totals(grouped_data.rename_axis('time').reset_index())
 
+
+# 由每日成交量和成交额的合计计算流动性指标
+def calculate_liquidity_from_daily_totals(grouped_data):
     # 换手率的近似计算
     total_volume = grouped_data['volume'].sum()
     grouped_data['TurnoverRate'] = grouped_data['volume'] / total_volume if total_volume > 0 else 0
@@ -61,16 +90,39 @@ def calculate_daily_liquidity_index(stocks_data):
     return liquidity_df
 
 
-# 主程序
-if __name__ == "__main__":
-    all_liquidity_df = pd.DataFrame()  # 创建一个空的数据框以存储所有年份的每日流动性指标
-    for year in range(2014, 2025):
-        stocks_data = load_data(year)
-        daily_liquidity_df = calculate_daily_liquidity_index(stocks_data)
-        all_liquidity_df = pd.concat([all_liquidity_df, daily_liquidity_df], ignore_index=True)
+# 读取某一年的成交量与成交额面板
+def load_panel(year):
+    return Panel.from_kdata(year, data_folder, fields=['volume', 'amount'])
 
-    # 将结果保存到Excel文件
-    output_file = '市场流动性每日指标.xlsx'
-    all_liquidity_df.to_excel(output_file, index=False)
 
-    print(f"所有年份的每日市场流动性指标已保存到 {output_file}。")
+# 处理某一年的分钟线：每日汇总后使用同样的流动性公式，再附加 Amihud 指标
+def process_year_intraday(year):
+    daily = load_intraday_daily(year, data_folder)
+    liquidity_df = calculate_daily_liquidity_index(daily[['time', 'volume', 'amount']].copy())
+    amihud = intraday_indicators(daily)[['Date', 'Amihud', 'DailyAmihud']]
+    return liquidity_df.merge(amihud, on='Date', how='left')
+
+
+# 处理某一年的数据
+def process_year(year):
+    if intraday:
+        return process_year_intraday(year)
+    if chunk_rows:
+        return calculate_daily_liquidity_index_chunked(year, chunk_rows)
+    return calculate_daily_liquidity_index(load_panel(year))
+
+
+# 主程序
+if __name__ == "__main__":
+    # 各年份并行计算每日流动性指标，结果一次性拼接
+    results = run_years(process_year, range(2014, 2025), n_jobs=n_jobs)
+    all_liquidity_df = concat_year_results(results)
+
+    # 将结果保存到按年份分区的数据集
+    write_results(all_liquidity_df, 'daily_liquidity')
+    print("所有年份的每日市场流动性指标已保存到数据集 daily_liquidity。")
+
+    if excel_export:
+        output_file = '市场流动性每日指标.xlsx'
+        export_excel('daily_liquidity', output_file)
+        print(f"所有年份的每日市场流动性指标已导出到 {output_file}。")
@@ -2,21 +2,17 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import sys
 
-data_folder = './沪深300成分股的数据/'
-
-
-def load_data(year):
-    stock_info_path = os.path.join(data_folder, f'hs300stocks_{year}.csv')
-    kdata_path = os.path.join(data_folder, f'hs300stocks_kdata_{year}.csv')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import instrument
+from common.panel import Panel
+from common.year_executor import concat_year_results, run_years
 
-    # 读取CSV文件
-    stock_info = pd.read_csv(stock_info_path)
-    kdata = pd.read_csv(kdata_path)
+data_folder = './沪深300成分股的数据/'
 
-    # 合并成分股信息和每日行情数据
-    data = pd.merge(kdata, stock_info[['code', 'weight']], on='code', how='left')
-    return data
+# 按年份并行处理时的进程数（None 表示使用全部CPU核心，1 表示顺序执行）
+n_jobs = None
 
 
 def min_max_scaling(series):
@@ -25,22 +21,27 @@ def min_max_scaling(series):
     return (series - series.min()) / (series.max() - series.min())
 
 
+# stocks_data 为含 time、volume、amount 列的长表，或 Panel
+@instrument()
 def calculate_liquidity_index(stocks_data):
-    # 确保时间列存在并转换为日期格式
-    if 'time' not in stocks_data.columns:
-        raise KeyError("数据中缺少 'time' 列，请检查数据格式。")
+    if isinstance(stocks_data, Panel):
+        grouped_data = stocks_data.daily_totals()
+    else:
+        # 确保时间列存在并转换为日期格式
+        if 'time' not in stocks_data.columns:
+            raise KeyError("数据中缺少 'time' 列，请检查数据格式。")
 
-    stocks_data['time'] = pd.to_datetime(stocks_data['time'], errors='coerce')
+        stocks_data['time'] = pd.to_datetime(stocks_data['time'], errors='coerce')
 
-    # 检查日期转换是否成功
-    if stocks_data['time'].isnull().any():
-        raise ValueError("日期格式不正确，无法转换为日期。请检查数据中的 'time' 列。")
+        # 检查日期转换是否成功
+        if stocks_data['time'].isnull().any():
+            raise ValueError("日期格式不正确，无法转换为日期。请检查数据中的 'time' 列。")
 
-    # 计算流动性指标
-    grouped_data = stocks_data.groupby('time').agg({
-        'volume': 'sum',
-        'amount': 'sum'
-    }).reset_index()
+        # 计算流动性指标
+        grouped_data = stocks_data.groupby('time').agg({
+            'volume': 'sum',
+            'amount': 'sum'
+        }).reset_index()
 
     # 换手率的近似计算
     total_volume = grouped_data['volume'].sum()
@@ -97,14 +98,25 @@ def visualize_liquidity_index(all_liquidity_df):
     plt.show()
 
 
+# 读取某一年的成交量与成交额面板
+def load_panel(year):
+    return Panel.from_kdata(year, data_folder, fields=['volume', 'amount'])
+
+
+# 处理某一年的数据
+def process_year(year):
+    return calculate_liquidity_index(load_panel(year))
+
+
 # 主程序
 if __name__ == "__main__":
-    all_liquidity_df = pd.DataFrame()  # 创建一个空的数据框以存储所有年份的流动性指标
-    for year in range(2014, 2025):
-        stocks_data = load_data(year)
-        liquidity_df = calculate_liquidity_index(stocks_data)
-        all_liquidity_df = pd.concat([all_liquidity_df, liquidity_df], ignore_index=True)
+    # 各年份并行计算流动性指标，结果一次性拼接
+    results = run_years(process_year, range(2014, 2025), n_jobs=n_jobs)
+    all_liquidity_df = concat_year_results(results)
 
+    for year, liquidity_df, error in results:
+        if error is not None:
+            continue
         # 打印每年的流动性指标
         print(f"{year} 年的平均成交量: {liquidity_df['AverageVolume'].mean():.2f}, "
               f"平均成交额: {liquidity_df['AverageAmount'].mean():.2f}, "
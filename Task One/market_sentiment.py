@@ -0,0 +1,141 @@
+import pandas as pd
+import numpy as np
+import os
+import sys
+from statistics import NormalDist
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import instrument
+from common.intraday import intraday_indicators, load_intraday_daily
+from common.kdata_cache import load_kdata
+from common.panel import Panel
+from common.result_writer import export_excel, write_results
+
+data_folder = './沪深300成分股的数据/'
+
+SENTIMENT_COLUMNS = ['time', 'code', 'open', 'high', 'low', 'close', 'volume']
+
+# 设置为 True 时额外导出 Excel 文件（结果数据集默认以 Parquet 格式按年份分区保存）
+excel_export = False
+
+# 设置为 True 时使用分钟线（data_folder 下的 hs300stocks_minute_{year}*.csv）流式汇总得到的每日数据，
+# 并增加基于分钟线的指标 RealizedVIX 与 Amihud
+intraday = False
+
+
+# 按分段（交易日）求和
+def _segment_sum(segment_ids, values, num_segments):
+    return np.bincount(segment_ids, weights=values, minlength=num_segments)
+
+
+# 计算每日市场情绪指标（VIX、MFI、ISI、VaR），可一次处理多个年份
+# parity=True 时与 MATLAB 脚本 T1Sentiment*.m 的公式完全一致：
+#   收益率为当日数据相邻两行收盘价的对数差，且每年第一个交易日不输出（skip_first_day=False 时保留）；
+# parity=False 时收益率为每只证券相对前一交易日收盘价的对数收益率。
+# kdata 可以是分钟线的每日汇总（common/intraday.py，资金流使用分钟典型价格计算），也可以是 Panel：
+# 面板不保留原文件中同一天内的行顺序，无法按相邻两行配对，因此只支持 parity=False
+@instrument()
+def calculate_sentiment_indicators(kdata, parity=True, alpha=0.95, skip_first_day=True):
+    if isinstance(kdata, Panel):
+        if parity:
+            raise ValueError("Panel 不保留同一天内的行顺序，无法与 MATLAB 的相邻行收益率一致，请使用 parity=False")
+        # 按 (日期, 证券代码) 顺序取出面板中存在的行
+        rows, columns = np.nonzero(kdata.mask)
+        days, day_ids = np.unique(rows, return_inverse=True)
+        dates = kdata.dates[days].to_numpy()
+        fields = {field: kdata[field][rows, columns] for field in ('open', 'high', 'low', 'close', 'volume')}
+        if 'money_flow' in kdata.fields:
+            fields['money_flow'] = kdata['money_flow'][rows, columns]
+        prev_close = None if parity else kdata.previous('close')[rows, columns]
+    else:
+        # 按时间稳定排序一次，保留同一天内的原始行顺序
+        data = kdata.sort_values('time', kind='mergesort').reset_index(drop=True)
+        time = pd.to_datetime(data['time']).to_numpy()
+        dates, rows_per_day = np.unique(time, return_counts=True)
+        day_ids = np.repeat(np.arange(len(dates)), rows_per_day)
+        fields = {field: data[field].to_numpy(dtype=float) for field in ('open', 'high', 'low', 'close', 'volume')}
+        if 'money_flow' in data.columns:
+            fields['money_flow'] = data['money_flow'].to_numpy(dtype=float)
+        prev_close = None if parity else data.groupby('code', sort=False)['close'].shift(1).to_numpy(dtype=float)
+    return _sentiment_from_rows(dates, day_ids, fields, prev_close, parity, alpha, skip_first_day)
+
+
+# 由按日期排列的各行（day_ids 为每行所属交易日的编号）计算情绪指标
+def _sentiment_from_rows(dates, day_ids, fields, prev_close, parity, alpha, skip_first_day):
+    num_days = len(dates)
+    close = fields['close']
+    volume = fields['volume']
+    # 由分钟线汇总的数据带有 money_flow 列（分钟典型价格×成交量之和），否则用日线的典型价格
+    if 'money_flow' in fields:
+        money_flow = fields['money_flow']
+    else:
+        money_flow = (fields['high'] + fields['low'] + close) / 3 * volume
+
+    if parity:
+        # 相邻两行都在同一天时才构成一个收益率，收益率 i 对应第 i 行的资金流
+        returns = np.diff(np.log(close))
+        valid = day_ids[1:] == day_ids[:-1]
+        return_days = day_ids[:-1]
+        return_money_flow = money_flow[:-1]
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.log(close / prev_close)
+        valid = ~np.isnan(returns)
+        return_days = day_ids
+        return_money_flow = money_flow
+
+    returns = returns[valid]
+    return_days = return_days[valid]
+    return_money_flow = return_money_flow[valid]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 1. 波动性指数（VIX）：收益率的样本标准差（单个样本时方差为0，与 MATLAB 的 var 一致）
+        counts = np.bincount(return_days, minlength=num_days)
+        mean = _segment_sum(return_days, returns, num_days) / counts
+        deviation = returns - mean[return_days]
+        variance = _segment_sum(return_days, deviation * deviation, num_days) / np.maximum(counts - 1, 1)
+        variance[counts == 0] = np.nan
+        vix = np.sqrt(variance)
+
+        # 2. 资金流向指数（MFI）
+        pos_flow = _segment_sum(return_days[returns > 0], return_money_flow[returns > 0], num_days)
+        neg_flow = _segment_sum(return_days[returns < 0], return_money_flow[returns < 0], num_days)
+        mfi = 100 - (100 / (1 + pos_flow / neg_flow))
+
+        # 3. 投资者情绪指数（ISI）
+        isi = (_segment_sum(day_ids, (close - fields['open']) * volume, num_days)
+               / _segment_sum(day_ids, volume, num_days))
+
+        # 4. VaR
+        var_values = mean + vix * NormalDist().inv_cdf(alpha)
+
+    indicators = pd.DataFrame({'Date': dates, 'VIX': vix, 'MFI': mfi, 'ISI': isi, 'VaR': var_values})
+    if parity and skip_first_day:
+        # MATLAB 按年份逐个文件计算，每年第一个交易日不输出
+        years = indicators['Date'].dt.year
+        indicators = indicators[years.duplicated()]
+    elif not parity:
+        indicators = indicators[counts > 0]
+    return indicators.reset_index(drop=True)
+
+
+# 主程序
+if __name__ == "__main__":
+    if intraday:
+        yearly_kdata = [load_intraday_daily(year, data_folder) for year in range(2014, 2025)]
+    else:
+        yearly_kdata = [load_kdata(year, data_folder, columns=SENTIMENT_COLUMNS) for year in range(2014, 2025)]
+    all_kdata = pd.concat(yearly_kdata, ignore_index=True)
+    sentiment_df = calculate_sentiment_indicators(all_kdata)
+    if intraday:
+        sentiment_df = sentiment_df.merge(intraday_indicators(all_kdata)[['Date', 'RealizedVIX', 'Amihud']],
+                                          on='Date', how='left')
+
+    # 将结果保存到按年份分区的数据集
+    write_results(sentiment_df, 'market_sentiment')
+    print("市场情绪指标已保存到数据集 market_sentiment")
+
+    if excel_export:
+        output_file = 'Combined_Market_Sentiment_Indicators.xlsx'
+        export_excel('market_sentiment', output_file)
+        print(f"市场情绪指标已导出到文件: {output_file}")
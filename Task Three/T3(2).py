@@ -1,138 +1,212 @@
 import pandas as pd
-import numpy as np
-from scipy.optimize import minimize
 import matplotlib.pyplot as plt
-import xlsxwriter
-
-# 读取股票价格数据
-try:
-    price_data = pd.read_csv(
-        r'E:\大学\数学建模\2024粤港澳大湾区数学建模\沪深300成分股的数据\沪深300成分股的数据\hs300stocks_kdata_2018.csv')
-except FileNotFoundError:
-    print("文件 hs300stocks_kdata_2018.csv 未找到，请检查路径是否正确。")
-    exit()
-
-# 将日期列 "time" 转换为日期格式并保留日期部分
-price_data['time'] = pd.to_datetime(price_data['time']).dt.date
-price_data = price_data.set_index(['time', 'code'])
-
-# 按股票代码计算每日收盘价的收益率矩阵
-returns = price_data['close'].unstack(level=1).pct_change(fill_method=None).dropna()
-
-# 读取权重数据
-try:
-    weights_data = pd.read_csv(
-        r'E:\大学\数学建模\2024粤港澳大湾区数学建模\沪深300成分股的数据\沪深300成分股的数据\hs300stocks_2018.csv')
-except FileNotFoundError:
-    print("文件 hs300stocks_2018.csv 未找到，请检查路径是否正确。")
-    exit()
-
-# 确保权重数据的列名为 'code' 和 'weight'
-if 'code' not in weights_data.columns or 'weight' not in weights_data.columns:
-    print("请检查权重数据的列名，确保其分别为 'code' 和 'weight'")
-    exit()
-
-# 设置股票代码为索引，并按 returns 中的股票代码对齐权重数据
-weights_data = weights_data.set_index('code')
-weights_data = weights_data.loc[returns.columns]  # 按 returns 中的股票代码对齐
-stock_weights = weights_data['weight']
-stock_weights /= stock_weights.sum()  # 归一化权重
-
-# 确保对齐后的 returns 和 stock_weights 长度一致
-if len(stock_weights) != returns.shape[1]:
-    print("权重数据的长度与收益率数据的列数不匹配，请检查数据的一致性。")
-    exit()
-
-# 定义无风险利率
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.bootstrap import bootstrap_portfolio, summarize_distribution
+from common.kdata_cache import load_cached_csv
+from common.panel import Panel
+from common.universe import Universe
+from common.result_writer import export_excel, write_results
+from portfolio_optimizer import (as_returns, compute_moments, efficient_frontier, optimize_drawdown_lp,
+                                 optimize_sharpe, portfolio_summary)
+
+# 定义无风险利率：优化与有效前沿按原脚本直接使用该值（与日收益率相减）；
+# 自助法模拟把它作为年化利率，用于年化夏普比率，因此两处的夏普比率不可直接比较
 risk_free_rate = 0.03
 
-# 定义夏普比率的负值（添加最大回撤惩罚项）
-def sharpe_ratio_with_drawdown_penalty(weights, returns, risk_free_rate, max_drawdown=0.7, penalty_factor=100):
-    mean_returns = returns.mean()
-    cov_matrix = returns.cov()
-    portfolio_return = np.dot(weights, mean_returns)
-    portfolio_volatility = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
-    sharpe_ratio = (portfolio_return - risk_free_rate) / portfolio_volatility
-
-    # 计算组合的最大回撤
-    portfolio_returns = returns.dot(weights)
-    cumulative_returns = (portfolio_returns + 1).cumprod() - 1
-    peak = cumulative_returns.cummax()
-    drawdown = (peak - cumulative_returns) / peak
-    max_drawdown_observed = drawdown.max()
-
-    # 若最大回撤超出0.7，增加惩罚项
-    penalty = penalty_factor * max(0, max_drawdown_observed - max_drawdown)
-    return -sharpe_ratio + penalty
-
-# 约束条件：权重之和为1
-constraints = [{'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1}]
+# 设置为 True 时额外导出 Excel 文件（结果数据集默认以 Parquet 格式保存）
+excel_export = False
 
 # 将单只股票的权重上限降到5%以增加分散化
 weight_limit = 0.05
-bounds = tuple((0, weight_limit) for _ in range(len(stock_weights)))
-
-# 初始权重
-initial_weights = stock_weights.values
-
-# 优化
-optimized = minimize(sharpe_ratio_with_drawdown_penalty, initial_weights, args=(returns, risk_free_rate),
-                     method='SLSQP', bounds=bounds, constraints=constraints)
-
-# 输出优化结果
-if optimized.success:
-    optimized_weights = optimized.x
-    expected_return = np.dot(optimized_weights, returns.mean())
-    volatility = np.sqrt(np.dot(optimized_weights.T, np.dot(returns.cov(), optimized_weights)))
-
-    # 计算最终组合的最大回撤
-    portfolio_returns = returns.dot(optimized_weights)
-    cumulative_returns = (portfolio_returns + 1).cumprod() - 1
-    peak = cumulative_returns.cummax()
-    drawdown = (peak - cumulative_returns) / peak
-    max_drawdown_observed = drawdown.max()
-
-    print("Optimized Portfolio Weights:", optimized_weights)
-    print("Expected Portfolio Return:", expected_return)
-    print("Portfolio Volatility:", volatility)
-    print("Max Drawdown:", max_drawdown_observed)
-
-    # 可视化累计收益和回撤
-    plt.figure(figsize=(14, 7))
-
-    # 绘制累计收益曲线
-    plt.subplot(2, 1, 1)
-    cumulative_returns.plot()
-    plt.title("Cumulative Returns of Optimized Portfolio")
-    plt.xlabel("Date")
-    plt.ylabel("Cumulative Return")
-
-    # 绘制最大回撤曲线
-    plt.subplot(2, 1, 2)
-    drawdown.plot()
-    plt.title("Drawdown of Optimized Portfolio")
-    plt.xlabel("Date")
-    plt.ylabel("Drawdown")
-
-    plt.tight_layout()
-    plt.show()
-
-    # 导出结果到Excel文件
-    with pd.ExcelWriter('optimized_portfolio_results.xlsx', engine='xlsxwriter') as writer:
-        # 优化权重输出到Excel
+
+# 优化模式：'sharpe' 为带回撤惩罚的夏普比率（SLSQP），'lp' 为回撤约束下的线性规划（HiGHS），
+# 'frontier' 为一次求解 frontier_points 个目标收益率的有效前沿
+optimization_mode = 'sharpe'
+frontier_points = 50
+
+# 协方差模型：None 为稠密的样本协方差矩阵；'ledoit_wolf' 为 Ledoit-Wolf 收缩，'pca' 为 num_factors 个主成分加对角项
+# （后两者只通过矩阵-向量乘积使用，证券数较多时使用）
+covariance_model = None
+num_factors = 10
+
+# 对优化后的组合做平稳块自助法模拟的路径数（0 为不模拟），以及平均块长度（交易日）
+bootstrap_paths = 10000
+bootstrap_block_length = 20
+
+# 自助法模拟的进程数（None 表示使用全部CPU核心，1 表示顺序执行）
+n_jobs = None
+
+
+def main():
+    # 读取股票价格数据
+    try:
+        price_data = load_cached_csv(
+            r'E:\大学\数学建模\2024粤港澳大湾区数学建模\沪深300成分股的数据\沪深300成分股的数据\hs300stocks_kdata_2018.csv',
+            columns=['time', 'code', 'close'])
+    except FileNotFoundError:
+        print("文件 hs300stocks_kdata_2018.csv 未找到，请检查路径是否正确。")
+        return
+
+    # 收盘价一次展开为 日期×证券 面板，收益率在面板上计算
+    price_panel = Panel.from_frame(price_data, fields=['close'])
+
+    # 按股票代码计算每日收盘价的收益率矩阵（只保留所有股票都有收益率的交易日），日期只保留日期部分
+    returns = as_returns(price_panel)
+    returns.index = pd.Index(returns.index.date, name='time')
+
+    # 读取权重数据
+    try:
+        weights_data = load_cached_csv(
+            r'E:\大学\数学建模\2024粤港澳大湾区数学建模\沪深300成分股的数据\沪深300成分股的数据\hs300stocks_2018.csv')
+    except FileNotFoundError:
+        print("文件 hs300stocks_2018.csv 未找到，请检查路径是否正确。")
+        return
+
+    # 确保权重数据的列名为 'code' 和 'weight'
+    if 'code' not in weights_data.columns or 'weight' not in weights_data.columns:
+        print("请检查权重数据的列名，确保其分别为 'code' 和 'weight'")
+        return
+
+    # 按 returns 中的股票代码对齐权重数据：由成分股区间索引查出第一个交易日当时的成分股权重，
+    # 有行情但不在成分股名单中的股票初始权重为0
+    universe = Universe.from_frames({2018: weights_data})
+    stock_weights = universe.members(returns.index[0]).reindex(returns.columns)
+    if stock_weights.isna().any():
+        print(f"{int(stock_weights.isna().sum())} 只股票不在成分股名单中或没有权重，初始权重设为0")
+    stock_weights = stock_weights.fillna(0.0)
+    stock_weights /= stock_weights.sum()  # 归一化权重
+
+    # 确保对齐后的 returns 和 stock_weights 长度一致
+    if len(stock_weights) != returns.shape[1]:
+        print("权重数据的长度与收益率数据的列数不匹配，请检查数据的一致性。")
+        return
+
+    # 初始权重
+    initial_weights = stock_weights.values
+
+    moments = compute_moments(returns, covariance_model, num_factors)
+    if optimization_mode == 'frontier':
+        frontier, frontier_weights = efficient_frontier(returns, num_points=frontier_points,
+                                                        risk_free_rate=risk_free_rate, max_drawdown=0.7,
+                                                        penalty_factor=100, weight_limit=weight_limit,
+                                                        moments=moments)
+        print(f"有效前沿共 {len(frontier)} 个点，用时: {frontier.attrs['wall_time']:.3f} 秒")
+        print(frontier[['ExpectedReturn', 'Volatility', 'MaxDrawdown', 'SharpeRatio']])
+
+        # 可视化有效前沿
+        plt.figure(figsize=(10, 6))
+        plt.plot(frontier['Volatility'], frontier['ExpectedReturn'], marker='o')
+        plt.title("Efficient Frontier")
+        plt.xlabel("Volatility")
+        plt.ylabel("Expected Return")
+        plt.tight_layout()
+        plt.show()
+
+        # 前沿表与各点权重（长表：点、股票、权重）
+        write_results(frontier, 'optimized_portfolio/frontier', year=2018)
+        frontier_weights_long = frontier_weights.stack().rename('Weight').reset_index()
+        frontier_weights_long.columns = ['Point', 'Stock', 'Weight']
+        write_results(frontier_weights_long, 'optimized_portfolio/frontier_weights', year=2018)
+        if excel_export:
+            export_excel({
+                'Frontier': 'optimized_portfolio/frontier',
+                'Frontier Weights': 'optimized_portfolio/frontier_weights',
+            }, 'efficient_frontier_results.xlsx')
+        return
+
+    if optimization_mode == 'lp':
+        # 最大回撤（未复利累计收益）不超过0.7，最大化预期收益
+        optimized = optimize_drawdown_lp(returns, max_drawdown=0.7, weight_limit=weight_limit, moments=moments)
+        print(f"线性规划解{'已' if optimized.feasible else '未'}通过约束校验")
+    else:
+        # 均值与协方差只计算一次，目标函数提供解析梯度；最大回撤上限0.7，超出部分加惩罚项
+        optimized = optimize_sharpe(returns, initial_weights, risk_free_rate, max_drawdown=0.7,
+                                    penalty_factor=100, weight_limit=weight_limit, moments=moments)
+    print(f"优化迭代次数: {optimized.nit}, 用时: {optimized.wall_time:.3f} 秒")
+
+    # 输出优化结果
+    if optimized.success:
+        optimized_weights = optimized.x
+        summary = portfolio_summary(returns, optimized_weights, moments=moments)
+        expected_return = summary['expected_return']
+        volatility = summary['volatility']
+
+        # 计算最终组合的最大回撤
+        cumulative_returns = pd.Series(summary['cumulative_returns'], index=returns.index)
+        drawdown = pd.Series(summary['drawdown'], index=returns.index)
+        max_drawdown_observed = summary['max_drawdown']
+
+        print("Optimized Portfolio Weights:", optimized_weights)
+        print("Expected Portfolio Return:", expected_return)
+        print("Portfolio Volatility:", volatility)
+        print("Max Drawdown:", max_drawdown_observed)
+
+        # 可视化累计收益和回撤
+        plt.figure(figsize=(14, 7))
+
+        # 绘制累计收益曲线
+        plt.subplot(2, 1, 1)
+        cumulative_returns.plot()
+        plt.title("Cumulative Returns of Optimized Portfolio")
+        plt.xlabel("Date")
+        plt.ylabel("Cumulative Return")
+
+        # 绘制最大回撤曲线
+        plt.subplot(2, 1, 2)
+        drawdown.plot()
+        plt.title("Drawdown of Optimized Portfolio")
+        plt.xlabel("Date")
+        plt.ylabel("Drawdown")
+
+        plt.tight_layout()
+        plt.show()
+
+        # 导出结果到按年份（2018）分区的数据集
+        # 优化权重
         optimized_weights_df = pd.DataFrame({'Stock': returns.columns, 'Weight': optimized_weights})
-        optimized_weights_df.to_excel(writer, sheet_name='Optimized Weights', index=False)
+        write_results(optimized_weights_df, 'optimized_portfolio/weights', year=2018)
 
-        # 输出其他指标
+        # 其他指标
         summary_df = pd.DataFrame({
             'Expected Return': [expected_return],
             'Volatility': [volatility],
             'Max Drawdown': [max_drawdown_observed]
         })
-        summary_df.to_excel(writer, sheet_name='Summary', index=False)
-
-        # 输出累计收益和回撤数据
-        cumulative_returns.to_frame(name='Cumulative Returns').to_excel(writer, sheet_name='Cumulative Returns')
-        drawdown.to_frame(name='Drawdown').to_excel(writer, sheet_name='Drawdown')
-else:
-    print("Optimization failed:", optimized.message)
\ No newline at end of file
+        write_results(summary_df, 'optimized_portfolio/summary', year=2018)
+
+        # 累计收益和回撤数据
+        write_results(cumulative_returns.to_frame(name='Cumulative Returns').reset_index(),
+                      'optimized_portfolio/cumulative_returns', year=2018)
+        write_results(drawdown.to_frame(name='Drawdown').reset_index(), 'optimized_portfolio/drawdown', year=2018)
+
+        # 年化收益率、夏普比率和最大回撤的自助法分布
+        if bootstrap_paths:
+            bootstrap_results = bootstrap_portfolio(returns, optimized_weights, num_paths=bootstrap_paths,
+                                                    mean_block_length=bootstrap_block_length,
+                                                    risk_free_rate=risk_free_rate, n_jobs=n_jobs)
+            bootstrap_summary = summarize_distribution(bootstrap_results)
+            print("自助法模拟的指标分布:")
+            print(bootstrap_summary)
+            write_results(bootstrap_summary, 'optimized_portfolio/bootstrap_summary', year=2018)
+
+        # 按需导出Excel文件（四个工作表，模拟时另加自助法汇总）
+        if excel_export:
+            sheets = {
+                'Optimized Weights': 'optimized_portfolio/weights',
+                'Summary': 'optimized_portfolio/summary',
+                'Cumulative Returns': 'optimized_portfolio/cumulative_returns',
+                'Drawdown': 'optimized_portfolio/drawdown',
+            }
+            if bootstrap_paths:
+                sheets['Bootstrap Summary'] = 'optimized_portfolio/bootstrap_summary'
+            export_excel(sheets, 'optimized_portfolio_results.xlsx',
+                         index_columns={'Cumulative Returns': 'time', 'Drawdown': 'time'})
+    else:
+        print("Optimization failed:", optimized.message)
+
+
+if __name__ == "__main__":
+    main()
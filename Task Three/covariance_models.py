@@ -0,0 +1,123 @@
+import numpy as np
+
+
+# 协方差模型：Σ = GᵀG + diag(d)，G 为 k×N 的因子矩阵，d 为长度 N 的对角项
+# 只通过矩阵-向量乘积使用（O(N·k)），从不构造 N×N 的矩阵；
+# 支持 cov @ w 与 w @ cov，因此可以直接替代 compute_moments 返回的协方差矩阵
+class CovarianceModel:
+    # 让 numpy 数组与模型相乘时交给 __rmatmul__ 处理
+    __array_ufunc__ = None
+
+    def __init__(self, factor, diagonal=None, name='sample'):
+        self.factor = np.ascontiguousarray(factor, dtype=float)
+        num_assets = self.factor.shape[1]
+        self.diagonal = np.zeros(num_assets) if diagonal is None else np.asarray(diagonal, dtype=float)
+        self.name = name
+
+    @property
+    def shape(self):
+        num_assets = self.factor.shape[1]
+        return num_assets, num_assets
+
+    @property
+    def num_factors(self):
+        return self.factor.shape[0]
+
+    def matvec(self, weights):
+        return self.factor.T @ (self.factor @ weights) + self.diagonal * weights
+
+    # 组合方差 wᵀΣw
+    def quad(self, weights):
+        factor_weights = self.factor @ weights
+        return factor_weights @ factor_weights + weights @ (self.diagonal * weights)
+
+    # 每只证券的方差（Σ 的对角线）
+    def variances(self):
+        return (self.factor ** 2).sum(axis=0) + self.diagonal
+
+    # 子集上的协方差矩阵 Σ_SS（只在证券数较少的子集上构造）
+    def submatrix(self, subset):
+        factor = self.factor[:, subset]
+        return factor.T @ factor + np.diag(self.diagonal[subset])
+
+    # 构造完整的 N×N 矩阵，仅用于检查和小规模问题
+    def to_dense(self):
+        return self.submatrix(np.arange(self.shape[0]))
+
+    def __matmul__(self, weights):
+        return self.matvec(weights)
+
+    # Σ 对称，wᵀΣ = (Σw)ᵀ
+    def __rmatmul__(self, weights):
+        return self.matvec(weights)
+
+
+def _centered(returns_matrix):
+    returns_matrix = np.asarray(returns_matrix, dtype=float)
+    return returns_matrix - returns_matrix.mean(axis=0)
+
+
+# 样本协方差的分解 F（Σ = FᵀF），由去均值的收益率矩阵得到，行数为 min(T, N)
+# 交易日多于证券数时用 QR 分解压缩为 N×N 的上三角矩阵，否则直接使用去均值的收益率
+def covariance_factor(returns_matrix):
+    centered = _centered(returns_matrix)
+    scale = 1 / np.sqrt(len(centered) - 1)
+    if centered.shape[0] > centered.shape[1]:
+        return np.linalg.qr(centered, mode='r') * scale
+    return centered * scale
+
+
+# 样本协方差（与 np.cov 一致）
+def sample_covariance(returns_matrix):
+    return CovarianceModel(covariance_factor(returns_matrix), name='sample')
+
+
+# Ledoit-Wolf 收缩：Σ = (1 - s) S + s μ I，S 为样本协方差（除以 T，与 sklearn 一致），μ = tr(S) / N
+# 收缩强度只用 T×T 的 Gram 矩阵计算，不构造 N×N 的矩阵
+def ledoit_wolf_covariance(returns_matrix):
+    centered = _centered(returns_matrix)
+    num_days, num_assets = centered.shape
+
+    gram = centered @ centered.T
+    row_norms = np.diag(gram)
+    mu = row_norms.sum() / (num_days * num_assets)
+    # ||S||_F² = ||XXᵀ||_F² / T²，||S - μI||_F² = ||S||_F² - N μ²
+    sample_norm = (gram ** 2).sum() / num_days ** 2
+    delta = (sample_norm - num_assets * mu ** 2) / num_assets
+    # Σ_t ||x_t x_tᵀ - S||_F² = Σ_t ||x_t||⁴ - T ||S||_F²
+    beta = ((row_norms ** 2).sum() - num_days * sample_norm) / (num_assets * num_days ** 2)
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+
+    factor = centered * np.sqrt((1 - shrinkage) / num_days)
+    model = CovarianceModel(factor, np.full(num_assets, shrinkage * mu), name='ledoit_wolf')
+    model.shrinkage = shrinkage
+    return model
+
+
+# k 因子 PCA 加对角项：Σ = B Bᵀ + D，B 为样本协方差的前 k 个主成分，D 为剩余的个股方差
+# 主成分由去均值收益率矩阵的奇异值分解得到，不构造 N×N 的矩阵
+def pca_covariance(returns_matrix, num_factors=10):
+    centered = _centered(returns_matrix)
+    scale = 1 / np.sqrt(len(centered) - 1)
+    _, singular_values, components = np.linalg.svd(centered, full_matrices=False)
+    num_factors = min(num_factors, len(singular_values))
+
+    factor = (singular_values[:num_factors, None] * components[:num_factors]) * scale
+    residual = (centered ** 2).sum(axis=0) * scale ** 2 - (factor ** 2).sum(axis=0)
+    return CovarianceModel(factor, np.maximum(residual, 0.0), name='pca')
+
+
+COVARIANCE_MODELS = {
+    'sample': sample_covariance,
+    'ledoit_wolf': ledoit_wolf_covariance,
+    'pca': pca_covariance,
+}
+
+
+# 按名称构造协方差模型；pca 模型使用 num_factors 个因子
+def build_covariance(returns_matrix, model='sample', num_factors=10):
+    if model not in COVARIANCE_MODELS:
+        raise ValueError(f"不支持的协方差模型: {model}")
+    if model == 'pca':
+        return pca_covariance(returns_matrix, num_factors)
+    return COVARIANCE_MODELS[model](returns_matrix)
@@ -0,0 +1,399 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import OptimizeResult, linprog, minimize
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import instrument
+from common.panel import Panel
+from covariance_models import CovarianceModel, build_covariance, sample_covariance
+
+
+# 收益率表（日期×证券）：Panel 取相对前一交易日的收益率，并去掉有证券缺失收益率的交易日
+# （与 T3 中宽表的 pct_change(fill_method=None).dropna() 一致），其他输入原样返回
+def as_returns(returns):
+    if isinstance(returns, Panel):
+        return returns.returns_frame(skip_missing=False).dropna()
+    return returns
+
+
+# 预先计算收益率矩阵、平均收益率和协方差矩阵（优化过程中只计算一次）
+# covariance_model 为 None 时使用稠密的样本协方差矩阵；为 'sample'、'ledoit_wolf' 或 'pca' 时返回
+# 只通过矩阵-向量乘积使用的协方差模型（见 covariance_models.py），适用于证券数较多的情形
+# returns 为收益率表、数组或 Panel
+@instrument()
+def compute_moments(returns, covariance_model=None, num_factors=10):
+    returns_matrix = np.ascontiguousarray(as_returns(returns), dtype=float)
+    mean_returns = returns_matrix.mean(axis=0)
+    if covariance_model is None:
+        cov_matrix = np.cov(returns_matrix, rowvar=False)
+    else:
+        cov_matrix = build_covariance(returns_matrix, covariance_model, num_factors)
+    return returns_matrix, mean_returns, cov_matrix
+
+
+# 组合的累计收益与回撤序列（定义与 T3 中一致：回撤相对于累计收益的峰值）
+def portfolio_drawdown(returns_matrix, weights):
+    portfolio_returns = returns_matrix @ weights
+    cumulative_returns = np.cumprod(portfolio_returns + 1) - 1
+    peak = np.maximum.accumulate(cumulative_returns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = (peak - cumulative_returns) / peak
+    return portfolio_returns, cumulative_returns, peak, drawdown
+
+
+# 最大回撤（忽略峰值为0时产生的NaN，与 pandas 的 max 一致）
+def max_drawdown_of(drawdown):
+    if np.isnan(drawdown).all():
+        return np.nan
+    return np.nanmax(drawdown)
+
+
+# 最大回撤对权重的（次）梯度：只与取得最大回撤的谷底日及其之前的峰值日有关
+def _max_drawdown_gradient(returns_matrix, portfolio_returns, cumulative_returns, drawdown):
+    trough = int(np.nanargmax(drawdown))
+    peak_day = int(np.argmax(cumulative_returns[:trough + 1]))
+    growth = returns_matrix[:trough + 1] / (1 + portfolio_returns[:trough + 1, None])
+    # d(1 + C_t)/dw = (1 + C_t) * sum_{u<=t} R_u / (1 + r_u)
+    d_trough = (1 + cumulative_returns[trough]) * growth.sum(axis=0)
+    d_peak = (1 + cumulative_returns[peak_day]) * growth[:peak_day + 1].sum(axis=0)
+    c_peak = cumulative_returns[peak_day]
+    c_trough = cumulative_returns[trough]
+    return (c_trough * d_peak - c_peak * d_trough) / c_peak ** 2
+
+
+# 最大回撤超出上限时的惩罚项及其梯度（未超出或 max_drawdown 为 None 时梯度为 None）
+def _drawdown_penalty(weights, returns_matrix, max_drawdown, penalty_factor):
+    if max_drawdown is None:
+        return 0.0, None
+    portfolio_returns, cumulative_returns, _, drawdown = portfolio_drawdown(returns_matrix, weights)
+    excess_drawdown = max_drawdown_of(drawdown) - max_drawdown
+    if not excess_drawdown > 0:
+        return 0.0, None
+    penalty = penalty_factor * excess_drawdown
+    if not np.isfinite(penalty):
+        return penalty, None
+    return penalty, penalty_factor * _max_drawdown_gradient(
+        returns_matrix, portfolio_returns, cumulative_returns, drawdown)
+
+
+# 夏普比率的负值（添加最大回撤惩罚项）及其梯度
+def sharpe_objective(weights, returns_matrix, mean_returns, cov_matrix, risk_free_rate,
+                     max_drawdown=0.7, penalty_factor=100):
+    cov_weights = cov_matrix @ weights
+    portfolio_return = weights @ mean_returns
+    portfolio_volatility = np.sqrt(weights @ cov_weights)
+    sharpe_ratio = (portfolio_return - risk_free_rate) / portfolio_volatility
+
+    # 夏普比率的精确梯度
+    gradient = -(mean_returns / portfolio_volatility
+                 - (portfolio_return - risk_free_rate) * cov_weights / portfolio_volatility ** 3)
+
+    # 若最大回撤超出上限，增加惩罚项
+    penalty, penalty_gradient = _drawdown_penalty(weights, returns_matrix, max_drawdown, penalty_factor)
+    if penalty_gradient is not None:
+        gradient = gradient + penalty_gradient
+    return -sharpe_ratio + penalty, gradient
+
+
+# 最大化带回撤惩罚的夏普比率（权重之和为1，单只股票权重不超过 weight_limit）
+@instrument()
+def optimize_sharpe(returns, initial_weights, risk_free_rate, max_drawdown=0.7, penalty_factor=100,
+                    weight_limit=0.05, moments=None, options=None):
+    start = time.perf_counter()
+    if moments is None:
+        moments = compute_moments(returns)
+    returns_matrix, mean_returns, cov_matrix = moments
+
+    constraints = [{'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1,
+                    'jac': lambda weights: np.ones_like(weights)}]
+    bounds = tuple((0, weight_limit) for _ in range(len(mean_returns)))
+
+    optimized = minimize(sharpe_objective, np.asarray(initial_weights, dtype=float), jac=True,
+                         args=(returns_matrix, mean_returns, cov_matrix, risk_free_rate, max_drawdown, penalty_factor),
+                         method='SLSQP', bounds=bounds, constraints=constraints, options=options)
+    optimized.wall_time = time.perf_counter() - start
+    return optimized
+
+
+# 均值-方差目标：0.5 * risk_aversion * wᵀΣw - return_weight * μᵀw，加上最大回撤惩罚项
+def frontier_objective(weights, returns_matrix, mean_returns, covariance, risk_aversion, return_weight,
+                       max_drawdown=0.7, penalty_factor=100):
+    cov_weights = covariance.matvec(weights)
+    value = 0.5 * risk_aversion * (weights @ cov_weights) - return_weight * (weights @ mean_returns)
+    gradient = risk_aversion * cov_weights - return_weight * mean_returns
+
+    penalty, penalty_gradient = _drawdown_penalty(weights, returns_matrix, max_drawdown, penalty_factor)
+    if penalty_gradient is not None:
+        gradient = gradient + penalty_gradient
+    return value + penalty, gradient
+
+
+# 按优先级从小到大依次将权重填满上限，得到权重之和为1的可行组合（至多一个权重不在边界上）
+def _fill_weights(priority, weight_limit):
+    weights = np.zeros(len(priority))
+    remaining = 1.0
+    for asset in np.argsort(priority, kind='stable'):
+        weights[asset] = min(weight_limit, remaining)
+        remaining -= weights[asset]
+        if remaining <= 0:
+            break
+    return weights
+
+
+# 原始积极集法求解 min 0.5 * a * wᵀΣw - b * μᵀw，s.t. A w = A w0，0 <= w <= weight_limit
+# 从可行点 weights 出发，每次迭代只增减一个边界约束；协方差模型只用于矩阵-向量乘积和自由变量上的子矩阵
+def _active_set_qp(covariance, mean_returns, risk_aversion, return_weight, weight_limit, A, weights,
+                   max_iter=None, tolerance=1e-12):
+    num_assets = len(mean_returns)
+    num_equalities = A.shape[0]
+    if max_iter is None:
+        max_iter = 10 * num_assets
+
+    lower = weights <= tolerance
+    upper = (weights >= weight_limit - tolerance) & ~lower
+    weights = np.where(lower, 0.0, np.where(upper, weight_limit, weights))
+    for iteration in range(1, max_iter + 1):
+        free = ~(lower | upper)
+        num_free = int(free.sum())
+        gradient = risk_aversion * covariance.matvec(weights) - return_weight * mean_returns
+
+        # 在自由变量上求解等式约束子问题的 KKT 方程，得到下降方向和等式约束的乘子
+        kkt = np.zeros((num_free + num_equalities, num_free + num_equalities))
+        kkt[:num_free, :num_free] = risk_aversion * covariance.submatrix(free)
+        kkt[:num_free, num_free:] = A[:, free].T
+        kkt[num_free:, :num_free] = A[:, free]
+        solution = np.linalg.lstsq(kkt, np.concatenate([-gradient[free], np.zeros(num_equalities)]), rcond=None)[0]
+        step = np.zeros(num_assets)
+        step[free] = solution[:num_free]
+
+        if np.abs(step).max() <= tolerance:
+            # 已是当前工作集上的最优解：检查边界约束的乘子，符号错误时释放违反最严重的一个
+            reduced_gradient = gradient + A.T @ solution[num_free:]
+            violation = np.where(lower, -reduced_gradient, np.where(upper, reduced_gradient, -np.inf))
+            asset = int(np.argmax(violation))
+            if violation[asset] <= 1e-9 * (np.abs(gradient).max() + tolerance):
+                return weights, iteration, True
+            lower[asset] = upper[asset] = False
+            continue
+
+        # 沿下降方向前进，遇到的第一个边界加入工作集
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(step < -1e-15, -weights / step,
+                             np.where(step > 1e-15, (weight_limit - weights) / step, np.inf))
+        blocking = int(np.argmin(ratio))
+        alpha = min(1.0, ratio[blocking])
+        weights = weights + alpha * step
+        if alpha < 1.0:
+            if step[blocking] < 0:
+                lower[blocking] = True
+                weights[blocking] = 0.0
+            else:
+                upper[blocking] = True
+                weights[blocking] = weight_limit
+    return weights, max_iter, False
+
+
+# 有效前沿：一次调用求解一组目标收益率（或风险厌恶系数）下的组合
+# 协方差只分解一次（moments 中为协方差模型时直接使用），均值-方差问题用积极集法求解，每个点从相邻点的解出发（热启动）；
+# 给定 max_drawdown 时，最大回撤超出上限的点再以该解为初始值用 SLSQP 加入 T3 的回撤惩罚项求解（较慢）
+# 给定 risk_aversions 时最小化 0.5 * λ * wᵀΣw - μᵀw；否则在 target_returns 上最小化方差，
+# target_returns 为 None 时从最小方差组合的收益率均匀取到权重上限下可达到的最高收益率，共 num_points 个点；
+# 权重上限下无法达到的目标收益率（解的收益率与目标相差超过 return_tolerance×max|μ|）记为 Success=False
+# 返回 (前沿表, 权重表)：前沿表每行一个点，权重表的行与前沿表对应、列为证券
+@instrument()
+def efficient_frontier(returns, target_returns=None, risk_aversions=None, num_points=50, risk_free_rate=0.0,
+                       max_drawdown=None, penalty_factor=100, weight_limit=0.05, moments=None, options=None,
+                       return_tolerance=1e-6):
+    start = time.perf_counter()
+    returns = as_returns(returns)
+    if moments is None:
+        moments = compute_moments(returns)
+    returns_matrix, mean_returns, cov_matrix = moments
+    if isinstance(cov_matrix, CovarianceModel):
+        covariance = cov_matrix
+    else:
+        covariance = sample_covariance(returns_matrix)
+    num_assets = len(mean_returns)
+
+    bounds = tuple((0, weight_limit) for _ in range(num_assets))
+    budget = {'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1,
+              'jac': lambda weights: np.ones_like(weights)}
+
+    # 含回撤惩罚项的求解；日收益率的方差量级很小，SLSQP 的收敛容差是绝对值，因此以当前解的方差为单位缩放
+    def penalized(weights, risk_aversion, return_weight, constraints):
+        scale = 1 / covariance.quad(weights)
+        return minimize(frontier_objective, weights, jac=True,
+                        args=(returns_matrix, mean_returns, covariance, risk_aversion * scale, return_weight * scale,
+                              max_drawdown, penalty_factor),
+                        method='SLSQP', bounds=bounds, constraints=constraints, options=options)
+
+    def solve(weights, risk_aversion, return_weight, A, constraints):
+        weights, iterations, success = _active_set_qp(covariance, mean_returns, risk_aversion, return_weight,
+                                                       weight_limit, A, weights)
+        penalty, _ = _drawdown_penalty(weights, returns_matrix, max_drawdown, penalty_factor)
+        if penalty == 0.0:
+            return weights, iterations, success, False
+        solution = penalized(weights, risk_aversion, return_weight, constraints)
+        return solution.x, iterations + solution.nit, bool(solution.success), True
+
+    # 最小方差组合：从单只证券方差最小的组合出发
+    budget_matrix = np.ones((1, num_assets))
+    weights, _, _ = _active_set_qp(covariance, mean_returns, 1.0, 0.0, weight_limit, budget_matrix,
+                                   _fill_weights(covariance.variances(), weight_limit))
+
+    points = []
+    if risk_aversions is not None:
+        for risk_aversion in risk_aversions:
+            solved = solve(weights, risk_aversion, 1.0, budget_matrix, [budget])
+            points.append((risk_aversion, np.nan) + solved)
+            weights = solved[0]
+    else:
+        # 收益率最低和最高的可行组合，与上一个解凸组合得到满足新目标收益率的可行初始点
+        lowest = _fill_weights(mean_returns, weight_limit)
+        highest = _fill_weights(-mean_returns, weight_limit)
+        if target_returns is None:
+            target_returns = np.linspace(weights @ mean_returns, highest @ mean_returns, num_points)
+        target_matrix = np.vstack([np.ones(num_assets), mean_returns])
+        for target_return in target_returns:
+            current_return = weights @ mean_returns
+            extreme = highest if target_return > current_return else lowest
+            gap = extreme @ mean_returns - current_return
+            theta = np.clip((target_return - current_return) / gap, 0.0, 1.0) if gap != 0 else 0.0
+            target = {'type': 'eq', 'fun': lambda weights, target_return=target_return:
+                      weights @ mean_returns - target_return,
+                      'jac': lambda weights: mean_returns}
+            solved = solve((1 - theta) * weights + theta * extreme, 1.0, 0.0, target_matrix, [budget, target])
+            weights = solved[0]
+            if abs(weights @ mean_returns - target_return) > return_tolerance * np.abs(mean_returns).max():
+                solved = (weights, solved[1], False, solved[3])
+            points.append((np.nan, target_return) + solved)
+
+    rows = []
+    for point, (risk_aversion, target_return, weights, iterations, success, penalized_point) in enumerate(points):
+        _, _, _, drawdown = portfolio_drawdown(returns_matrix, weights)
+        expected_return = float(weights @ mean_returns)
+        volatility = float(np.sqrt(covariance.quad(weights)))
+        rows.append({
+            'Point': point,
+            'RiskAversion': risk_aversion,
+            'TargetReturn': target_return,
+            'ExpectedReturn': expected_return,
+            'Volatility': volatility,
+            'MaxDrawdown': float(max_drawdown_of(drawdown)),
+            'SharpeRatio': (expected_return - risk_free_rate) / volatility,
+            'Success': success,
+            'DrawdownPenalized': penalized_point,
+            'Iterations': iterations,
+        })
+    frontier = pd.DataFrame(rows)
+
+    assets = returns.columns if isinstance(returns, pd.DataFrame) else np.arange(num_assets)
+    frontier_weights = pd.DataFrame(np.array([point[2] for point in points]).reshape(-1, num_assets),
+                                    columns=assets, index=frontier['Point'])
+    frontier.attrs['wall_time'] = time.perf_counter() - start
+    return frontier, frontier_weights
+
+
+# 未复利累计收益的回撤序列（峰值包含初始值0），线性规划模式使用这一定义
+def additive_drawdown(returns_matrix, weights):
+    cumulative_returns = np.cumsum(returns_matrix @ weights)
+    peak = np.maximum.accumulate(np.maximum(cumulative_returns, 0.0))
+    return peak - cumulative_returns
+
+
+# 条件回撤风险（CDaR）：最坏的 (1 - alpha) 比例回撤的平均值
+def conditional_drawdown_at_risk(drawdown, alpha=0.95):
+    tail = (1 - alpha) * len(drawdown)
+    ordered = np.sort(drawdown)[::-1]
+    whole = int(np.floor(tail))
+    value = ordered[:whole].sum()
+    if whole < len(ordered):
+        value += (tail - whole) * ordered[whole]
+    return value / tail
+
+
+# 线性规划：在回撤约束下最大化预期收益，使用 HiGHS 求解
+# mode='max' 约束最大回撤，mode='cdar' 约束条件回撤风险；回撤按未复利的累计收益计算
+@instrument()
+def optimize_drawdown_lp(returns, max_drawdown=0.7, weight_limit=0.05, mode='max', alpha=0.95,
+                         moments=None, tolerance=1e-7):
+    if mode not in ('max', 'cdar'):
+        raise ValueError("mode 只能为 'max' 或 'cdar'。")
+    start = time.perf_counter()
+    if moments is None:
+        moments = compute_moments(returns)
+    returns_matrix, mean_returns, _ = moments
+    num_days, num_assets = returns_matrix.shape
+
+    # 变量依次为：权重 w、累计收益的峰值 u，CDaR 模式下还有阈值 zeta 与超额回撤 z
+    # 只有累计收益矩阵 C 是稠密块，其余约束都是稀疏的
+    cumulative = sparse.csr_matrix(np.cumsum(returns_matrix, axis=0))
+    identity = sparse.identity(num_days, format='csr')
+    # 峰值单调不减：u_{t-1} - u_t <= 0
+    peak_step = sparse.diags([np.ones(num_days - 1), -np.ones(num_days - 1)], [0, 1],
+                             shape=(num_days - 1, num_days), format='csr')
+
+    # 峰值不低于累计收益（C w - u <= 0）且单调不减
+    blocks = [[cumulative, -identity],
+              [sparse.csr_matrix((num_days - 1, num_assets)), peak_step]]
+    b_ub = [np.zeros(num_days), np.zeros(num_days - 1)]
+    if mode == 'max':
+        # 每日回撤不超过上限：u - C w <= max_drawdown
+        blocks.append([-cumulative, identity])
+        b_ub.append(np.full(num_days, max_drawdown))
+        extra_bounds = []
+    else:
+        # u - C w - zeta - z <= 0，zeta + sum(z) / ((1 - alpha) T) <= max_drawdown
+        blocks[0] += [sparse.csr_matrix((num_days, 1)), sparse.csr_matrix((num_days, num_days))]
+        blocks[1] += [None, None]
+        blocks.append([-cumulative, identity, sparse.csr_matrix(-np.ones((num_days, 1))), -identity])
+        blocks.append([None, None, sparse.csr_matrix([[1.0]]),
+                       sparse.csr_matrix(np.full((1, num_days), 1 / ((1 - alpha) * num_days)))])
+        b_ub += [np.zeros(num_days), [max_drawdown]]
+        extra_bounds = [(None, None)] + [(0, None)] * num_days
+    A_ub = sparse.bmat(blocks, format='csr')
+
+    # 权重之和为1
+    num_variables = A_ub.shape[1]
+    A_eq = sparse.csr_matrix((np.ones(num_assets), (np.zeros(num_assets), np.arange(num_assets))),
+                             shape=(1, num_variables))
+    c = np.zeros(num_variables)
+    c[:num_assets] = -mean_returns
+    bounds = [(0, weight_limit)] * num_assets + [(0, None)] * num_days + extra_bounds
+
+    solution = linprog(c, A_ub=A_ub, b_ub=np.concatenate(b_ub), A_eq=A_eq, b_eq=[1.0],
+                       bounds=bounds, method='highs')
+
+    result = OptimizeResult(success=solution.success, status=solution.status, message=solution.message,
+                            nit=solution.nit, mode=mode, feasible=False)
+    if solution.success:
+        # 直接用权重重新计算回撤，验证解满足全部约束
+        weights = np.clip(solution.x[:num_assets], 0, weight_limit)
+        drawdown = additive_drawdown(returns_matrix, weights)
+        risk = drawdown.max() if mode == 'max' else conditional_drawdown_at_risk(drawdown, alpha)
+        result.x = weights
+        result.fun = float(weights @ mean_returns)
+        result.drawdown_risk = float(risk)
+        result.feasible = bool(abs(weights.sum() - 1) <= tolerance and risk <= max_drawdown + tolerance)
+    result.wall_time = time.perf_counter() - start
+    return result
+
+
+# 汇总组合的预期收益、波动率和最大回撤
+def portfolio_summary(returns_matrix, weights, moments=None):
+    if moments is None:
+        moments = compute_moments(returns_matrix)
+    returns_matrix, mean_returns, cov_matrix = moments
+    _, cumulative_returns, _, drawdown = portfolio_drawdown(returns_matrix, weights)
+    return {
+        'expected_return': float(weights @ mean_returns),
+        'volatility': float(np.sqrt(weights @ cov_matrix @ weights)),
+        'max_drawdown': float(max_drawdown_of(drawdown)),
+        'cumulative_returns': cumulative_returns,
+        'drawdown': drawdown,
+    }
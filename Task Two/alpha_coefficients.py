@@ -1,20 +1,25 @@
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import LinearRegression
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.kdata_cache import load_kdata
+from common.market_index import year_index_returns
 
 # 读取数据
-df = pd.read_csv('./data/hs300stocks_kdata_2024.csv')
+df = load_kdata(2024, './data/')
 
 # 转换日期为标准日期格式
 df['time'] = pd.to_datetime(df['time'])
 
-# 按日期分组，计算所有证券的平均收盘价，作为市场指数的近似
-market_index = df.groupby('time')['close'].mean().reset_index()
-market_index.columns = ['time', 'market_close']
+# 市场指数的构造方式（见 common/market_index.py）：'mean_close' 为所有证券收盘价的平均值，
+# 也可使用 'equal_weight'、'constituent_weight' 或 'return_average'
+market_proxy = 'mean_close'
 
-# 计算市场的每日收益率
-market_index = market_index.sort_values('time')
-market_index['market_return'] = market_index['market_close'].pct_change()
+# 读取共享的市场指数每日收益率（每年只计算一次并缓存）
+market_index = year_index_returns(2024, market_proxy, './data/').rename('market_return').reset_index()
 
 # 将市场收益率合并到主数据框中
 df = df.merge(market_index[['time', 'market_return']], on='time', how='left')
@@ -0,0 +1,226 @@
+import pandas as pd
+import numpy as np
+import os
+import sys
+import warnings
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import instrument
+from common.market_index import INDEX_METHODS, index_returns, year_index_returns
+from common.panel import Panel
+from common.regression import batched_ols, rolling_ols
+from common.rolling_metrics import rolling_metrics
+
+data_folder = './data/'
+
+# 假设年化无风险收益率为2%，转化为每日收益率
+risk_free_rate_daily = (1 + 0.02) ** (1 / 252) - 1  # 252个交易日
+
+# 各因子的输出文件（与 train.py 读取的目录结构一致）
+FACTOR_FILES = {
+    'Alpha': 'alpha_coefficients/alpha_coefficients_{year}.csv',
+    'Beta': 'beta_coefficients/beta_coefficients_{year}.csv',
+    'SharpeRatio': 'sharpe_ratio/sharpe_ratio_results_{year}.csv',
+    'Volatility': 'volatility/volatility_results_{year}.csv',
+    'TotalReturn': 'return/total_return_results_{year}.csv',
+}
+MERGED_FILE = 'factors/factors_{year}.csv'
+
+# 市场指数的构造方式（见 common/market_index.py）：默认为所有证券收盘价的平均值，与原脚本一致
+MARKET_PROXY = 'mean_close'
+
+
+# 计算市场收益率与每只证券的每日收益率（只排序一次）
+# market_return 为按日期索引的市场收益率（通常由 common.market_index 读取缓存）；
+# 为 None 时由 df 本身按 market_proxy 构造。df 为 Panel 时收益率由面板计算，只附加对齐的市场收益率
+def prepare_returns(df, market_proxy=MARKET_PROXY, market_return=None):
+    if market_proxy not in INDEX_METHODS:
+        raise ValueError(f"不支持的市场指数构造方式: {market_proxy}")
+    if market_return is None:
+        market_return = index_returns(df)[market_proxy]
+    if isinstance(df, Panel):
+        return df.with_market_return(market_return)
+
+    df = df.sort_values(['code', 'time'], kind='mergesort').reset_index(drop=True)
+    df['market_return'] = df['time'].map(market_return)
+
+    df['stock_return'] = df.groupby('code', sort=False)['close'].pct_change()
+    return df
+
+
+# 将收益率转为 日期×证券 的矩阵，并取出对齐的市场收益率
+def pivot_returns(df):
+    if isinstance(df, Panel):
+        return df.returns_frame(), df.market_return_series()
+    returns_matrix = df.pivot(index='time', columns='code', values='stock_return')
+    market_return = df.groupby('time')['market_return'].first().reindex(returns_matrix.index)
+    return returns_matrix, market_return
+
+
+# 面板上每只证券收益率的个数、均值和样本标准差（按列计算，不需要分组）
+def _panel_return_stats(panel):
+    returns = panel.returns()
+    with warnings.catch_warnings():
+        # 没有收益率或只有一个收益率的证券返回NaN即可
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return pd.DataFrame({
+            'count': (~np.isnan(returns)).sum(axis=0),
+            'mean': np.nanmean(returns, axis=0),
+            'std': np.nanstd(returns, axis=0, ddof=1),
+        }, index=panel.codes)
+
+
+# 波动率与夏普比率：每日收益率的均值和标准差，按证券代码排序
+@instrument()
+def calculate_return_stats(df, risk_free_rate_daily=risk_free_rate_daily):
+    if isinstance(df, Panel):
+        return_stats = _panel_return_stats(df)
+    else:
+        return_stats = df['stock_return'].groupby(df['code'], sort=True).agg(['count', 'mean', 'std'])
+    enough_returns = return_stats['count'] >= 2
+    stats = pd.DataFrame({
+        'SharpeRatio': ((return_stats['mean'] - risk_free_rate_daily) / return_stats['std']).where(enough_returns),
+        'Volatility': return_stats['std'].where(enough_returns),
+    })
+    stats.index.name = 'StockCode'
+    return stats
+
+
+# Alpha 与 Beta：对市场收益率的一元线性回归，所有证券一次批量求解
+@instrument()
+def calculate_alpha_beta(df):
+    returns_matrix, market_return = pivot_returns(df)
+    regression = batched_ols(returns_matrix, market_return)[['Alpha', 'Beta']]
+    regression.index.name = 'StockCode'
+    return regression
+
+
+# 面板上每只证券收盘价的个数、第一个和最后一个收盘价
+def _panel_close_stats(panel):
+    close = panel.close
+    valid = ~np.isnan(close)
+    columns = np.arange(close.shape[1])
+    first = close[valid.argmax(axis=0), columns]
+    last = close[len(close) - 1 - valid[::-1].argmax(axis=0), columns]
+    return pd.DataFrame({'count': valid.sum(axis=0), 'first': first, 'last': last}, index=panel.codes)
+
+
+# 累计收益率：(最后一个收盘价 - 第一个收盘价) / 第一个收盘价
+@instrument()
+def calculate_total_return(df):
+    if isinstance(df, Panel):
+        close_stats = _panel_close_stats(df)
+    else:
+        close_stats = df.groupby(df['code'], sort=True)['close'].agg(['count', 'first', 'last'])
+    total_return = ((close_stats['last'] - close_stats['first']) / close_stats['first']).where(close_stats['count'] >= 2)
+    total_return.index.name = 'StockCode'
+    return total_return.rename('TotalReturn')
+
+
+# 将各因子按证券代码对齐，合并成一张因子表
+def combine_factors(alpha_beta, return_stats, total_return):
+    factors = pd.DataFrame({
+        'Alpha': alpha_beta['Alpha'].reindex(return_stats.index),
+        'Beta': alpha_beta['Beta'].reindex(return_stats.index),
+        'SharpeRatio': return_stats['SharpeRatio'],
+        'Volatility': return_stats['Volatility'],
+        'TotalReturn': total_return.reindex(return_stats.index),
+    })
+    factors.index.name = 'StockCode'
+    return factors.reset_index()
+
+
+# 一次计算所有证券的 Alpha、Beta、夏普比率、波动率和累计收益率
+def calculate_factors(df, risk_free_rate_daily=risk_free_rate_daily):
+    return combine_factors(calculate_alpha_beta(df), calculate_return_stats(df, risk_free_rate_daily),
+                           calculate_total_return(df))
+
+
+# 读取某一年的收盘价面板（收益率在面板上计算并缓存），市场收益率使用共享的指数缓存
+@instrument()
+def load_year_returns(year, data_folder=data_folder, market_proxy=MARKET_PROXY):
+    panel = Panel.from_kdata(year, data_folder, fields=['close'])
+    return prepare_returns(panel, market_proxy, year_index_returns(year, market_proxy, data_folder))
+
+
+# 计算某一年的全部因子
+def calculate_year_factors(year, data_folder=data_folder, risk_free_rate_daily=risk_free_rate_daily,
+                           market_proxy=MARKET_PROXY):
+    df = load_year_returns(year, data_folder, market_proxy)
+    return calculate_factors(df, risk_free_rate_daily)
+
+
+# 计算滚动窗口的 alpha/beta/R²/残差波动率（每个交易日、每只证券）
+@instrument()
+def calculate_rolling_regression(years, windows=(20, 60, 120), data_folder=data_folder, market_proxy=MARKET_PROXY):
+    if np.isscalar(years):
+        years = [years]
+
+    # 收益率按年计算（与年度因子一致），之后拼接成一个多年的矩阵
+    pivots = [pivot_returns(load_year_returns(year, data_folder, market_proxy)) for year in years]
+    returns_matrix = pd.concat([returns for returns, _ in pivots]).sort_index(axis=1)
+    market_return = pd.concat([market for _, market in pivots])
+
+    results = {}
+    for window in windows:
+        rolling = rolling_ols(returns_matrix, market_return, window)
+        long_frames = {name: values.stack() for name, values in rolling.items() if name != 'Observations'}
+        rolling_df = pd.DataFrame(long_frames).dropna(subset=['Beta'])
+        rolling_df.index.names = ['time', 'StockCode']
+        results[window] = rolling_df.reset_index()
+    return results
+
+
+# 计算滚动窗口的波动率/夏普比率/累计收益率/最大回撤（每个交易日、每只证券），无风险利率与年度因子相同
+@instrument()
+def calculate_rolling_metrics(years, windows=(20, 60, 250), data_folder=data_folder,
+                              risk_free_rate_daily=risk_free_rate_daily, min_periods=None):
+    if np.isscalar(years):
+        years = [years]
+
+    # 各年的收盘价拼接成一个面板，收益率跨年衔接（否则每年第一个交易日缺失，250日窗口永远不完整）
+    panel = Panel.concat(Panel.from_kdata(year, data_folder, fields=['close']) for year in years)
+    returns_matrix = panel.returns_frame()
+
+    results = {}
+    for window in windows:
+        metrics = rolling_metrics(returns_matrix, window, risk_free_rate_daily, min_periods)
+        long_frames = {name: values.stack() for name, values in metrics.items() if name != 'Observations'}
+        metrics_df = pd.DataFrame(long_frames).dropna(subset=['TotalReturn'])
+        metrics_df.index.names = ['time', 'StockCode']
+        results[window] = metrics_df.reset_index()
+    return results
+
+
+# 将因子结果写入 train.py 使用的各因子文件以及合并文件
+@instrument()
+def save_factors(factors, year, output_folder='.'):
+    for column, pattern in FACTOR_FILES.items():
+        path = os.path.join(output_folder, pattern.format(year=year))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        factors[['StockCode', column]].to_csv(path, index=False)
+
+    merged_path = os.path.join(output_folder, MERGED_FILE.format(year=year))
+    os.makedirs(os.path.dirname(merged_path), exist_ok=True)
+    factors.rename(columns={'TotalReturn': 'Return'}).to_csv(merged_path, index=False)
+
+
+# 对单个年份或年份区间运行因子引擎
+def run_factor_engine(years, data_folder=data_folder, output_folder='.', risk_free_rate_daily=risk_free_rate_daily,
+                      market_proxy=MARKET_PROXY):
+    if np.isscalar(years):
+        years = [years]
+
+    all_factors = []
+    for year in years:
+        print(f"正在计算{year}年的因子...")
+        factors = calculate_year_factors(year, data_folder, risk_free_rate_daily, market_proxy)
+        save_factors(factors, year, output_folder)
+        factors['Year'] = year
+        all_factors.append(factors)
+    return pd.concat(all_factors, ignore_index=True)
+
+
+if __name__ == "__main__":
+    run_factor_engine(range(2014, 2025))
+    print("所有年份的因子结果已保存。")
@@ -0,0 +1,123 @@
+import pandas as pd
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import kdata_cache, market_index, panel, regression
+from common.kdata_cache import kdata_path, stock_info_path, source_fingerprint
+from common.market_index import load_year_index
+from common.panel import Panel
+from common.pipeline import Pipeline, PIPELINE_CACHE_FOLDER
+import factor_engine
+import train
+from factor_engine import (data_folder, risk_free_rate_daily, MARKET_PROXY, MERGED_FILE, prepare_returns,
+                           calculate_alpha_beta, calculate_return_stats, calculate_total_return,
+                           combine_factors, save_factors)
+from train import FEATURES, train_weights, calculate_risk_scores
+
+RISK_SCORE_FILE = 'trained_risk_assessment_results_{start}_{end}.csv'
+
+
+def load_returns(year, kdata, market_index, market_proxy=MARKET_PROXY):
+    return prepare_returns(kdata, market_proxy, market_index[market_proxy])
+
+
+def calculate_year_alpha_beta(year, returns):
+    return calculate_alpha_beta(returns)
+
+
+def calculate_year_return_stats(year, returns, risk_free_rate_daily=risk_free_rate_daily):
+    return calculate_return_stats(returns, risk_free_rate_daily)
+
+
+def calculate_year_total_return(year, returns):
+    return calculate_total_return(returns)
+
+
+# 合并后的因子表，列名与 train.py 读取的合并文件一致
+def merge_year_factors(year, alpha_beta, return_stats, total_return):
+    factors = combine_factors(alpha_beta, return_stats, total_return)
+    return factors.rename(columns={'TotalReturn': 'Return'})
+
+
+# 用全部年份的因子训练权重并计算风险评分
+def calculate_all_risk_scores(years, factors):
+    all_data = []
+    for year in years:
+        year_data = factors[year].copy()
+        year_data['Year'] = year
+        all_data.append(year_data)
+    training_df = pd.concat([df[FEATURES + ['Return']] for df in all_data], ignore_index=True)
+    weights = train_weights(training_df)
+    return calculate_risk_scores(all_data, weights), weights
+
+
+# 声明流水线：kdata、市场指数 → 收益率 → 各因子表 → 合并因子表 → 风险评分
+# 每个阶段的缓存键包含源文件哈希、无风险利率、市场指数近似方式等参数，以及阶段实际调用的模块的源代码
+# （code_deps：修改 factor_engine、train 或 common 中对应模块后，受影响的阶段及其下游重新计算）
+def build_pipeline(data_folder=data_folder, cache_folder=PIPELINE_CACHE_FOLDER,
+                   risk_free_rate_daily=risk_free_rate_daily, market_proxy=MARKET_PROXY):
+    def load_year_kdata(year):
+        return Panel.from_kdata(year, data_folder, fields=['close'])
+
+    def load_market_index(year):
+        return load_year_index(year, data_folder)['index']
+
+    def stock_info_fingerprint(year):
+        path = stock_info_path(year, data_folder)
+        return source_fingerprint(path) if os.path.exists(path) else None
+
+    # 原始数据与市场指数已有各自的缓存，这里只记录源文件的内容哈希
+    pipeline = Pipeline(cache_folder)
+    pipeline.add_stage('kdata', load_year_kdata, store=False,
+                       fingerprint=lambda year: source_fingerprint(kdata_path(year, data_folder)),
+                       code_deps=[panel, kdata_cache])
+    pipeline.add_stage('market_index', load_market_index, store=False,
+                       fingerprint=lambda year: [source_fingerprint(kdata_path(year, data_folder)),
+                                                 stock_info_fingerprint(year)],
+                       code_deps=[market_index, kdata_cache])
+    pipeline.add_stage('returns', load_returns, deps=['kdata', 'market_index'], params={'market_proxy': market_proxy},
+                       code_deps=[factor_engine, panel])
+    pipeline.add_stage('alpha_beta', calculate_year_alpha_beta, deps=['returns'],
+                       code_deps=[factor_engine, panel, regression])
+    pipeline.add_stage('return_stats', calculate_year_return_stats, deps=['returns'],
+                       params={'risk_free_rate_daily': risk_free_rate_daily}, code_deps=[factor_engine, panel])
+    pipeline.add_stage('total_return', calculate_year_total_return, deps=['returns'],
+                       code_deps=[factor_engine, panel])
+    pipeline.add_stage('factors', merge_year_factors, deps=['alpha_beta', 'return_stats', 'total_return'],
+                       code_deps=[factor_engine])
+    pipeline.add_stage('risk_scores', calculate_all_risk_scores, deps=['factors'], per_year=False,
+                       code_deps=[train])
+    return pipeline
+
+
+# 运行流水线，只重新计算过期的年份和阶段，并更新对应的因子文件与风险评分文件
+def run_pipeline(years, data_folder=data_folder, output_folder='.', cache_folder=PIPELINE_CACHE_FOLDER,
+                 risk_free_rate_daily=risk_free_rate_daily, market_proxy=MARKET_PROXY):
+    years = list(years)
+    pipeline = build_pipeline(data_folder, cache_folder, risk_free_rate_daily, market_proxy)
+
+    stale = pipeline.stale(['risk_scores'], years)
+    if stale:
+        print("需要重新计算:", ', '.join(name if year is None else f'{name}({year})' for name, year in stale))
+    else:
+        print("所有阶段均为最新，直接使用缓存。")
+
+    results = pipeline.run(['factors', 'risk_scores'], years)
+    computed = set(pipeline.computed())
+    for year, factors in results['factors'].items():
+        merged_path = os.path.join(output_folder, MERGED_FILE.format(year=year))
+        if ('factors', year) in computed or not os.path.exists(merged_path):
+            save_factors(factors.rename(columns={'Return': 'TotalReturn'}), year, output_folder)
+
+    risk_scores, weights = results['risk_scores']
+    risk_file = os.path.join(output_folder, RISK_SCORE_FILE.format(start=years[0], end=years[-1]))
+    if ('risk_scores', None) in computed or not os.path.exists(risk_file):
+        risk_scores.to_csv(risk_file, index=False)
+    print("训练得到的权重:", weights)
+    print(f"风险评估结果已保存到 '{risk_file}'")
+    return risk_scores, weights
+
+
+if __name__ == "__main__":
+    run_pipeline(range(2014, 2025))
@@ -0,0 +1,230 @@
+import asyncio
+import bisect
+import json
+import math
+import os
+import sys
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.kdata_cache import file_signature
+
+# train.py 输出的风险评分表
+RISK_SCORE_FILE = 'trained_risk_assessment_results_2014_2024.csv'
+
+# 查询结果的 LRU 缓存大小，以及检查文件是否变化的最短间隔（秒）
+CACHE_SIZE = 1024
+RELOAD_INTERVAL = 1.0
+
+# HTTP 服务监听的地址与端口（只监听本机）
+HOST = '127.0.0.1'
+PORT = 8765
+
+
+# 某一次加载的评分表：(StockCode, Year) -> 记录，以及每年按 RiskScore 升序排列的记录
+class _Snapshot:
+    def __init__(self, path):
+        self.signature = file_signature(path)
+        table = pd.read_csv(path)
+        table = table.dropna(subset=['StockCode', 'Year', 'RiskScore'])
+        table['Year'] = table['Year'].astype(int)
+        self.columns = list(table.columns)
+
+        record_type = namedtuple('RiskRecord', self.columns)
+        records = [record_type(*row) for row in table.itertuples(index=False, name=None)]
+        self.records = {(record.StockCode, record.Year): record for record in records}
+
+        self.by_year = {}
+        self.scores_by_year = {}
+        for record in sorted(self.records.values(), key=lambda record: (record.Year, record.RiskScore)):
+            self.by_year.setdefault(record.Year, []).append(record)
+        for year, year_records in self.by_year.items():
+            self.by_year[year] = tuple(year_records)
+            self.scores_by_year[year] = [record.RiskScore for record in year_records]
+        self.years = sorted(self.by_year)
+
+
+# 风险评分查询：评分表只读取一次并建立索引，单条查询为一次字典查找；
+# 文件修改后（修改时间或大小变化）在下一次查询时自动重新加载，缓存随之清空
+class RiskScoreIndex:
+    def __init__(self, path=RISK_SCORE_FILE, cache_size=CACHE_SIZE, reload_interval=RELOAD_INTERVAL):
+        self.path = path
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self._snapshot = _Snapshot(path)
+        self._checked = time.monotonic()
+        self._cache = OrderedDict()
+        self.reloads = 0
+
+    # 距上次检查超过 reload_interval 秒时比较文件签名，变化则重新加载
+    def _current(self):
+        now = time.monotonic()
+        if now - self._checked >= self.reload_interval:
+            self._checked = now
+            self.reload()
+        return self._snapshot
+
+    # 文件签名变化（或 force=True）时重新加载；读取失败（如文件正在写入）时继续使用原来的数据
+    def reload(self, force=False):
+        try:
+            if not force and file_signature(self.path) == self._snapshot.signature:
+                return False
+            snapshot = _Snapshot(self.path)
+        except (OSError, ValueError, KeyError, pd.errors.ParserError):
+            return False
+        self._snapshot = snapshot
+        self._cache.clear()
+        self.reloads += 1
+        return True
+
+    def _cached(self, key, compute):
+        snapshot = self._current()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        value = compute(snapshot)
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    @property
+    def years(self):
+        return self._current().years
+
+    @property
+    def columns(self):
+        return self._current().columns
+
+    # 某只股票某一年的记录，不存在时返回 None
+    def get(self, code, year):
+        return self._current().records.get((code, int(year)))
+
+    # 批量查询：keys 为 (StockCode, Year) 序列，按顺序返回记录（不存在的为 None）
+    def get_many(self, keys):
+        records = self._current().records
+        return [records.get((code, int(year))) for code, year in keys]
+
+    # 某一年风险评分最低（lowest=True）或最高的 k 只股票，year 为 None 时为最近一年；k 不能为负数
+    def top_k(self, year=None, k=20, lowest=True):
+        if k < 0:
+            raise ValueError(f"k 不能为负数: {k}")
+        def compute(snapshot):
+            year_records = snapshot.by_year.get(self._resolve_year(snapshot, year), ())
+            return year_records[:k] if lowest else tuple(reversed(year_records[-k:] if k else ()))
+        return self._cached(('top_k', year, k, lowest), compute)
+
+    # 某一年风险评分在 [low, high] 内的股票（按评分升序），端点为 None 时不限，给定时必须是有限的数
+    def score_range(self, year=None, low=None, high=None):
+        for bound in (low, high):
+            if bound is not None and not math.isfinite(bound):
+                raise ValueError(f"评分区间的端点必须是有限的数: {bound}")
+        def compute(snapshot):
+            resolved = self._resolve_year(snapshot, year)
+            year_records = snapshot.by_year.get(resolved, ())
+            scores = snapshot.scores_by_year.get(resolved, [])
+            start = 0 if low is None else bisect.bisect_left(scores, low)
+            stop = len(scores) if high is None else bisect.bisect_right(scores, high)
+            return year_records[start:stop]
+        return self._cached(('score_range', year, low, high), compute)
+
+    @staticmethod
+    def _resolve_year(snapshot, year):
+        if year is None:
+            return snapshot.years[-1] if snapshot.years else None
+        return int(year)
+
+
+# 记录转为可以序列化为 JSON 的字典（NaN 转为 null）
+def _record_dict(record):
+    if record is None:
+        return None
+    return {key: (None if isinstance(value, float) and math.isnan(value) else value)
+            for key, value in record._asdict().items()}
+
+
+def _optional_float(query, name):
+    return float(query[name]) if name in query else None
+
+
+# 按路径分发查询，返回 (状态码, 响应对象)
+def handle_query(index, path, query):
+    if path == '/health':
+        return 200, {'status': 'ok', 'years': index.years, 'reloads': index.reloads}
+    if path == '/score':
+        return 200, _record_dict(index.get(query['code'], query['year']))
+    if path == '/scores':
+        codes = [code for code in query['codes'].split(',') if code]
+        return 200, [_record_dict(record) for record in index.get_many((code, query['year']) for code in codes)]
+    if path == '/top':
+        records = index.top_k(query.get('year'), int(query.get('k', 20)), query.get('order', 'lowest') == 'lowest')
+        return 200, [_record_dict(record) for record in records]
+    if path == '/range':
+        records = index.score_range(query.get('year'), _optional_float(query, 'low'), _optional_float(query, 'high'))
+        return 200, [_record_dict(record) for record in records]
+    return 404, {'error': f'未知的路径: {path}'}
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+# 处理一个连接上的请求（HTTP/1.1，只支持 GET，默认保持连接）
+async def _handle_connection(index, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                status, body = 400, {'error': '请求行格式错误'}
+            elif parts[0] != 'GET':
+                status, body = 405, {'error': '只支持 GET 请求'}
+            else:
+                url = urlsplit(parts[1])
+                query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                try:
+                    status, body = handle_query(index, url.path, query)
+                except (KeyError, ValueError) as exc:
+                    status, body = 400, {'error': f'参数错误: {exc}'}
+
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+# 启动查询服务：GET /score?code=&year=、/scores?codes=a,b&year=、/top?year=&k=&order=lowest|highest、
+# /range?year=&low=&high=、/health，返回 JSON
+async def serve(index, host=HOST, port=PORT):
+    server = await asyncio.start_server(lambda reader, writer: _handle_connection(index, reader, writer), host, port)
+    print(f"风险评分查询服务已启动: http://{host}:{port}/")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else RISK_SCORE_FILE
+    asyncio.run(serve(RiskScoreIndex(path)))
@@ -1,8 +1,13 @@
 import pandas as pd
 import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.kdata_cache import load_kdata
 
 # 读取数据
-df = pd.read_csv('./data/hs300stocks_kdata_2024.csv')
+df = load_kdata(2024, './data/')
 
 # 转换日期为标准日期格式
 df['time'] = pd.to_datetime(df['time'])
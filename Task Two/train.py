@@ -1,13 +1,31 @@
 import pandas as pd
+import numpy as np
 import glob
+import os
+import sys
 from sklearn.linear_model import LinearRegression
 
-# 用于存储年度合并数据和训练数据
-all_data = []
-training_data = []
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import instrument
+
+FEATURES = ["Alpha", "Beta", "SharpeRatio", "Volatility"]
+
+# 训练方式：pooled 为全部年份合并训练（样本内评分）；
+# expanding / rolling 为逐年样本外训练，只使用之前（全部 / 最近 rolling_window 个）年份的数据
+training_mode = "pooled"
+rolling_window = 3
+
+
+# 读取某一年的因子数据并合并
+@instrument()
+def load_year_factors(year):
+    # 因子引擎（factor_engine.py）输出的合并文件优先
+    factors_file = f"factors/factors_{year}.csv"
+    if os.path.exists(factors_file):
+        merged_df = pd.read_csv(factors_file)[["StockCode", "Alpha", "Beta", "SharpeRatio", "Volatility", "Return"]]
+        merged_df["Year"] = year
+        return merged_df
 
-# 遍历2014-2024年
-for year in range(2014, 2025):
     # 定义文件路径
     alpha_file = f"alpha_coefficients/alpha_coefficients_{year}.csv"
     beta_file = f"beta_coefficients/beta_coefficients_{year}.csv"
@@ -33,50 +51,116 @@ for year in range(2014, 2025):
     
     # 添加年份列
     merged_df["Year"] = year
-    
-    # 将数据添加到训练集列表
-    training_data.append(merged_df[["Alpha", "Beta", "SharpeRatio", "Volatility", "Return"]])
-    
-    # 将合并的数据存储
-    all_data.append(merged_df)
-
-# 合并所有年份的训练数据
-training_df = pd.concat(training_data, ignore_index=True)
-
-# 分割特征和目标值
-X = training_df[["Alpha", "Beta", "SharpeRatio", "Volatility"]]
-y = training_df["Return"]
-
-# 使用线性回归训练权重
-model = LinearRegression()
-model.fit(X, y)
-
-# 获取训练得到的权重
-weights = {
-    "Alpha": model.coef_[0],
-    "Beta": model.coef_[1],
-    "SharpeRatio": model.coef_[2],
-    "Volatility": model.coef_[3]
-}
-
-print("训练得到的权重:", weights)
-
-# 用训练好的权重计算每只股票的风险评分
-final_results = []
-
-for year_data in all_data:
-    # 计算风险评分
-    year_data["RiskScore"] = (
-        year_data["Alpha"] * weights["Alpha"] +
-        year_data["Beta"] * weights["Beta"] +
-        year_data["SharpeRatio"] * weights["SharpeRatio"] +
-        year_data["Volatility"] * weights["Volatility"]
-    )
-    final_results.append(year_data)
-
-# 合并所有年份的风险评分数据
-final_data = pd.concat(final_results, ignore_index=True)
-
-# 保存最终结果到新文件
-final_data.to_csv("trained_risk_assessment_results_2014_2024.csv", index=False)
-print("风险评估结果已保存到 'trained_risk_assessment_results_2014_2024.csv'")
+    return merged_df
+
+
+# 使用线性回归训练权重；含缺失值（或非有限值）的样本不参与训练，与 year_accumulator 一致
+@instrument()
+def train_weights(training_df):
+    columns = FEATURES + ["Return"]
+    training_df = training_df[np.isfinite(training_df[columns].to_numpy(dtype=float)).all(axis=1)]
+
+    # 分割特征和目标值
+    X = training_df[FEATURES]
+    y = training_df["Return"]
+
+    model = LinearRegression()
+    model.fit(X, y)
+
+    # 获取训练得到的权重
+    return dict(zip(FEATURES, model.coef_))
+
+
+# 某一年的正规方程累加量 (XᵀX, Xᵀy)，X 的第一列为截距；含缺失值的样本不参与训练
+def year_accumulator(year_data):
+    X = year_data[FEATURES].to_numpy(dtype=float)
+    y = year_data["Return"].to_numpy(dtype=float)
+    valid = np.isfinite(X).all(axis=1) & np.isfinite(y)
+    X = np.column_stack([np.ones(valid.sum()), X[valid]])
+    return X.T @ X, X.T @ y[valid]
+
+
+# 每年一组累加量，新增一年只需计算这一年的累加量
+def year_accumulators(all_data):
+    return {int(year_data["Year"].iloc[0]): year_accumulator(year_data) for year_data in all_data}
+
+
+# 由累加量求解回归系数（不含截距），与 LinearRegression 的结果一致
+def solve_weights(xtx, xty):
+    coef = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+    return dict(zip(FEATURES, coef[1:]))
+
+
+# 逐年样本外权重：每一年只用之前年份的累加量求解，window 为 None 时使用全部之前年份（扩展窗口），
+# 否则只用最近 window 年（滚动窗口）；累加量逐年加减，每年的更新代价为 O(k²)
+@instrument()
+def walk_forward_weights(accumulators, window=None):
+    years = sorted(accumulators)
+    k = len(FEATURES) + 1
+    xtx = np.zeros((k, k))
+    xty = np.zeros(k)
+
+    weights = {}
+    for i, year in enumerate(years):
+        # 样本数不少于参数个数时才求解
+        if xtx[0, 0] >= k:
+            weights[year] = solve_weights(xtx, xty)
+
+        xtx += accumulators[year][0]
+        xty += accumulators[year][1]
+        if window is not None and i >= window:
+            xtx -= accumulators[years[i - window]][0]
+            xty -= accumulators[years[i - window]][1]
+
+    weights = pd.DataFrame.from_dict(weights, orient="index", columns=FEATURES)
+    weights.index.name = "Year"
+    return weights
+
+
+# 用训练好的权重计算每只股票的风险评分：所有年份堆叠后一次矩阵乘法
+# weights 为字典时所有年份使用同一组权重，为按年份索引的 DataFrame 时每年使用各自的权重
+@instrument()
+def calculate_risk_scores(all_data, weights):
+    final_data = pd.concat(all_data, ignore_index=True)
+    X = final_data[FEATURES].to_numpy(dtype=float)
+
+    if isinstance(weights, pd.DataFrame):
+        W = weights.reindex(final_data["Year"])[FEATURES].to_numpy(dtype=float)
+        final_data["RiskScore"] = np.einsum("ij,ij->i", X, W)
+    else:
+        final_data["RiskScore"] = X @ np.array([weights[feature] for feature in FEATURES])
+    return final_data
+
+
+def main():
+    # 遍历2014-2024年，存储年度合并数据
+    all_data = [load_year_factors(year) for year in range(2014, 2025)]
+
+    if training_mode != "pooled":
+        window = rolling_window if training_mode == "rolling" else None
+        weights = walk_forward_weights(year_accumulators(all_data), window)
+        print("逐年样本外训练得到的权重:")
+        print(weights)
+        weights.to_csv(f"walk_forward_weights_{training_mode}.csv")
+
+        final_data = calculate_risk_scores(all_data, weights)
+        output_file = f"walk_forward_risk_assessment_results_{training_mode}_2014_2024.csv"
+        final_data.to_csv(output_file, index=False)
+        print(f"样本外风险评估结果已保存到 '{output_file}'")
+        return
+
+    # 合并所有年份的训练数据
+    training_df = pd.concat([df[FEATURES + ["Return"]] for df in all_data], ignore_index=True)
+
+    weights = train_weights(training_df)
+    print("训练得到的权重:", weights)
+
+    final_data = calculate_risk_scores(all_data, weights)
+
+    # 保存最终结果到新文件
+    final_data.to_csv("trained_risk_assessment_results_2014_2024.csv", index=False)
+    print("风险评估结果已保存到 'trained_risk_assessment_results_2014_2024.csv'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from common.rolling_metrics import rolling_max_drawdown, rolling_metrics
+
+# 允许的最大绝对误差
+TOLERANCE = 1e-10
+
+
+# 随机收益率矩阵（含缺失值与停牌段）
+def make_returns(num_dates, num_columns, seed=0, missing=0.05):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.02, size=(num_dates, num_columns))
+    returns[rng.random(returns.shape) < missing] = np.nan
+    if num_dates > 30:
+        returns[10:25, 0] = np.nan
+    return pd.DataFrame(returns, index=pd.bdate_range('2020-01-01', periods=num_dates))
+
+
+# 逐个窗口直接计算的最大回撤：净值从窗口开始时的1出发，缺失的收益率按0处理
+def brute_force_max_drawdown(returns, window):
+    returns = np.nan_to_num(np.asarray(returns, dtype=float))
+    drawdown = np.zeros_like(returns)
+    for end in range(len(returns)):
+        window_returns = returns[max(0, end - window + 1):end + 1]
+        wealth = np.vstack([np.ones(returns.shape[1]), np.cumprod(1 + window_returns, axis=0)])
+        drawdown[end] = (1 - wealth / np.maximum.accumulate(wealth, axis=0)).max(axis=0)
+    return drawdown
+
+
+# 用 pandas rolling 计算的波动率、夏普比率与累计收益率
+def pandas_metrics(returns, window, risk_free_rate_daily, min_periods):
+    rolling = returns.rolling(window, min_periods=min_periods)
+    volatility = rolling.std()
+    return {
+        'Volatility': volatility,
+        'SharpeRatio': (rolling.mean() - risk_free_rate_daily) / volatility,
+        'TotalReturn': np.expm1(np.log1p(returns).rolling(window, min_periods=min_periods).sum()),
+        'Observations': returns.notna().astype(float).rolling(window, min_periods=1).sum(),
+    }
+
+
+def check_max_drawdown():
+    worst = 0.0
+    for num_dates, window in [(1, 5), (37, 1), (37, 5), (60, 7), (60, 60), (60, 100), (253, 20)]:
+        returns = make_returns(num_dates, 6, seed=num_dates + window)
+        error = np.abs(rolling_max_drawdown(returns, window).to_numpy() - brute_force_max_drawdown(returns, window))
+        worst = max(worst, float(error.max()))
+    return worst
+
+
+def check_metrics():
+    worst = 0.0
+    for window, min_periods in [(5, None), (20, None), (20, 10), (60, 2)]:
+        returns = make_returns(250, 8, seed=window)
+        result = rolling_metrics(returns, window, risk_free_rate_daily=1e-4, min_periods=min_periods)
+        expected = pandas_metrics(returns, window, 1e-4, window if min_periods is None else max(min_periods, 1))
+        for name, values in expected.items():
+            actual = result[name].to_numpy()
+            values = values.to_numpy()
+            if not np.array_equal(np.isnan(actual), np.isnan(values)):
+                raise AssertionError(f"{name}（窗口 {window}）的缺失位置与 pandas 不一致")
+            worst = max(worst, float(np.nanmax(np.abs(actual - values), initial=0.0)))
+        drawdown = np.where(np.isnan(result['MaxDrawdown']), 0.0, result['MaxDrawdown'])
+        expected_drawdown = np.where(np.isnan(result['MaxDrawdown']), 0.0, brute_force_max_drawdown(returns, window))
+        worst = max(worst, float(np.abs(drawdown - expected_drawdown).max()))
+    return worst
+
+
+# 与直接计算（最大回撤）和 pandas rolling（波动率、夏普比率、累计收益率）比较，误差超过 TOLERANCE 时以非0状态退出
+def main():
+    failed = False
+    for name, check in [('rolling_max_drawdown', check_max_drawdown), ('rolling_metrics', check_metrics)]:
+        worst = check()
+        failed |= worst > TOLERANCE
+        print(f"{name:<25} 最大误差 {worst:.3e}  {'通过' if worst <= TOLERANCE else '失败'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
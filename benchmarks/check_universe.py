@@ -0,0 +1,83 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from common.panel import Panel
+from common.universe import Universe
+
+
+# 每年的成分股表：从股票池中随机抽取，其中一年留空（区间之间有间隔），并有一行重复的代码（保留最后一行）
+def make_stock_info(years, pool_size=40, num_members=25, seed=0):
+    rng = np.random.default_rng(seed)
+    pool = np.array([f'code.{i:04d}' for i in range(pool_size)], dtype=object)
+    stock_info = {}
+    for year in years:
+        if year == years[len(years) // 2]:
+            continue
+        codes = rng.choice(pool, num_members, replace=False)
+        frame = pd.DataFrame({'code': codes, 'weight': rng.random(num_members)})
+        duplicate = frame.iloc[[0]].assign(weight=rng.random())
+        stock_info[year] = pd.concat([frame, duplicate], ignore_index=True)
+    return pool, stock_info
+
+
+# 直接按日期所在年份查找成分股表得到的成员资格与权重
+def brute_force(stock_info, dates, codes):
+    member = np.zeros((len(dates), len(codes)), dtype=bool)
+    weight = np.full((len(dates), len(codes)), np.nan)
+    for row, date in enumerate(dates):
+        if date.year not in stock_info:
+            continue
+        weights = stock_info[date.year].drop_duplicates('code', keep='last').set_index('code')['weight']
+        positions = pd.Index(codes).get_indexer(weights.index)
+        member[row, positions[positions >= 0]] = True
+        weight[row, positions[positions >= 0]] = weights.to_numpy()[positions >= 0]
+    return member, weight
+
+
+# 与逐日查找成分股表的结果逐个比较，包括未知代码、所有区间之外的日期与年份交界，以及成对查询与面板
+def main():
+    years = list(range(2014, 2020))
+    pool, stock_info = make_stock_info(years)
+    universe = Universe.from_frames(stock_info)
+
+    dates = pd.DatetimeIndex(sorted(set(pd.date_range('2013-12-20', '2020-01-10', freq='3D'))
+                                    | {pd.Timestamp(year, 1, 1) for year in range(2013, 2022)}
+                                    | {pd.Timestamp(year, 12, 31) for year in range(2013, 2021)}
+                                    | {pd.Timestamp(year, 12, 31, 15) for year in years}))
+    codes = list(pool) + ['unknown.0001', 'unknown.0002']
+    expected_member, expected_weight = brute_force(stock_info, dates, codes)
+
+    checks = {}
+    checks['membership'] = np.array_equal(universe.membership(dates, codes), expected_member)
+    weight = universe.weight_matrix(dates, codes)
+    checks['weight_matrix'] = np.array_equal(weight, expected_weight, equal_nan=True)
+
+    pair_dates = np.repeat(dates, len(codes))
+    pair_codes = np.tile(np.array(codes, dtype=object), len(dates))
+    member, weight = universe.lookup(pair_dates, pair_codes)
+    checks['lookup'] = (np.array_equal(member.reshape(expected_member.shape), expected_member)
+                        and np.array_equal(weight.reshape(expected_weight.shape), expected_weight, equal_nan=True))
+
+    checks['members'] = all(
+        set(universe.members(date).index) == set(np.array(codes)[expected_member[row]]) for row, date in enumerate(dates))
+
+    close = np.where(np.random.default_rng(1).random((len(dates), len(codes))) < 0.1, np.nan, 1.0)
+    panel = universe.apply(Panel(dates, codes, {'close': close}, mask=~np.isnan(close)))
+    checks['apply'] = (np.array_equal(panel.mask, ~np.isnan(close) & expected_member)
+                       and np.array_equal(panel['weight'], expected_weight, equal_nan=True))
+
+    checks['empty'] = not Universe.from_frames({}).membership(dates[:3], codes[:3]).any()
+
+    for name, passed in checks.items():
+        print(f"{name:<15} {'通过' if passed else '失败'}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
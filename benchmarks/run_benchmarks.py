@@ -0,0 +1,187 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in (ROOT, os.path.join(ROOT, 'Task One'), os.path.join(ROOT, 'Task Two'), os.path.join(ROOT, 'Task Three')):
+    sys.path.append(folder)
+
+import average_profit
+import factor_engine
+import market_fludity_2
+import market_fluidity
+import market_sentiment
+import portfolio_optimizer
+import train
+from common import kdata_cache
+from synthetic_data import generate_dataset
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+# 单个基准：setup 的耗时不计入，func 接收 setup 的返回值
+class Benchmark:
+    def __init__(self, name, func, setup=None):
+        self.name = name
+        self.func = func
+        self.setup = setup or (lambda: ())
+
+
+# 运行一个基准：先计时 repeat 次（不开启 tracemalloc），再单独运行一次记录峰值内存
+def run_benchmark(benchmark, repeat):
+    timings = []
+    for _ in range(repeat):
+        args = benchmark.setup()
+        start = time.perf_counter()
+        benchmark.func(*args)
+        timings.append(time.perf_counter() - start)
+
+    args = benchmark.setup()
+    tracemalloc.start()
+    benchmark.func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'name': benchmark.name,
+        'wall_time': min(timings),
+        'wall_time_median': float(np.median(timings)),
+        'repeat': repeat,
+        'peak_memory_bytes': peak,
+    }
+
+
+# 各任务中的热点函数
+def build_benchmarks(data_folder, years):
+    for module in (average_profit, market_fludity_2, market_fluidity, market_sentiment):
+        module.data_folder = data_folder
+    first_year = years[0]
+
+    def cold_load():
+        shutil.rmtree(os.path.join(data_folder, kdata_cache.CACHE_DIR_NAME), ignore_errors=True)
+        return ()
+
+    def all_daily_returns():
+        return (pd.concat([average_profit.calculate_daily_returns(average_profit.load_data(year)) for year in years],
+                          ignore_index=True),)
+
+    def all_kdata():
+        return (pd.concat([kdata_cache.load_kdata(year, data_folder, columns=market_sentiment.SENTIMENT_COLUMNS)
+                           for year in years], ignore_index=True),)
+
+    def training_frame():
+        factors = [factor_engine.calculate_year_factors(year, data_folder) for year in years]
+        return (pd.concat(factors, ignore_index=True).rename(columns={'TotalReturn': 'Return'}).dropna(),)
+
+    def optimization_inputs():
+        price_data = kdata_cache.load_kdata(first_year, data_folder, columns=['time', 'code', 'close'])
+        returns = price_data.set_index(['time', 'code'])['close'].unstack().pct_change(fill_method=None).dropna()
+        weights = kdata_cache.load_stock_info(first_year, data_folder).set_index('code')['weight']
+        weights = weights.reindex(returns.columns).fillna(0)
+        return returns, (weights / weights.sum()).values, 0.03
+
+    return [
+        Benchmark('kdata_cache.load_kdata (cold)', lambda: kdata_cache.load_kdata(first_year, data_folder), cold_load),
+        Benchmark('kdata_cache.load_kdata (warm)', lambda: kdata_cache.load_kdata(first_year, data_folder)),
+        Benchmark('average_profit.calculate_daily_returns', average_profit.calculate_daily_returns,
+                  lambda: (average_profit.load_data(first_year),)),
+        Benchmark('average_profit.calculate_daily_average_return', average_profit.calculate_daily_average_return,
+                  all_daily_returns),
+        Benchmark('market_fluidity.calculate_liquidity_index', market_fluidity.calculate_liquidity_index,
+                  lambda: (market_fluidity.load_panel(first_year),)),
+        Benchmark('market_fludity_2.calculate_daily_liquidity_index', market_fludity_2.calculate_daily_liquidity_index,
+                  lambda: (market_fludity_2.load_panel(first_year),)),
+        Benchmark('market_sentiment.calculate_sentiment_indicators', market_sentiment.calculate_sentiment_indicators,
+                  all_kdata),
+        Benchmark('factor_engine.calculate_year_factors',
+                  lambda: factor_engine.calculate_year_factors(first_year, data_folder)),
+        Benchmark('factor_engine.calculate_rolling_regression',
+                  lambda: factor_engine.calculate_rolling_regression(years, data_folder=data_folder)),
+        Benchmark('train.train_weights', train.train_weights, training_frame),
+        Benchmark('portfolio_optimizer.optimize_sharpe', portfolio_optimizer.optimize_sharpe, optimization_inputs),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 与之前的结果文件对比，打印耗时与内存的变化比例
+def compare_results(current, previous_path):
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = {item['name']: item for item in json.load(f)['results']}
+    print(f"\n与 {previous_path} 对比（当前 / 之前）：")
+    for item in current['results']:
+        before = previous.get(item['name'])
+        if before is None:
+            continue
+        print(f"{item['name']:<55} 耗时 x{item['wall_time'] / before['wall_time']:.2f}  "
+              f"内存 x{item['peak_memory_bytes'] / max(before['peak_memory_bytes'], 1):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='各任务热点函数的基准测试')
+    parser.add_argument('--stocks', type=int, default=300)
+    parser.add_argument('--days', type=int, default=250)
+    parser.add_argument('--years', type=int, default=11)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='只运行名称中包含这些字符串的基准')
+    parser.add_argument('--output', help='结果JSON文件路径（默认写入 benchmarks/results/）')
+    parser.add_argument('--compare', help='与之前的结果JSON文件对比')
+    args = parser.parse_args()
+
+    config = {'stocks': args.stocks, 'days': args.days, 'years': args.years}
+    config_name = f'{args.stocks}x{args.days}x{args.years}'
+    years = list(range(2014, 2014 + args.years))
+    data_folder = os.path.join(BENCHMARK_FOLDER, 'data', config_name)
+    if not os.path.exists(os.path.join(data_folder, f'hs300stocks_kdata_{years[-1]}.csv')):
+        print(f"正在生成合成数据 {config_name} ...")
+        generate_dataset(data_folder, args.stocks, args.days, years)
+
+    results = []
+    for benchmark in build_benchmarks(data_folder, years):
+        if args.only and not any(keyword in benchmark.name for keyword in args.only):
+            continue
+        result = run_benchmark(benchmark, args.repeat)
+        results.append(result)
+        print(f"{result['name']:<55} {result['wall_time']:>9.4f} 秒  峰值内存 {result['peak_memory_bytes'] / 2 ** 20:>9.1f} MiB")
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'config': config,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        BENCHMARK_FOLDER, 'results', f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{config_name}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"基准测试结果已保存到 {output}")
+
+    if args.compare:
+        compare_results(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# 生成证券代码：沪市 shse.6xxxxx，深市 szse.00xxxx / szse.30xxxx
+def make_codes(count):
+    codes = []
+    for i in range(count):
+        if i % 2 == 0:
+            codes.append(f'shse.{600000 + i // 2:06d}')
+        elif i % 4 == 1:
+            codes.append(f'szse.{i // 4 + 1:06d}')
+        else:
+            codes.append(f'szse.{300001 + i // 4:06d}')
+    return codes
+
+
+# 生成与比赛数据格式一致的合成数据：
+#   hs300stocks_kdata_{year}.csv —— time, code, open, high, low, close, volume, amount, open_interest
+#   hs300stocks_{year}.csv       —— code, weight
+# 每年的成分股从更大的股票池中抽取（约10%的年度调整），价格为带市场因子的几何布朗运动；
+# 每年取当年最前面的 num_days 个工作日，num_days 超过某一年的工作日数时抛出 ValueError（各年文件的日期不能重叠）
+def generate_dataset(output_folder, num_stocks=300, num_days=250, years=range(2014, 2025),
+                     turnover=0.1, seed=0):
+    business_days = {year: pd.bdate_range(f'{year}-01-01', f'{year}-12-31') for year in years}
+    short_years = {year: len(days) for year, days in business_days.items() if len(days) < num_days}
+    if short_years:
+        raise ValueError(f"num_days={num_days} 超过了这些年份的工作日数: {short_years}")
+    os.makedirs(output_folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    pool_size = int(num_stocks * (1 + turnover * len(years)))
+    pool = np.array(make_codes(pool_size))
+    prices = rng.uniform(3, 80, pool_size)
+    betas = rng.uniform(0.5, 1.5, pool_size)
+    members = rng.choice(pool_size, num_stocks, replace=False)
+
+    for year in years:
+        # 年度成分股调整
+        if year != years[0]:
+            outside = np.setdiff1d(np.arange(pool_size), members)
+            replaced = rng.choice(num_stocks, int(num_stocks * turnover), replace=False)
+            members = members.copy()
+            members[replaced] = rng.choice(outside, len(replaced), replace=False)
+        members = np.sort(members)
+
+        dates = business_days[year][:num_days]
+        market = rng.normal(0.0003, 0.012, num_days)
+        returns = (betas[members] * market[:, None]
+                   + rng.normal(0.0001, 0.018, (num_days, num_stocks)))
+        close = prices[members] * np.cumprod(1 + returns, axis=0)
+        prices[members] = close[-1]
+        prev_close = np.vstack([close[:1] / (1 + returns[:1]), close[:-1]])
+        open_ = prev_close * (1 + rng.normal(0, 0.004, close.shape))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.006, close.shape)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.006, close.shape)))
+        volume = rng.lognormal(15, 0.8, close.shape).astype(np.int64) // 100 * 100
+
+        kdata = pd.DataFrame({
+            'time': np.repeat(dates.strftime('%Y-%m-%d'), num_stocks),
+            'code': np.tile(pool[members], num_days),
+            'open': open_.ravel().round(2),
+            'high': high.ravel().round(2),
+            'low': low.ravel().round(2),
+            'close': close.ravel().round(2),
+            'volume': volume.ravel(),
+            'amount': (volume * (high + low + close) / 3).ravel().round(2),
+            'open_interest': 0,
+        })
+        kdata.to_csv(os.path.join(output_folder, f'hs300stocks_kdata_{year}.csv'), index=False)
+
+        weights = rng.lognormal(0, 1, num_stocks)
+        stock_info = pd.DataFrame({'code': pool[members], 'weight': (weights / weights.sum() * 100).round(4)})
+        stock_info.to_csv(os.path.join(output_folder, f'hs300stocks_{year}.csv'), index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成合成的沪深300成分股数据')
+    parser.add_argument('output_folder')
+    parser.add_argument('--stocks', type=int, default=300)
+    parser.add_argument('--days', type=int, default=250)
+    parser.add_argument('--years', type=int, default=11)
+    parser.add_argument('--start-year', type=int, default=2014)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_dataset(args.output_folder, args.stocks, args.days,
+                     range(args.start_year, args.start_year + args.years), seed=args.seed)
+    print(f"合成数据已保存到 {args.output_folder}")
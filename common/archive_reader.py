@@ -0,0 +1,102 @@
+import os
+import re
+import zipfile
+
+import pandas as pd
+
+from common.kdata_cache import file_hash, file_signature
+
+# 派生结果缓存目录（放在源文件所在目录下）
+DERIVED_CACHE_DIR_NAME = '.derived_cache'
+DERIVED_CACHE_VERSION = 1
+
+
+# 压缩包读取器：成员索引在第一次使用时才建立，成员直接从压缩包流式读入内存，不解压到磁盘
+class ZipArchive:
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self._zip = None
+        self._members = None
+
+    def _archive(self):
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.zip_path, 'r')
+        return self._zip
+
+    # 成员索引：文件名（不含目录） -> 压缩包内的成员信息；不同目录下有同名文件时无法区分，抛出 ValueError
+    @property
+    def members(self):
+        if self._members is None:
+            members = {}
+            duplicates = {}
+            for info in self._archive().infolist():
+                if info.is_dir():
+                    continue
+                name = os.path.basename(info.filename)
+                if name in members:
+                    duplicates.setdefault(name, [members[name].filename]).append(info.filename)
+                members[name] = info
+            if duplicates:
+                raise ValueError(f"压缩包 {self.zip_path} 中有同名文件: {duplicates}")
+            self._members = members
+        return self._members
+
+    # 文件名与正则表达式完全匹配的成员，按文件名排序，返回 (文件名, 匹配结果)
+    def find(self, pattern):
+        pattern = re.compile(pattern)
+        matches = ((name, pattern.fullmatch(name)) for name in sorted(self.members))
+        return [(name, match) for name, match in matches if match]
+
+    def open(self, name):
+        return self._archive().open(self.members[name])
+
+    def read_csv(self, name, **kwargs):
+        with self.open(name) as f:
+            return pd.read_csv(f, **kwargs)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _write_cache(cache_path, cached):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    pd.to_pickle(cached, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+# 以源文件内容为键缓存小型派生结果 compute()：源文件签名（修改时间与大小）一致时直接命中，
+# 签名不一致时比较SHA1，内容未变则刷新签名；name 需要区分不同的派生方式
+def cached_derived(name, source_paths, compute, cache_folder=None):
+    source_paths = [os.path.abspath(path) for path in source_paths]
+    if cache_folder is None:
+        cache_folder = os.path.join(os.path.dirname(source_paths[0]), DERIVED_CACHE_DIR_NAME)
+    cache_path = os.path.join(cache_folder, f'{name}.pkl')
+    signatures = [file_signature(path) for path in source_paths]
+
+    hashes = None
+    if os.path.exists(cache_path):
+        cached = pd.read_pickle(cache_path)
+        if cached.get('version') == DERIVED_CACHE_VERSION:
+            if cached['signatures'] == signatures:
+                return cached['value']
+            hashes = [file_hash(path) for path in source_paths]
+            if cached['hashes'] == hashes:
+                cached['signatures'] = signatures
+                _write_cache(cache_path, cached)
+                return cached['value']
+
+    value = compute()
+    if hashes is None:
+        hashes = [file_hash(path) for path in source_paths]
+    _write_cache(cache_path, {'version': DERIVED_CACHE_VERSION, 'signatures': signatures, 'hashes': hashes,
+                              'value': value})
+    return value
@@ -0,0 +1,138 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common.instrumentation import instrument
+
+PERIODS_PER_YEAR = 252
+# 单个批次中模拟收益率数组占用的内存上限（字节）
+MAX_BATCH_BYTES = 64 * 1024 ** 2
+
+
+# 平稳块自助法（Politis-Romano）的抽样下标：每一步以 1/mean_block_length 的概率开始新块，
+# 块起点均匀抽取，块内下标依次递增并循环回到开头；返回 num_paths×length 的下标矩阵
+def stationary_bootstrap_indices(rng, num_paths, length, num_obs, mean_block_length):
+    new_block = rng.random((num_paths, length)) < 1 / mean_block_length
+    new_block[:, 0] = True
+    starts = rng.integers(0, num_obs, size=(num_paths, length))
+
+    # 每个位置所属块的开始时刻，及该块的起点下标
+    steps = np.arange(length)
+    block_start = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    start_index = np.take_along_axis(starts, block_start, axis=1)
+    return (start_index + steps - block_start) % num_obs
+
+
+# 一批模拟路径的年化收益率、年化波动率、夏普比率和最大回撤
+# returns 为 路径×时间×组合 的日收益率，回撤按净值（初始为1）相对于历史最高净值计算
+def path_metrics(returns, risk_free_rate=0.0, periods_per_year=PERIODS_PER_YEAR):
+    length = returns.shape[1]
+    risk_free_rate_daily = (1 + risk_free_rate) ** (1 / periods_per_year) - 1
+
+    log_wealth = np.cumsum(np.log1p(returns), axis=1)
+    annual_return = np.expm1(log_wealth[:, -1] * periods_per_year / length)
+    std = returns.std(axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe_ratio = (returns.mean(axis=1) - risk_free_rate_daily) / std * np.sqrt(periods_per_year)
+    peak = np.maximum(np.maximum.accumulate(log_wealth, axis=1), 0.0)
+    max_drawdown = -np.expm1(log_wealth - peak).min(axis=1)
+    return {
+        'AnnualReturn': annual_return,
+        'Volatility': std * np.sqrt(periods_per_year),
+        'SharpeRatio': sharpe_ratio,
+        'MaxDrawdown': max_drawdown,
+    }
+
+
+# 在独立的随机数流上模拟一批路径
+def _simulate_batch(series, num_paths, horizon, mean_block_length, risk_free_rate, periods_per_year, seed_sequence):
+    rng = np.random.default_rng(seed_sequence)
+    indices = stationary_bootstrap_indices(rng, num_paths, horizon, len(series), mean_block_length)
+    return path_metrics(series[indices], risk_free_rate, periods_per_year)
+
+
+def _batch_sizes(num_paths, batch_size):
+    sizes = [batch_size] * (num_paths // batch_size)
+    if num_paths % batch_size:
+        sizes.append(num_paths % batch_size)
+    return sizes
+
+
+# 对组合收益率做平稳块自助法模拟，返回每条路径的指标（长表：Path、Portfolio 与各指标）
+# weights 为 N 维向量（一个组合）或 N×K 矩阵（K 个组合），组合的日收益率只计算一次，之后只对 T×K 的序列抽样；
+# 路径分批模拟以限制内存，每批使用由 seed 派生的独立随机数流，结果与进程数无关、可复现；
+# num_paths 与 horizon 至少为1
+@instrument()
+def bootstrap_portfolio(returns, weights, num_paths=10000, horizon=None, mean_block_length=20,
+                        risk_free_rate=0.0, periods_per_year=PERIODS_PER_YEAR, batch_size=None,
+                        n_jobs=None, seed=0):
+    returns_matrix = np.asarray(returns, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    single = weights.ndim == 1
+    series = returns_matrix @ (weights[:, None] if single else weights)
+    if horizon is None:
+        horizon = len(series)
+    if num_paths < 1:
+        raise ValueError(f"num_paths 至少为1: {num_paths}")
+    if horizon < 1:
+        raise ValueError(f"horizon 至少为1: {horizon}")
+
+    # 批次大小：抽样得到的收益率数组及中间结果（约4份）不超过内存上限
+    if batch_size is None:
+        batch_size = max(1, MAX_BATCH_BYTES // (4 * 8 * horizon * series.shape[1]))
+    sizes = _batch_sizes(num_paths, batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(series, size, horizon, mean_block_length, risk_free_rate, periods_per_year, seed_sequence)
+            for size, seed_sequence in zip(sizes, seeds)]
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, len(sizes)))
+    if n_jobs == 1:
+        batches = [_simulate_batch(*batch_args) for batch_args in args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            batches = list(executor.map(_simulate_batch, *zip(*args)))
+
+    metrics = {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+    num_portfolios = series.shape[1]
+    results = pd.DataFrame({name: values.ravel() for name, values in metrics.items()})
+    results.insert(0, 'Portfolio', np.tile(np.arange(num_portfolios), num_paths))
+    results.insert(0, 'Path', np.repeat(np.arange(num_paths), num_portfolios))
+    if single:
+        results = results.drop(columns='Portfolio')
+    return results
+
+
+# 合理收益预期 E(R) = R_f + (R_m - R_f) 的自助法分布：R_m 为抽样得到的年收益率序列的几何平均
+# annual_returns 为历年的市场收益率，mean_block_length=1 时为逐年独立抽样
+@instrument()
+def bootstrap_expected_return(annual_returns, risk_free_rate, num_paths=10000, mean_block_length=1, seed=0):
+    annual_returns = np.asarray(annual_returns, dtype=float)
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    indices = stationary_bootstrap_indices(rng, num_paths, len(annual_returns), len(annual_returns),
+                                           mean_block_length)
+    market_return = np.expm1(np.log1p(annual_returns[indices]).mean(axis=1))
+    risk_premium = market_return - risk_free_rate
+    return pd.DataFrame({
+        'Path': np.arange(num_paths),
+        'MarketReturn': market_return,
+        'RiskPremium': risk_premium,
+        'ExpectedReturn': risk_free_rate + risk_premium,
+    })
+
+
+# 各指标分布的汇总：均值、标准差和分位数（按 group_by 分组）
+def summarize_distribution(results, quantiles=(0.05, 0.5, 0.95), group_by=None):
+    metrics = [c for c in results.columns if c not in ('Path', 'Portfolio')]
+    grouped = results.groupby(group_by)[metrics] if group_by else results[metrics]
+    summary = {'Mean': grouped.mean(), 'Std': grouped.std()}
+    for q in quantiles:
+        summary[f'Q{q * 100:g}'] = grouped.quantile(q)
+    if group_by:
+        return pd.concat(summary, axis=1).swaplevel(axis=1).sort_index(axis=1)
+    summary = pd.DataFrame(summary)
+    summary.index.name = 'Metric'
+    return summary.reset_index()
@@ -0,0 +1,247 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# 分阶段计时与内存统计（默认关闭）
+# 设置环境变量 STAGE_TRACE=1 或调用 enable() 后开启，STAGE_TRACE_PROFILE=1 时每个阶段额外用 cProfile 采样；
+# 运行结束时写出 {run_id}.json（各阶段记录）与 {run_id}.trace.json（Chrome trace，可在 chrome://tracing 或 Perfetto 中打开）
+TRACE_ENV = 'STAGE_TRACE'
+PROFILE_ENV = 'STAGE_TRACE_PROFILE'
+TRACE_FOLDER_ENV = 'STAGE_TRACE_FOLDER'
+TRACE_FOLDER = './traces/'
+# cProfile 汇总中保留的函数个数
+PROFILE_TOP = 20
+
+
+class _State:
+    def __init__(self):
+        self.enabled = os.environ.get(TRACE_ENV, '') not in ('', '0')
+        self.profile = os.environ.get(PROFILE_ENV, '') not in ('', '0')
+        self.output_folder = os.environ.get(TRACE_FOLDER_ENV, TRACE_FOLDER)
+        self.run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.records = []
+        self.stack = []
+        self.profiling = False
+        self.main_pid = os.getpid()
+        self.registered = False
+
+
+_state = _State()
+
+
+# 开启统计；子进程通过环境变量继承同样的设置
+def enable(profile=False, output_folder=TRACE_FOLDER):
+    _state.enabled = True
+    _state.profile = profile
+    _state.output_folder = output_folder
+    os.environ[TRACE_ENV] = '1'
+    os.environ[PROFILE_ENV] = '1' if profile else '0'
+    os.environ[TRACE_FOLDER_ENV] = output_folder
+    _register_exit()
+
+
+def disable():
+    _state.enabled = False
+    os.environ[TRACE_ENV] = '0'
+
+
+def is_enabled():
+    return _state.enabled
+
+
+# 行数：DataFrame、Series、数组取长度，元组取第一个元素的行数，其余返回 None
+def count_rows(value):
+    if isinstance(value, tuple):
+        return count_rows(value[0]) if value else None
+    if hasattr(value, 'shape') and getattr(value, 'ndim', 0) > 0:
+        return int(value.shape[0])
+    return None
+
+
+# 一个阶段的记录；在 with 语句中可以设置 rows_out 等字段
+class StageRecord(dict):
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+# 记录一个阶段的耗时、CPU时间、行数和内存峰值（tracemalloc，相对于阶段开始时的已分配内存）
+@contextmanager
+def stage(name, rows_in=None, profile=None):
+    if not _state.enabled:
+        yield StageRecord()
+        return
+
+    _register_exit()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    current, peak = tracemalloc.get_traced_memory()
+    # 嵌套阶段会重置峰值，先把目前为止的峰值记到外层阶段上
+    if _state.stack:
+        _state.stack[-1]['_peak'] = max(_state.stack[-1]['_peak'], peak)
+    tracemalloc.reset_peak()
+
+    record = StageRecord(name=name, pid=os.getpid(), depth=len(_state.stack), rows_in=rows_in, rows_out=None)
+    record['_start_memory'] = current
+    record['_peak'] = current
+    _state.stack.append(record)
+
+    # cProfile 不能嵌套，只对最外层需要采样的阶段开启
+    profiler = None
+    if (_state.profile if profile is None else profile) and not _state.profiling:
+        profiler = cProfile.Profile()
+        _state.profiling = True
+
+    record['start'] = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException as exc:
+        record['error'] = f'{type(exc).__name__}: {exc}'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _state.profiling = False
+        record['wall_time'] = time.perf_counter() - wall_start
+        record['cpu_time'] = time.process_time() - cpu_start
+
+        _state.stack.pop()
+        peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+        record['peak_memory'] = peak - record.pop('_start_memory')
+        if _state.stack:
+            _state.stack[-1]['_peak'] = max(_state.stack[-1]['_peak'], peak)
+        if profiler is not None:
+            record['profile'] = _write_profile(profiler, name)
+        _state.records.append(dict(record))
+
+
+# 将 cProfile 结果保存为 .prof 文件，并返回累计耗时最多的函数
+def _write_profile(profiler, name):
+    os.makedirs(_state.output_folder, exist_ok=True)
+    safe_name = ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+    path = os.path.join(_state.output_folder, f'{_state.run_id}-{os.getpid()}-{len(_state.records)}-{safe_name}.prof')
+    profiler.dump_stats(path)
+    stats = pstats.Stats(profiler)
+    top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+    return {
+        'file': path,
+        'top': [{'function': f'{filename}:{line}({function})', 'calls': calls, 'total_time': total,
+                 'cumulative_time': cumulative}
+                for (filename, line, function), (_, calls, total, cumulative, _) in top],
+    }
+
+
+# 阶段名：定义函数的文件名加函数名（脚本直接运行时模块名为 __main__，因此不用模块名）
+def stage_name(func):
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return getattr(func, '__qualname__', repr(func))
+    return f'{os.path.splitext(os.path.basename(code.co_filename))[0]}.{func.__qualname__}'
+
+
+# 装饰器：把函数的一次调用记为一个阶段，输入行数取第一个有行数的位置参数，输出行数取返回值
+def instrument(name=None):
+    def decorator(func):
+        full_name = name or stage_name(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            rows_in = next((rows for rows in map(count_rows, args) if rows is not None), None)
+            with stage(full_name, rows_in=rows_in) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+# 取出并清空本进程的记录（子进程把记录随结果返回给主进程）
+def drain():
+    records = _state.records
+    _state.records = []
+    return records
+
+
+# 合并子进程返回的记录
+def merge(records):
+    _state.records.extend(records)
+
+
+def records():
+    return list(_state.records)
+
+
+# Chrome trace 格式：每个阶段一个完整事件（ph='X'），时间单位为微秒
+def chrome_trace(stage_records):
+    events = []
+    for record in stage_records:
+        args = {key: value for key, value in record.items() if key not in ('name', 'pid', 'start', 'wall_time')}
+        events.append({
+            'name': record['name'],
+            'ph': 'X',
+            'ts': record['start'] * 1e6,
+            'dur': record['wall_time'] * 1e6,
+            'pid': record['pid'],
+            'tid': record['pid'],
+            'args': args,
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+# 写出本次运行的记录与 Chrome trace，返回两个文件的路径
+def write_trace(output_folder=None):
+    output_folder = output_folder or _state.output_folder
+    os.makedirs(output_folder, exist_ok=True)
+    stage_records = sorted(_state.records, key=lambda record: record['start'])
+    report_path = os.path.join(output_folder, f'{_state.run_id}.json')
+    trace_path = os.path.join(output_folder, f'{_state.run_id}.trace.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'run_id': _state.run_id, 'argv': sys.argv, 'stages': stage_records}, f, ensure_ascii=False,
+                  indent=2, default=str)
+    with open(trace_path, 'w', encoding='utf-8') as f:
+        json.dump(chrome_trace(stage_records), f, ensure_ascii=False, default=str)
+    return report_path, trace_path
+
+
+# 各阶段的汇总：调用次数、总耗时、CPU时间与最大内存峰值，按总耗时排序
+def summary(stage_records=None):
+    totals = {}
+    for record in stage_records if stage_records is not None else _state.records:
+        total = totals.setdefault(record['name'], {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0,
+                                                   'peak_memory': 0})
+        total['calls'] += 1
+        total['wall_time'] += record['wall_time']
+        total['cpu_time'] += record['cpu_time']
+        total['peak_memory'] = max(total['peak_memory'], record['peak_memory'])
+    return sorted(totals.items(), key=lambda item: item[1]['wall_time'], reverse=True)
+
+
+def _write_at_exit():
+    if _state.enabled and _state.records and os.getpid() == _state.main_pid:
+        report_path, trace_path = write_trace()
+        print(f"阶段统计已保存到 '{report_path}' 与 '{trace_path}'")
+
+
+def _register_exit():
+    if not _state.registered:
+        atexit.register(_write_at_exit)
+        _state.registered = True
@@ -0,0 +1,136 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.archive_reader import DERIVED_CACHE_DIR_NAME, cached_derived
+from common.instrumentation import instrument
+
+# 分钟线文件：data_folder 下的 hs300stocks_minute_{year}*.csv（可以按月或按证券拆分为多个文件）
+INTRADAY_PATTERN = 'hs300stocks_minute_{year}*.csv'
+INTRADAY_COLUMNS = ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'amount']
+INTRADAY_VERSION = 1
+
+# 每次读入内存的分钟线行数
+CHUNK_ROWS = 1_000_000
+
+# 每日汇总中按 (日期, 证券) 求和的列，以及取第一个、最后一个、最大、最小值的列
+_SUM_COLUMNS = ['volume', 'amount', 'money_flow', 'realized_variance', 'bars', 'amihud_sum', 'amihud_bars']
+_AGGREGATIONS = dict({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'},
+                     **{column: 'sum' for column in _SUM_COLUMNS})
+
+
+# 分钟线的流式汇总：逐块把分钟线折叠为每个 (日期, 证券) 的成交量、成交额、典型价格资金流、已实现方差等，
+# 内存只与块大小和交易日×证券数有关，与分钟线的行数无关。
+# 每只证券的分钟线需要按时间顺序出现（文件之间、块之间也是如此），跨块时用上一块最后的收盘价接续
+class IntradayAggregator:
+    def __init__(self):
+        self._partials = []
+        # 每只证券最后一根分钟线的日期与收盘价
+        self._last_day = pd.Series(dtype='datetime64[ns]')
+        self._last_close = pd.Series(dtype=float)
+
+    # 加入一块分钟线（time、code、open、high、low、close、volume、amount）
+    def add(self, bars):
+        if bars.empty:
+            return
+        time = pd.to_datetime(bars['time'])
+        if getattr(time.dt, 'tz', None) is not None:
+            time = time.dt.tz_localize(None)
+        bars = pd.DataFrame({
+            'day': time.dt.normalize(),
+            'code': bars['code'].astype(str),
+            'time': time,
+            **{column: bars[column].to_numpy(dtype=float) for column in INTRADAY_COLUMNS[2:]},
+        })
+        bars = bars.sort_values(['code', 'time'], kind='mergesort').reset_index(drop=True)
+
+        # 分钟收益率：相对于同一证券同一天上一根分钟线的收盘价，每天第一根相对于自己的开盘价
+        prev_close = bars['close'].shift(1)
+        prev_same_day = (bars['code'].shift(1) == bars['code']) & (bars['day'].shift(1) == bars['day'])
+        prev_close = prev_close.where(prev_same_day, bars['open'])
+        first_rows = np.flatnonzero(~bars['code'].duplicated().to_numpy())
+        first_codes = bars['code'].to_numpy()[first_rows]
+        carried = self._last_day.reindex(first_codes).to_numpy() == bars['day'].to_numpy()[first_rows]
+        prev_close.iloc[first_rows[carried]] = self._last_close.reindex(first_codes[carried]).to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_return = np.log(bars['close'] / prev_close)
+            abs_return_per_amount = (bars['close'] / prev_close - 1).abs() / bars['amount']
+        traded = bars['amount'] > 0
+
+        bars['money_flow'] = (bars['high'] + bars['low'] + bars['close']) / 3 * bars['volume']
+        bars['realized_variance'] = log_return.pow(2).fillna(0.0)
+        bars['bars'] = 1
+        bars['amihud_sum'] = abs_return_per_amount.where(traded & np.isfinite(abs_return_per_amount), 0.0)
+        bars['amihud_bars'] = (traded & np.isfinite(abs_return_per_amount)).astype(int)
+        self._partials.append(bars.groupby(['day', 'code'], sort=False).agg(_AGGREGATIONS))
+
+        last = bars.groupby('code', sort=False).tail(1).set_index('code')
+        self._last_day = last['day'].combine_first(self._last_day)
+        self._last_close = last['close'].combine_first(self._last_close)
+
+        # 部分结果累计到一定数量时先合并一次，使内存保持在交易日×证券数的量级
+        if len(self._partials) >= 16:
+            self._partials = [self._combine()]
+
+    def _combine(self):
+        return pd.concat(self._partials).groupby(level=['day', 'code'], sort=False).agg(_AGGREGATIONS)
+
+    # 逐块读取一个分钟线文件
+    def add_file(self, path, chunk_rows=CHUNK_ROWS):
+        for chunk in pd.read_csv(path, usecols=INTRADAY_COLUMNS, chunksize=chunk_rows):
+            self.add(chunk)
+
+    # 每日汇总结果（长表，按日期、证券代码排序），列与日线行情一致（time、code、open、high、low、close、
+    # volume、amount），另有 money_flow（分钟典型价格×成交量之和）、realized_variance（分钟对数收益率平方和）、
+    # bars（分钟线根数）与 amihud（分钟 |收益率|/成交额 的平均值）
+    def result(self):
+        if not self._partials:
+            return pd.DataFrame(columns=INTRADAY_COLUMNS + ['money_flow', 'realized_variance', 'bars', 'amihud'])
+        daily = self._combine().sort_index().reset_index().rename(columns={'day': 'time'})
+        with np.errstate(divide='ignore', invalid='ignore'):
+            daily['amihud'] = (daily['amihud_sum'] / daily['amihud_bars']).where(daily['amihud_bars'] > 0)
+        daily['bars'] = daily['bars'].astype(np.int64)
+        return daily.drop(columns=['amihud_sum', 'amihud_bars'])
+
+
+def intraday_paths(year, data_folder):
+    return sorted(glob.glob(os.path.join(data_folder, INTRADAY_PATTERN.format(year=year))))
+
+
+# 把一组分钟线文件汇总为每日数据
+@instrument()
+def aggregate_intraday(paths, chunk_rows=CHUNK_ROWS):
+    aggregator = IntradayAggregator()
+    for path in paths:
+        aggregator.add_file(path, chunk_rows)
+    return aggregator.result()
+
+
+# 读取某一年分钟线的每日汇总（按源文件内容缓存，每年只汇总一次），可直接代替日线行情传给流动性与情绪指标的计算
+def load_intraday_daily(year, data_folder, chunk_rows=CHUNK_ROWS):
+    paths = intraday_paths(year, data_folder)
+    if not paths:
+        raise FileNotFoundError(f"{data_folder} 中没有{year}年的分钟线文件 {INTRADAY_PATTERN.format(year=year)}")
+    return cached_derived(f'intraday_daily_v{INTRADAY_VERSION}_{year}', paths,
+                          lambda: aggregate_intraday(paths, chunk_rows),
+                          cache_folder=os.path.join(data_folder, DERIVED_CACHE_DIR_NAME))
+
+
+# 基于分钟线的每日指标：
+# RealizedVIX 各证券已实现波动率 sqrt(Σ r²) 的截面平均值（代替日线的截面标准差）；
+# Amihud 各证券分钟 |收益率|/成交额 的截面平均值（非流动性，越大流动性越差）；
+# DailyAmihud 各证券 |日收益率|/日成交额 的截面平均值（日收益率相对于前一交易日的收盘价）
+def intraday_indicators(daily):
+    daily = daily.sort_values(['code', 'time'], kind='mergesort')
+    prev_close = daily.groupby('code', sort=False)['close'].shift(1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_amihud = ((daily['close'] / prev_close - 1).abs() / daily['amount']).where(daily['amount'] > 0)
+    indicators = pd.DataFrame({
+        'Date': daily['time'],
+        'RealizedVIX': np.sqrt(daily['realized_variance']),
+        'Amihud': daily['amihud'],
+        'DailyAmihud': daily_amihud,
+    }).groupby('Date', sort=True).mean()
+    return indicators.reset_index()
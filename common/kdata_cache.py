@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.instrumentation import instrument
+
+# 缓存目录与清单文件名（缓存放在源CSV所在目录下，供各个任务共享）
+CACHE_DIR_NAME = '.kdata_cache'
+MANIFEST_NAME = 'manifest.json'
+CACHE_VERSION = 3
+
+# 构建缓存与分块读取时每块的行数
+CHUNK_ROWS = 1_000_000
+
+# 紧凑模式下各列的类型：价格用 float32，成交量用整数
+COMPACT_DTYPES = {
+    'open': np.float32,
+    'high': np.float32,
+    'low': np.float32,
+    'close': np.float32,
+    'volume': np.int64,
+    'open_interest': np.int64,
+}
+
+
+# 源文件签名：修改时间与文件大小
+def file_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+# 计算源文件的SHA1，用于在修改时间变化但内容未变时避免重建缓存
+def file_hash(path, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _cache_dir(csv_path):
+    folder, file_name = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(folder, CACHE_DIR_NAME, os.path.splitext(file_name)[0])
+
+
+def _read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(cache_dir, manifest):
+    # 先写临时文件再替换，保证清单总是完整的
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+# 检查缓存是否有效：签名一致直接命中；签名不一致时比较哈希，内容未变则刷新签名
+def _valid_manifest(csv_path, cache_dir):
+    manifest = _read_manifest(cache_dir)
+    if manifest is None or manifest.get('version') != CACHE_VERSION:
+        return None
+
+    signature = file_signature(csv_path)
+    if manifest['source'] == signature:
+        return manifest
+
+    if manifest['sha1'] != file_hash(csv_path):
+        return None
+    manifest['source'] = signature
+    _write_manifest(cache_dir, manifest)
+    return manifest
+
+
+# 后续分块的数值类型与第一块不一致（如整数列出现缺失值）时抛出，改用 float64 重建
+class _DtypeChanged(Exception):
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+
+# 将一块数据的某一列转换为写入缓存的数组，字符串列按全局字典编码
+def _encode_chunk_column(column, series, meta, categories):
+    if column == 'time':
+        # 带时区的时间保留当地时间并去掉时区（便于按日期分组和导出Excel）
+        series = pd.to_datetime(series)
+        if getattr(series.dt, 'tz', None) is not None:
+            series = series.dt.tz_localize(None)
+        meta.setdefault('kind', 'datetime')
+        return series.values.astype('datetime64[ns]')
+
+    if meta.get('kind') == 'category' or (not meta and not pd.api.types.is_numeric_dtype(series)):
+        meta['kind'] = 'category'
+        codes, uniques = pd.factorize(series)
+        lookup = np.array([categories.setdefault(str(value), len(categories)) for value in uniques],
+                          dtype=np.int32)
+        return np.where(codes >= 0, lookup[codes] if len(lookup) else codes, -1).astype(np.int32)
+
+    values = series.to_numpy()
+    if not meta:
+        meta['kind'] = 'numeric'
+        meta['dtype'] = values.dtype.str
+        return values
+    expected = np.dtype(meta['dtype'])
+    if values.dtype != expected:
+        if not np.can_cast(values.dtype, expected, casting='same_kind') or (
+                expected.kind in 'iu' and values.dtype.kind == 'f'):
+            raise _DtypeChanged(column)
+    return values.astype(expected)
+
+
+# 分块读取CSV，把每一列追加写入原始二进制文件，并写入清单
+@instrument()
+def _build_cache(csv_path, cache_dir, float_columns=()):
+    signature = file_signature(csv_path)
+    sha1 = file_hash(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    columns = {}
+    categories = {}
+    handles = {}
+    rows = 0
+    try:
+        dtype = {column: np.float64 for column in float_columns}
+        for chunk in pd.read_csv(csv_path, chunksize=CHUNK_ROWS, dtype=dtype):
+            for column in chunk.columns:
+                meta = columns.setdefault(column, {})
+                values = _encode_chunk_column(column, chunk[column], meta, categories.setdefault(column, {}))
+                if column not in handles:
+                    meta['file'] = f'{column}.bin'
+                    meta['dtype'] = values.dtype.str
+                    handles[column] = open(os.path.join(cache_dir, meta['file']), 'wb')
+                handles[column].write(np.ascontiguousarray(values).tobytes())
+            rows += len(chunk)
+    except _DtypeChanged as changed:
+        for handle in handles.values():
+            handle.close()
+        return _build_cache(csv_path, cache_dir, tuple(float_columns) + (changed.column,))
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    for column, meta in columns.items():
+        if meta['kind'] == 'category':
+            meta['categories'] = list(categories[column])
+
+    manifest = {
+        'version': CACHE_VERSION,
+        'source': signature,
+        'sha1': sha1,
+        'rows': rows,
+        'columns': columns,
+    }
+    _write_manifest(cache_dir, manifest)
+    return manifest
+
+
+# 以内存映射方式打开某一列（不读入内存）
+def _map_column(cache_dir, meta, rows):
+    if rows == 0:
+        return np.empty(0, dtype=meta['dtype'])
+    return np.memmap(os.path.join(cache_dir, meta['file']), dtype=meta['dtype'], mode='r', shape=(rows,))
+
+
+# 把缓存中的一段数组还原为 pandas 列；compact=True 时使用紧凑类型
+def _decode_column(column, meta, values, compact):
+    if meta['kind'] == 'datetime':
+        values = np.asarray(values)
+        if compact:
+            # 日线数据只保留日期
+            values = values.astype('datetime64[D]').astype('datetime64[s]')
+        return pd.Series(values)
+    if meta['kind'] == 'category':
+        if compact:
+            return pd.Series(pd.Categorical.from_codes(np.asarray(values), categories=meta['categories']))
+        categories = np.array(meta['categories'] + [np.nan], dtype=object)
+        # 编码-1表示缺失值，正好对应追加在末尾的NaN
+        return pd.Series(categories[np.asarray(values)], dtype=object)
+
+    values = np.array(values)
+    target = COMPACT_DTYPES.get(column) if compact else None
+    if target is not None:
+        # 含缺失值的列无法转为整数，保持原类型
+        if not (np.issubdtype(target, np.integer) and values.dtype.kind == 'f' and np.isnan(values).any()):
+            values = values.astype(target)
+    return pd.Series(values)
+
+
+def _prepare(csv_path, columns):
+    cache_dir = _cache_dir(csv_path)
+    manifest = _valid_manifest(csv_path, cache_dir)
+    if manifest is None:
+        manifest = _build_cache(csv_path, cache_dir)
+
+    if columns is None:
+        columns = list(manifest['columns'])
+    missing = [c for c in columns if c not in manifest['columns']]
+    if missing:
+        raise KeyError(f"{csv_path} 中缺少列: {missing}")
+    mapped = {c: _map_column(cache_dir, manifest['columns'][c], manifest['rows']) for c in columns}
+    return manifest, columns, mapped
+
+
+# 读取CSV（经由列式缓存），columns 为 None 时返回全部列，compact=True 时使用紧凑类型
+@instrument()
+def load_cached_csv(csv_path, columns=None, compact=False):
+    manifest, columns, mapped = _prepare(csv_path, columns)
+    return pd.DataFrame({c: _decode_column(c, manifest['columns'][c], mapped[c], compact) for c in columns})
+
+
+# 缓存中的全部列名（必要时先建立缓存）
+def cached_columns(csv_path):
+    _, columns, _ = _prepare(csv_path, None)
+    return columns
+
+
+# 分块读取CSV（经由列式缓存），每次只在内存中保留 chunk_rows 行
+def iter_cached_chunks(csv_path, columns=None, chunk_rows=CHUNK_ROWS, compact=True):
+    manifest, columns, mapped = _prepare(csv_path, columns)
+    for start in range(0, manifest['rows'], chunk_rows):
+        stop = min(start + chunk_rows, manifest['rows'])
+        chunk = pd.DataFrame({c: _decode_column(c, manifest['columns'][c], mapped[c][start:stop], compact)
+                              for c in columns})
+        chunk.index = pd.RangeIndex(start, stop)
+        yield chunk
+
+
+# 源文件内容的SHA1：缓存有效时直接取清单中的值，无需重新读取整个文件
+def source_fingerprint(csv_path):
+    manifest = _valid_manifest(csv_path, _cache_dir(csv_path))
+    if manifest is not None:
+        return manifest['sha1']
+    return file_hash(csv_path)
+
+
+def kdata_path(year, data_folder):
+    return os.path.join(data_folder, f'hs300stocks_kdata_{year}.csv')
+
+
+def stock_info_path(year, data_folder):
+    return os.path.join(data_folder, f'hs300stocks_{year}.csv')
+
+
+# 读取某一年的行情数据 hs300stocks_kdata_{year}.csv
+def load_kdata(year, data_folder, columns=None, compact=False):
+    return load_cached_csv(kdata_path(year, data_folder), columns=columns, compact=compact)
+
+
+# 分块读取某一年的行情数据
+def iter_kdata_chunks(year, data_folder, columns=None, chunk_rows=CHUNK_ROWS, compact=True):
+    return iter_cached_chunks(kdata_path(year, data_folder), columns=columns, chunk_rows=chunk_rows,
+                              compact=compact)
+
+
+# 读取某一年的成分股数据 hs300stocks_{year}.csv
+def load_stock_info(year, data_folder, columns=None):
+    return load_cached_csv(stock_info_path(year, data_folder), columns=columns)
@@ -0,0 +1,118 @@
+import os
+
+import pandas as pd
+
+from common.archive_reader import DERIVED_CACHE_DIR_NAME, cached_derived
+from common.instrumentation import instrument
+from common.kdata_cache import kdata_path, load_kdata, load_stock_info, stock_info_path
+from common.panel import Panel
+
+# 市场指数的构造方式：
+# mean_close         所有证券收盘价的平均值（原脚本的价格加权近似）
+# equal_weight       年初等权买入持有
+# constituent_weight 按 hs300stocks_{year}.csv 的权重买入持有
+# return_average     每日所有证券收益率的平均值（每日再平衡的等权组合）
+INDEX_METHODS = ('mean_close', 'equal_weight', 'constituent_weight', 'return_average')
+INDEX_VERSION = 1
+
+
+# 由一年的行情数据计算各种指数的每日收益率（按日期索引，第一天为 NaN）
+# kdata 为包含 time、code、close 三列的长表或 Panel，weights 为按证券代码索引的成分股权重
+def index_returns(kdata, weights=None):
+    if isinstance(kdata, Panel):
+        close = kdata.frame('close')
+        indices = {'mean_close': close.mean(axis=1).pct_change()}
+    else:
+        close = kdata.pivot(index='time', columns='code', values='close').sort_index()
+        indices = {'mean_close': kdata.groupby('time')['close'].mean().sort_index().pct_change()}
+
+    # 买入持有：停牌日沿用上一个收盘价，年初之后才有数据的证券从第一个收盘价开始计算
+    filled = close.ffill().bfill()
+    relative = filled / filled.iloc[0]
+    indices['equal_weight'] = relative.mean(axis=1).pct_change()
+    if weights is not None:
+        weights = weights.reindex(close.columns).fillna(0.0)
+        if weights.sum() > 0:
+            indices['constituent_weight'] = (relative @ weights / weights.sum()).pct_change()
+    indices['return_average'] = close.pct_change(fill_method=None).mean(axis=1)
+
+    frame = pd.DataFrame(indices).reindex(columns=[m for m in INDEX_METHODS if m in indices])
+    frame.index.name = 'time'
+    return frame
+
+
+def _read_weights(year, data_folder):
+    if not os.path.exists(stock_info_path(year, data_folder)):
+        return None
+    stock_info = load_stock_info(year, data_folder, columns=['code', 'weight'])
+    return stock_info.drop_duplicates('code', keep='last').set_index('code')['weight']
+
+
+# 计算某一年的指数，并保留首尾收盘价与权重，用于跨年衔接
+@instrument()
+def compute_year_index(year, data_folder):
+    kdata = load_kdata(year, data_folder, columns=['time', 'code', 'close'])
+    kdata['time'] = pd.to_datetime(kdata['time'])
+    weights = _read_weights(year, data_folder)
+
+    close = kdata.pivot(index='time', columns='code', values='close').sort_index()
+    return {
+        'index': index_returns(kdata, weights),
+        'first_close': close.iloc[0].dropna(),
+        'last_close': close.ffill().iloc[-1].dropna(),
+        'weights': weights,
+    }
+
+
+# 读取某一年的指数（按行情文件和成分股文件的内容缓存，每年只计算一次）
+def load_year_index(year, data_folder):
+    sources = [kdata_path(year, data_folder)]
+    if os.path.exists(stock_info_path(year, data_folder)):
+        sources.append(stock_info_path(year, data_folder))
+    return cached_derived(f'market_index_v{INDEX_VERSION}_{year}', sources,
+                          lambda: compute_year_index(year, data_folder),
+                          cache_folder=os.path.join(data_folder, DERIVED_CACHE_DIR_NAME))
+
+
+# 某一年某种指数的每日收益率
+def year_index_returns(year, method, data_folder):
+    if method not in INDEX_METHODS:
+        raise ValueError(f"不支持的市场指数构造方式: {method}")
+    index = load_year_index(year, data_folder)['index']
+    if method not in index.columns:
+        raise ValueError(f"{year}年缺少成分股权重，无法构造 {method} 指数")
+    return index[method]
+
+
+# 相邻两年之间的衔接收益率：只使用两年都有收盘价的证券（成分股变动时的链接）
+def _link_return(previous, current, method):
+    common = current['first_close'].index.intersection(previous['last_close'].index)
+    if len(common) == 0:
+        return float('nan')
+    first = current['first_close'][common]
+    last = previous['last_close'][common]
+    if method == 'mean_close':
+        return first.mean() / last.mean() - 1
+    if method == 'constituent_weight':
+        weights = current['weights'].reindex(common).fillna(0.0)
+        return float((first / last - 1) @ weights / weights.sum())
+    return (first / last - 1).mean()
+
+
+# 多年链接的指数：每年年初第一天的收益率由上一年末的收盘价衔接，返回 time、Return、Level
+def market_index(years, method='equal_weight', data_folder='./data/'):
+    frames = []
+    previous = None
+    for year in years:
+        current = load_year_index(year, data_folder)
+        returns = year_index_returns(year, method, data_folder).copy()
+        if previous is not None:
+            returns.iloc[0] = _link_return(previous, current, method)
+        frames.append(returns)
+        previous = current
+
+    returns = pd.concat(frames)
+    return pd.DataFrame({
+        'Return': returns,
+        'Level': (1 + returns.fillna(0.0)).cumprod(),
+    }).reset_index()
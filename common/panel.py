@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+
+from common.instrumentation import instrument
+from common.kdata_cache import cached_columns, kdata_path, load_kdata
+
+# 面板中保存的行情字段
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount')
+
+
+# 每个位置之前（不含当天）最近一个非缺失值，没有时为 NaN
+def _previous_valid(values):
+    num_dates = values.shape[0]
+    positions = np.where(np.isnan(values), -1, np.arange(num_dates)[:, None])
+    np.maximum.accumulate(positions, axis=0, out=positions)
+    previous = np.empty_like(positions)
+    previous[0] = -1
+    previous[1:] = positions[:-1]
+    result = np.take_along_axis(values, np.maximum(previous, 0), axis=0)
+    result[previous < 0] = np.nan
+    return result
+
+
+# 日期×证券 的稠密面板：每个字段是一个 T×N 的 float64 数组（缺失为 NaN），日期与证券代码均升序排列；
+# mask 标记原始长表中存在的 (日期, 证券)。面板只建立一次，各任务直接按行（日期）或列（证券）取数组，
+# 不再对长表按 code 分组或重新透视。market_return 为与日期对齐的市场收益率（可选）
+class Panel:
+    def __init__(self, dates, codes, fields, mask=None, market_return=None):
+        self.dates = pd.DatetimeIndex(dates, name='time')
+        self.codes = pd.Index(codes, dtype=object, name='code')
+        self.fields = {name: np.asarray(values, dtype=float) for name, values in fields.items()}
+        if mask is None:
+            mask = np.ones((len(self.dates), len(self.codes)), dtype=bool)
+        self.mask = np.asarray(mask, dtype=bool)
+        self.market_return = None if market_return is None else np.asarray(market_return, dtype=float)
+        self._date_map = None
+        self._code_map = None
+        self._cache = {}
+        # 切片得到的面板记录父面板与行列选择，收益率等派生数组在父面板上计算一次后切片
+        self._parent = None
+
+    # 由长表（time、code 及各字段列）建立面板；同一 (日期, 证券) 重复出现时保留最后一行
+    @classmethod
+    def from_frame(cls, kdata, fields=None):
+        if fields is None:
+            fields = [field for field in PANEL_FIELDS if field in kdata.columns]
+        date_index, dates = pd.factorize(pd.to_datetime(kdata['time']), sort=True)
+        code_index, codes = pd.factorize(kdata['code'], sort=True)
+        keep = (date_index >= 0) & (code_index >= 0)
+        date_index, code_index = date_index[keep], code_index[keep]
+
+        shape = (len(dates), len(codes))
+        mask = np.zeros(shape, dtype=bool)
+        mask[date_index, code_index] = True
+        arrays = {}
+        for field in fields:
+            values = np.full(shape, np.nan)
+            values[date_index, code_index] = kdata[field].to_numpy(dtype=float)[keep]
+            arrays[field] = values
+        return cls(dates, np.asarray(codes), arrays, mask)
+
+    # 读取某一年的行情数据 hs300stocks_kdata_{year}.csv 并建立面板（经由共享的列式缓存），
+    # fields 为 None 时读取文件中存在的全部行情字段
+    @classmethod
+    @instrument()
+    def from_kdata(cls, year, data_folder, fields=None):
+        if fields is None:
+            available = cached_columns(kdata_path(year, data_folder))
+            fields = [field for field in PANEL_FIELDS if field in available]
+        kdata = load_kdata(year, data_folder, columns=['time', 'code'] + list(fields))
+        return cls.from_frame(kdata, fields)
+
+    # 把多个面板按日期拼接（证券取并集），用于多年数据；收益率在拼接后的面板上重新计算，会跨年衔接
+    @classmethod
+    def concat(cls, panels):
+        panels = list(panels)
+        codes = panels[0].codes
+        for panel in panels[1:]:
+            codes = codes.union(panel.codes)
+        fields = [field for field in panels[0].fields if all(field in panel.fields for panel in panels)]
+        arrays = {field: [] for field in fields}
+        masks = []
+        for panel in panels:
+            positions = codes.get_indexer(panel.codes)
+            for field in fields:
+                values = np.full((len(panel.dates), len(codes)), np.nan)
+                values[:, positions] = panel.fields[field]
+                arrays[field].append(values)
+            mask = np.zeros((len(panel.dates), len(codes)), dtype=bool)
+            mask[:, positions] = panel.mask
+            masks.append(mask)
+        dates = panels[0].dates.append([panel.dates for panel in panels[1:]])
+        if not dates.is_monotonic_increasing or dates.has_duplicates:
+            raise ValueError("拼接的面板日期必须递增且不重叠")
+        return cls(dates, codes, {field: np.vstack(arrays[field]) for field in fields}, np.vstack(masks))
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.codes)
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    # panel.close 等价于 panel['close']
+    def __getattr__(self, name):
+        fields = self.__dict__.get('fields')
+        if fields is not None and name in fields:
+            return fields[name]
+        raise AttributeError(name)
+
+    # 日期、证券代码到行号、列号的映射（第一次使用时建立），查找为 O(1)
+    def date_position(self, date):
+        if self._date_map is None:
+            self._date_map = {date: position for position, date in enumerate(self.dates)}
+        return self._date_map[pd.Timestamp(date)]
+
+    def code_position(self, code):
+        if self._code_map is None:
+            self._code_map = {code: position for position, code in enumerate(self.codes)}
+        return self._code_map[code]
+
+    # 一组证券代码的列号（按给定顺序），不存在的代码抛出 KeyError
+    def code_positions(self, codes):
+        positions = self.codes.get_indexer(pd.Index(codes))
+        if (positions < 0).any():
+            missing = list(pd.Index(codes)[positions < 0])
+            raise KeyError(f"面板中不存在的证券代码: {missing}")
+        return positions
+
+    # 按行列选择取子面板；行为切片，列为切片或列号数组
+    def _take(self, rows, columns):
+        market_return = None if self.market_return is None else self.market_return[rows]
+        panel = Panel(self.dates[rows], self.codes[columns],
+                      {name: values[rows, columns] for name, values in self.fields.items()},
+                      self.mask[rows, columns], market_return)
+        panel._parent = (self, rows, columns)
+        return panel
+
+    # 日期区间 [start, end] 内的子面板（两端为 None 时不限），数组均为原数组的视图，不复制数据
+    def between(self, start=None, end=None):
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return self._take(slice(lo, hi), slice(None))
+
+    # 一组证券的子面板（按证券代码排序）：代码在面板中连续时为视图，否则只能复制所选的列
+    def select(self, codes):
+        positions = np.sort(self.code_positions(codes))
+        if len(positions) and positions[-1] - positions[0] == len(positions) - 1:
+            columns = slice(positions[0], positions[-1] + 1)
+        else:
+            columns = positions
+        return self._take(slice(None), columns)
+
+    # 附加与日期对齐的市场收益率（按日期索引的 Series），数组与缓存与原面板共享
+    def with_market_return(self, market_return):
+        panel = Panel.__new__(Panel)
+        panel.__dict__.update(self.__dict__)
+        panel.market_return = pd.Series(market_return).reindex(self.dates).to_numpy(dtype=float)
+        return panel
+
+    # 增加字段（T×N 数组）并可替换 mask，其余数组与缓存与原面板共享；替换已有字段时派生数组重新计算
+    def with_fields(self, mask=None, **fields):
+        panel = Panel.__new__(Panel)
+        panel.__dict__.update(self.__dict__)
+        if any(name in self.fields for name in fields):
+            panel._cache = {}
+            panel._parent = None
+        panel.fields = dict(self.fields, **{name: np.asarray(values, dtype=float) for name, values in fields.items()})
+        if mask is not None:
+            panel.mask = np.asarray(mask, dtype=bool)
+        return panel
+
+    # 派生数组只计算一次：切片的面板取父面板结果的切片
+    def _derived(self, key, compute):
+        if key not in self._cache:
+            if self._parent is not None:
+                parent, rows, columns = self._parent
+                self._cache[key] = parent._derived(key, compute)[rows, columns]
+            else:
+                self._cache[key] = compute(self)
+        return self._cache[key]
+
+    # 每只证券之前最近一个非缺失值（如前收盘价）
+    def previous(self, field='close'):
+        return self._derived(('previous', field), lambda panel: _previous_valid(panel.fields[field]))
+
+    # 每日收益率（缓存）：skip_missing=True 时相对于该证券上一个有收盘价的交易日（与长表按 code 分组的
+    # pct_change 一致），False 时相对于前一个交易日（与宽表的 pct_change(fill_method=None) 一致，停牌后首日为 NaN）；
+    # log=True 时为对数收益率。第一个交易日没有收益率
+    def returns(self, skip_missing=True, log=False):
+        def compute(panel):
+            close = panel.fields['close']
+            if skip_missing:
+                previous = panel.previous('close')
+            else:
+                previous = np.full_like(close, np.nan)
+                previous[1:] = close[:-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.log(close / previous) if log else close / previous - 1
+        return self._derived(('returns', skip_missing, log), compute)
+
+    # 某个字段的宽表（日期×证券），不复制数据
+    def frame(self, field):
+        return pd.DataFrame(self.fields[field], index=self.dates, columns=self.codes, copy=False)
+
+    def returns_frame(self, skip_missing=True, log=False):
+        return pd.DataFrame(self.returns(skip_missing, log), index=self.dates, columns=self.codes, copy=False)
+
+    # 按日期索引的市场收益率
+    def market_return_series(self):
+        if self.market_return is None:
+            return None
+        return pd.Series(self.market_return, index=self.dates, name='market_return')
+
+    # 每个有行情的交易日各字段在证券间的合计（长表：time 及各字段），与长表按 time 分组求和一致
+    def daily_totals(self, fields=('volume', 'amount')):
+        traded = self.mask.any(axis=1)
+        totals = {'time': self.dates[traded]}
+        for field in fields:
+            totals[field] = np.nansum(self.fields[field], axis=1)[traded]
+        return pd.DataFrame(totals)
+
+    # 还原为长表（按日期、证券代码排序），只包含原始长表中存在的行
+    def to_frame(self, fields=None):
+        rows, columns = np.nonzero(self.mask)
+        data = {'time': self.dates[rows], 'code': self.codes[columns]}
+        for field in fields if fields is not None else self.fields:
+            data[field] = self.fields[field][rows, columns]
+        return pd.DataFrame(data)
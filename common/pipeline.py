@@ -0,0 +1,191 @@
+import glob
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+from common import instrumentation
+
+PIPELINE_CACHE_FOLDER = './.pipeline_cache/'
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, '__qualname__', getattr(obj, '__name__', repr(obj)))
+
+
+# 阶段代码的哈希：阶段函数本身及 code_deps（阶段实际调用的模块或函数）的源代码，
+# 其中任何一个修改后，阶段结果及下游结果自动失效；code_deps 之外的代码修改不会使缓存失效
+def _code_hash(func, code_deps=()):
+    sha1 = hashlib.sha1()
+    for obj in (func,) + tuple(code_deps):
+        sha1.update(_source(obj).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+# 流水线中的一个阶段
+# per_year=True 时按年份调用 func(year, *依赖结果, **params)，依赖结果是同一年份的结果；
+# per_year=False 时对全部年份调用一次 func(years, *依赖结果, **params)，按年份的依赖以 {年份: 结果} 传入。
+# fingerprint(year) 用于源数据阶段，返回源文件内容的哈希；store=False 的阶段不写入缓存；
+# code_deps 为阶段函数调用的模块或函数，其源代码计入缓存键
+class Stage:
+    def __init__(self, name, func, deps=(), params=None, per_year=True, fingerprint=None, store=True,
+                 code_deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.params = dict(params or {})
+        self.per_year = per_year
+        self.fingerprint = fingerprint
+        self.store = store
+        self.code_hash = _code_hash(func, code_deps)
+
+
+# 依赖感知的流水线：每个中间结果以 (输入哈希, 参数, 阶段及 code_deps 的代码) 的内容哈希为键缓存，
+# 只有输入或参数变化的年份和阶段会被重新计算
+class Pipeline:
+    def __init__(self, cache_folder=PIPELINE_CACHE_FOLDER):
+        self.cache_folder = cache_folder
+        self.stages = {}
+        self.status = []
+        self._years = []
+        self._keys = {}
+        self._values = {}
+
+    # 注册阶段；依赖必须先于阶段注册，因此声明顺序即拓扑顺序
+    def add_stage(self, name, func, deps=(), params=None, per_year=True, fingerprint=None, store=True,
+                  code_deps=()):
+        if name in self.stages:
+            raise ValueError(f"阶段 {name} 已存在")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"阶段 {name} 的依赖未注册: {missing}")
+        if per_year and any(not self.stages[dep].per_year for dep in deps):
+            raise ValueError(f"按年份的阶段 {name} 不能依赖汇总阶段")
+        self.stages[name] = Stage(name, func, deps, params, per_year, fingerprint, store, code_deps)
+        return self.stages[name]
+
+    def _reset(self, years):
+        self._years = list(years)
+        self._keys = {}
+        self._values = {}
+        self.status = []
+
+    # 阶段在某一年份（汇总阶段为 None）的内容哈希
+    def _key(self, name, year):
+        if (name, year) in self._keys:
+            return self._keys[(name, year)]
+
+        stage = self.stages[name]
+        deps = {}
+        for dep in stage.deps:
+            if stage.per_year or not self.stages[dep].per_year:
+                deps[dep] = self._key(dep, year)
+            else:
+                deps[dep] = [self._key(dep, y) for y in self._years]
+        payload = {
+            'stage': name,
+            'year': year if stage.per_year else self._years,
+            'code': stage.code_hash,
+            'params': stage.params,
+            'deps': deps,
+        }
+        if stage.fingerprint is not None:
+            payload['source'] = stage.fingerprint(year)
+        key = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self._keys[(name, year)] = key
+        return key
+
+    def _artifact_prefix(self, name, year):
+        label = 'all' if year is None else str(year)
+        return os.path.join(self.cache_folder, name, label)
+
+    def _artifact_path(self, name, year):
+        return f'{self._artifact_prefix(name, year)}-{self._key(name, year)}.pkl'
+
+    # 先写临时文件再替换，并删除同一阶段、同一年份的过期结果
+    def _store(self, name, year, value):
+        path = self._artifact_path(name, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        pd.to_pickle(value, tmp_path)
+        os.replace(tmp_path, path)
+        for old_path in glob.glob(f'{self._artifact_prefix(name, year)}-*.pkl'):
+            if old_path != path:
+                os.remove(old_path)
+
+    def _is_cached(self, name, year):
+        return self.stages[name].store and os.path.exists(self._artifact_path(name, year))
+
+    def _dep_value(self, dep, year):
+        if year is None and self.stages[dep].per_year:
+            return {y: self._value(dep, y) for y in self._years}
+        return self._value(dep, year)
+
+    # 取得阶段结果：缓存命中时直接读取，不再触及上游阶段
+    def _value(self, name, year):
+        if (name, year) in self._values:
+            return self._values[(name, year)]
+
+        stage = self.stages[name]
+        if self._is_cached(name, year):
+            value = pd.read_pickle(self._artifact_path(name, year))
+            self.status.append((name, year, 'cached'))
+        else:
+            args = [self._dep_value(dep, year) for dep in stage.deps]
+            label = f'pipeline.{name}' if year is None else f'pipeline.{name}({year})'
+            with instrumentation.stage(label) as record:
+                value = stage.func(year if stage.per_year else list(self._years), *args, **stage.params)
+                record.rows_out = instrumentation.count_rows(value)
+            if stage.store:
+                self._store(name, year, value)
+            self.status.append((name, year, 'computed'))
+        self._values[(name, year)] = value
+        return value
+
+    # 列出为得到 targets 需要重新计算的 (阶段, 年份)，不执行任何计算
+    def stale(self, targets, years):
+        self._reset(years)
+        stale = []
+        seen = set()
+
+        def visit(name, year):
+            if (name, year) in seen:
+                return
+            seen.add((name, year))
+            if self._is_cached(name, year):
+                return
+            stale.append((name, year))
+            for dep in self.stages[name].deps:
+                if year is None and self.stages[dep].per_year:
+                    for y in self._years:
+                        visit(dep, y)
+                else:
+                    visit(dep, year)
+
+        for target in targets:
+            if self.stages[target].per_year:
+                for year in self._years:
+                    visit(target, year)
+            else:
+                visit(target, None)
+        return stale
+
+    # 运行流水线，返回 {阶段: 结果}；按年份的阶段结果为 {年份: 结果}
+    def run(self, targets, years):
+        self._reset(years)
+        results = {}
+        for target in targets:
+            if self.stages[target].per_year:
+                results[target] = {year: self._value(target, year) for year in self._years}
+            else:
+                results[target] = self._value(target, None)
+        return results
+
+    # 本次运行中重新计算的 (阶段, 年份)
+    def computed(self):
+        return [(name, year) for name, year, state in self.status if state == 'computed']
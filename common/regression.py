@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from common.instrumentation import instrument
+
+
+# 将输入统一为二维数组（时间×证券）与一维市场收益率
+def _as_arrays(stock_returns, market_returns):
+    y = np.asarray(stock_returns, dtype=float)
+    if y.ndim == 1:
+        y = y[:, None]
+    x = np.asarray(market_returns, dtype=float).reshape(-1, 1)
+    if x.shape[0] != y.shape[0]:
+        raise ValueError("市场收益率的长度与证券收益率的行数不一致。")
+    return x, y
+
+
+# 由（中心化后的）充分统计量计算回归结果
+def _ols_from_moments(n, sx, sy, sxx, sxy, syy, x_shift, y_shift, min_periods):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = sx / n
+        mean_y = sy / n
+        cxx = sxx - sx * mean_x
+        cxy = sxy - sx * mean_y
+        cyy = syy - sy * mean_y
+
+        # 市场收益率无变化时斜率取0，与最小二乘的最小范数解一致
+        beta = np.where(cxx > 0, cxy / cxx, 0.0)
+        alpha = (mean_y + y_shift) - beta * (mean_x + x_shift)
+        r2 = np.where((cxx > 0) & (cyy > 0), cxy * cxy / (cxx * cyy), np.nan)
+        residual_var = np.maximum(cyy - beta * cxy, 0.0) / (n - 2)
+        residual_vol = np.where(n > 2, np.sqrt(residual_var), np.nan)
+
+    enough = n >= min_periods
+    return {
+        'Alpha': np.where(enough, alpha, np.nan),
+        'Beta': np.where(enough, beta, np.nan),
+        'R2': np.where(enough, r2, np.nan),
+        'ResidualVolatility': np.where(enough, residual_vol, np.nan),
+        'Observations': n,
+    }
+
+
+# 中心化并按成对有效的观测构造各阶矩的输入
+def _paired_terms(x, y):
+    valid = ~np.isnan(y) & ~np.isnan(x)
+    # 先减去整体均值以降低累计求和的舍入误差，截距最后再还原
+    x_shift = np.nanmean(x) if valid.any() else 0.0
+    # 按成对有效的观测求均值；没有成对观测的证券取0（直接用 nanmean 会对空列发出警告）
+    count = valid.sum(axis=0)
+    y_shift = np.where(valid, y, 0.0).sum(axis=0) / np.maximum(count, 1)
+    xv = np.where(valid, x - x_shift, 0.0)
+    yv = np.where(valid, y - y_shift, 0.0)
+    return valid, xv, yv, x_shift, y_shift
+
+
+# 对所有证券同时做一元线性回归：stock_return = alpha + beta * market_return
+@instrument()
+def batched_ols(stock_returns, market_returns, min_periods=2):
+    x, y = _as_arrays(stock_returns, market_returns)
+    valid, xv, yv, x_shift, y_shift = _paired_terms(x, y)
+
+    result = _ols_from_moments(
+        valid.sum(axis=0), xv.sum(axis=0), yv.sum(axis=0),
+        (xv * xv).sum(axis=0), (xv * yv).sum(axis=0), (yv * yv).sum(axis=0),
+        x_shift, y_shift, min_periods,
+    )
+    if isinstance(stock_returns, pd.DataFrame):
+        return pd.DataFrame(result, index=stock_returns.columns)
+    return result
+
+
+# 滚动窗口回归：用累计和一次得到每个交易日、每只证券的 alpha/beta/R²/残差波动率
+@instrument()
+def rolling_ols(stock_returns, market_returns, window, min_periods=None):
+    if min_periods is None:
+        min_periods = window
+    x, y = _as_arrays(stock_returns, market_returns)
+    valid, xv, yv, x_shift, y_shift = _paired_terms(x, y)
+
+    def window_sum(values):
+        cumulative = np.cumsum(values, axis=0)
+        lagged = np.zeros_like(cumulative)
+        lagged[window:] = cumulative[:-window]
+        return cumulative - lagged
+
+    xv_full = np.broadcast_to(xv, yv.shape)
+    result = _ols_from_moments(
+        window_sum(valid.astype(float)), window_sum(xv_full), window_sum(yv),
+        window_sum(xv_full * xv_full), window_sum(xv_full * yv), window_sum(yv * yv),
+        x_shift, y_shift, min_periods,
+    )
+    if isinstance(stock_returns, pd.DataFrame):
+        return {name: pd.DataFrame(values, index=stock_returns.index, columns=stock_returns.columns)
+                for name, values in result.items()}
+    return result
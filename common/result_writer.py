@@ -0,0 +1,119 @@
+import glob
+import os
+
+import pandas as pd
+
+from common.instrumentation import instrument
+
+# 结果数据集的默认目录与格式（'parquet'、'arrow' 或 'csv'）
+RESULTS_FOLDER = './results/'
+DEFAULT_FORMAT = 'parquet'
+
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': 'csv'}
+
+
+def _dataset_dir(name, output_folder):
+    return os.path.join(output_folder, name)
+
+
+# 按年份拆分数据：优先使用 Year 列，其次使用 Date 列的年份；都没有时不分区
+def _partitions(df, year):
+    if year is not None:
+        return [(year, df)]
+    if 'Year' in df.columns:
+        return list(df.groupby('Year', sort=True))
+    if 'Date' in df.columns:
+        return list(df.groupby(pd.to_datetime(df['Date']).dt.year.rename('Year'), sort=True))
+    return [(None, df)]
+
+
+def _write_file(df, path, fmt):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if fmt == 'csv':
+        df.to_csv(tmp_path, index=False)
+    else:
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, tmp_path)
+        else:
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+# 写入结果数据集：每个年份一个分区（name/year=YYYY/），重复写入同一年份时替换该分区
+@instrument()
+def write_results(df, name, output_folder=RESULTS_FOLDER, fmt=DEFAULT_FORMAT, year=None):
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+    dataset_dir = _dataset_dir(name, output_folder)
+    paths = []
+    for partition_year, part in _partitions(df, year):
+        partition_dir = dataset_dir if partition_year is None else os.path.join(dataset_dir, f'year={int(partition_year)}')
+        os.makedirs(partition_dir, exist_ok=True)
+        # 清除该分区中旧的（可能是其他格式的）文件
+        for old_file in glob.glob(os.path.join(partition_dir, 'part-*')):
+            os.remove(old_file)
+        path = os.path.join(partition_dir, f'part-0.{EXTENSIONS[fmt]}')
+        _write_file(part, path, fmt)
+        paths.append(path)
+    return paths
+
+
+def _read_file(path):
+    extension = os.path.splitext(path)[1][1:]
+    if extension == 'csv':
+        return pd.read_csv(path)
+    import pyarrow as pa
+
+    if extension == 'parquet':
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+# 读取结果数据集（可只读部分年份）；as_arrow=True 时返回内存映射的 pyarrow.Table
+@instrument()
+def read_results(name, output_folder=RESULTS_FOLDER, years=None, as_arrow=False):
+    dataset_dir = _dataset_dir(name, output_folder)
+    files = sorted(glob.glob(os.path.join(dataset_dir, 'part-*')))
+    partition_dirs = sorted(glob.glob(os.path.join(dataset_dir, 'year=*')),
+                            key=lambda path: int(path.rsplit('=', 1)[1]))
+    for partition_dir in partition_dirs:
+        if years is not None and int(partition_dir.rsplit('=', 1)[1]) not in years:
+            continue
+        files += sorted(glob.glob(os.path.join(partition_dir, 'part-*')))
+    if not files:
+        raise FileNotFoundError(f"结果数据集 {dataset_dir} 不存在或为空。")
+
+    parts = [_read_file(path) for path in files]
+    if any(isinstance(part, pd.DataFrame) for part in parts):
+        # 分区中混有CSV文件时统一转为 DataFrame
+        return pd.concat([part if isinstance(part, pd.DataFrame) else part.to_pandas() for part in parts],
+                         ignore_index=True)
+    import pyarrow as pa
+
+    # 不同批次写入的分区类型可能略有不同（如时间精度），按宽松规则统一
+    table = pa.concat_tables(parts, promote_options='permissive')
+    return table if as_arrow else table.to_pandas()
+
+
+# 按需把一个或多个结果数据集导出为 Excel；sheets 为 {工作表名: 数据集名}，或单个数据集名
+@instrument()
+def export_excel(sheets, output_file, output_folder=RESULTS_FOLDER, index_columns=None):
+    if isinstance(sheets, str):
+        sheets = {'Sheet1': sheets}
+    index_columns = index_columns or {}
+    with pd.ExcelWriter(output_file) as writer:
+        for sheet_name, name in sheets.items():
+            df = read_results(name, output_folder)
+            if sheet_name in index_columns:
+                df.set_index(index_columns[sheet_name]).to_excel(writer, sheet_name=sheet_name)
+            else:
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return output_file
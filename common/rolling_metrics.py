@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+from common.instrumentation import instrument
+
+
+# 窗口求和：由累计和相减得到每个交易日结尾、长度为 window 的窗口内的和
+def _window_sum(values, window):
+    cumulative = np.cumsum(values, axis=0)
+    lagged = np.zeros_like(cumulative)
+    lagged[window:] = cumulative[:-window]
+    return cumulative - lagged
+
+
+# 每个窗口内的最大跌幅 max_{s≤j} (levels[s] - levels[j])，窗口为 levels 中长度 size 的连续区间 [t, t + size - 1]
+# （开头不足 size 时从第0个开始）。van Herk/Gil-Werman 分块：按 size 分块后，每个窗口最多跨两个相邻的块，
+# 左块后缀与右块前缀上的最大值、最小值和最大跌幅各扫描一次，与窗口长度无关，总代价为 O(行数×列数)
+def _sliding_max_drop(levels, size):
+    num_levels, num_columns = levels.shape
+    num_blocks = -(-num_levels // size)
+    # 补齐的部分只在最后一块的末尾，不会出现在任何窗口中
+    padded = np.zeros((num_blocks * size, num_columns))
+    padded[:num_levels] = levels
+    blocks = padded.reshape(num_blocks, size, num_columns)
+
+    prefix_max = np.maximum.accumulate(blocks, axis=1)
+    prefix_min = np.minimum.accumulate(blocks, axis=1)
+    prefix_drop = np.maximum.accumulate(prefix_max - blocks, axis=1)
+
+    reversed_blocks = blocks[:, ::-1]
+    suffix_max = np.maximum.accumulate(reversed_blocks, axis=1)[:, ::-1]
+    suffix_min = np.minimum.accumulate(reversed_blocks, axis=1)[:, ::-1]
+    suffix_drop = np.maximum.accumulate((blocks - suffix_min)[:, ::-1], axis=1)[:, ::-1]
+
+    prefix_max, prefix_min, prefix_drop = (a.reshape(-1, num_columns) for a in (prefix_max, prefix_min, prefix_drop))
+    suffix_max, suffix_drop = (a.reshape(-1, num_columns) for a in (suffix_max, suffix_drop))
+
+    # 窗口 [start, end]：end 所在块的起点为 boundary，start < boundary 时窗口跨越两个块
+    end = np.arange(num_levels)
+    start = np.maximum(end - size + 1, 0)
+    boundary = end // size * size
+    drop = prefix_drop[end]
+    crossing = start < boundary
+    left = start[crossing]
+    right = end[crossing]
+    drop[crossing] = np.maximum.reduce([
+        drop[crossing],
+        suffix_drop[left],
+        suffix_max[left] - prefix_min[right],
+    ])
+    return drop
+
+
+# 滚动最大回撤：每个交易日、每只证券最近 window 个交易日内的最大回撤（净值相对于窗口内历史最高净值，
+# 窗口开始时的净值计入最高净值），缺失的收益率按0处理
+@instrument()
+def rolling_max_drawdown(returns, window):
+    returns_matrix = np.asarray(returns, dtype=float)
+    if returns_matrix.ndim == 1:
+        returns_matrix = returns_matrix[:, None]
+    log_returns = np.nan_to_num(np.log1p(returns_matrix))
+
+    # 对数净值：第0个为初始净值，第 t+1 个为第 t 个交易日收盘后的净值
+    levels = np.zeros((len(log_returns) + 1, log_returns.shape[1]))
+    np.cumsum(log_returns, axis=0, out=levels[1:])
+    drawdown = -np.expm1(-_sliding_max_drop(levels, window + 1)[1:])
+    if isinstance(returns, pd.DataFrame):
+        return pd.DataFrame(drawdown, index=returns.index, columns=returns.columns)
+    return drawdown
+
+
+# 滚动风险指标：每个交易日、每只证券最近 window 个交易日的波动率、夏普比率、累计收益率和最大回撤
+# 均值与方差由累计和得到（先减去每只证券的均值以降低舍入误差），代价与窗口长度无关；
+# 波动率与夏普比率为日度值，与年度因子一致：SharpeRatio = (日均收益率 - risk_free_rate_daily) / 日收益率标准差。
+# 有效收益率少于 min_periods（默认为 window）的位置为 NaN
+@instrument()
+def rolling_metrics(returns, window, risk_free_rate_daily=0.0, min_periods=None):
+    if min_periods is None:
+        min_periods = window
+    returns_matrix = np.asarray(returns, dtype=float)
+    if returns_matrix.ndim == 1:
+        returns_matrix = returns_matrix[:, None]
+
+    valid = ~np.isnan(returns_matrix)
+    shift = np.zeros(returns_matrix.shape[1])
+    if valid.any():
+        with np.errstate(invalid='ignore'):
+            shift = np.nan_to_num(np.nanmean(np.where(valid, returns_matrix, np.nan), axis=0))
+    centered = np.where(valid, returns_matrix - shift, 0.0)
+
+    n = _window_sum(valid.astype(float), window)
+    s = _window_sum(centered, window)
+    ss = _window_sum(centered * centered, window)
+    log_sum = _window_sum(np.log1p(np.where(valid, returns_matrix, 0.0)), window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s / n + shift
+        variance = np.maximum(ss - s * s / n, 0.0) / (n - 1)
+        volatility = np.where(n >= 2, np.sqrt(variance), np.nan)
+        sharpe_ratio = (mean - risk_free_rate_daily) / volatility
+
+    enough = (n >= min_periods) & (n > 0)
+    result = {
+        'Volatility': np.where(enough, volatility, np.nan),
+        'SharpeRatio': np.where(enough, sharpe_ratio, np.nan),
+        'TotalReturn': np.where(enough, np.expm1(log_sum), np.nan),
+        'MaxDrawdown': np.where(enough, rolling_max_drawdown(returns_matrix, window), np.nan),
+        'Observations': n,
+    }
+    if isinstance(returns, pd.DataFrame):
+        return {name: pd.DataFrame(values, index=returns.index, columns=returns.columns)
+                for name, values in result.items()}
+    return result
@@ -0,0 +1,153 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.instrumentation import instrument
+from common.kdata_cache import load_stock_info, stock_info_path
+from common.panel import Panel
+
+
+# 某一年的成分股文件覆盖的日期区间 [当年1月1日, 次年1月1日)
+def year_interval(year):
+    return pd.Timestamp(year=year, month=1, day=1), pd.Timestamp(year=year + 1, month=1, day=1)
+
+
+# 成分股区间索引：每一行为一个区间 (code, start, end, weight)，表示 [start, end) 内该证券是成分股、权重为 weight。
+# 区间按 (证券, start) 排序后保存为数组，任意 日期×证券 的成员资格与权重由一次 searchsorted 得到（as-of 查询），
+# 不需要按年读取成分股文件再与行情合并。同一证券的区间不能重叠
+class Universe:
+    def __init__(self, codes, starts, ends, weights):
+        codes = pd.Index(codes, dtype=object)
+        starts = pd.DatetimeIndex(starts).to_numpy(dtype='datetime64[ns]')
+        ends = pd.DatetimeIndex(ends).to_numpy(dtype='datetime64[ns]')
+        weights = np.asarray(weights, dtype=float)
+
+        code_index, self.codes = pd.factorize(codes, sort=True)
+        self.codes = pd.Index(self.codes, dtype=object, name='code')
+        order = np.lexsort((starts, code_index))
+        self.code_index = code_index[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.weights = weights[order]
+
+        same_code = self.code_index[1:] == self.code_index[:-1]
+        if (same_code & (self.starts[1:] < self.ends[:-1])).any():
+            raise ValueError("同一证券的成分股区间不能重叠")
+
+        # 区间端点的有序集合：日期先换算为在端点中的序号，与证券序号组合为整数键，避免按证券逐个查找
+        self._boundaries = np.unique(np.concatenate([self.starts, self.ends]))
+        self._keys = self._key(self.code_index, self.starts)
+
+    # 由每年的成分股表（code、weight 列）建立索引，每年的区间为 [当年1月1日, 次年1月1日)；
+    # 同一年同一证券重复出现时保留最后一行
+    @classmethod
+    def from_frames(cls, stock_info_by_year):
+        frames = []
+        for year, stock_info in stock_info_by_year.items():
+            stock_info = stock_info.drop_duplicates('code', keep='last')
+            start, end = year_interval(year)
+            frames.append(pd.DataFrame({
+                'code': stock_info['code'].astype(str).to_numpy(dtype=object),
+                'start': start,
+                'end': end,
+                'weight': stock_info['weight'].to_numpy(dtype=float) if 'weight' in stock_info else np.nan,
+            }))
+        intervals = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            {'code': [], 'start': pd.DatetimeIndex([]), 'end': pd.DatetimeIndex([]), 'weight': []})
+        return cls(intervals['code'], intervals['start'], intervals['end'], intervals['weight'])
+
+    # 一次读取多个年份的成分股文件 hs300stocks_{year}.csv（经由共享的列式缓存），不存在的年份没有成分股
+    @classmethod
+    @instrument()
+    def load(cls, years, data_folder):
+        stock_info_by_year = {year: load_stock_info(year, data_folder, columns=['code', 'weight'])
+                              for year in years if os.path.exists(stock_info_path(year, data_folder))}
+        if not stock_info_by_year:
+            raise FileNotFoundError(f"{data_folder} 中没有 {list(years)} 年的成分股文件")
+        return cls.from_frames(stock_info_by_year)
+
+    def __len__(self):
+        return len(self.code_index)
+
+    # 区间表（按证券代码、开始日期排序）
+    def intervals(self):
+        return pd.DataFrame({
+            'code': self.codes[self.code_index],
+            'start': self.starts,
+            'end': self.ends,
+            'weight': self.weights,
+        })
+
+    def _key(self, code_index, dates):
+        rank = np.searchsorted(self._boundaries, dates, side='right')
+        return code_index.astype(np.int64) * (len(self._boundaries) + 1) + rank
+
+    def _dates(self, dates):
+        return pd.DatetimeIndex(pd.to_datetime(dates)).to_numpy(dtype='datetime64[ns]')
+
+    def _code_index(self, codes):
+        return self.codes.get_indexer(pd.Index(codes, dtype=object))
+
+    # 成对的 (日期, 证券) 所在区间的行号，不是成分股时为 -1
+    def _lookup(self, dates, codes):
+        return self._positions(self._dates(dates), self._code_index(codes))
+
+    def _positions(self, dates, code_index):
+        if not len(self):
+            return np.full(np.broadcast(dates, code_index).shape, -1)
+        known = code_index >= 0
+        position = np.searchsorted(self._keys, self._key(np.where(known, code_index, 0), dates), side='right') - 1
+        position = np.maximum(position, 0)
+        member = (known & (self.code_index[position] == code_index)
+                  & (self.starts[position] <= dates) & (dates < self.ends[position]))
+        return np.where(member, position, -1)
+
+    # 成对查询：dates 与 codes 等长，返回每一对是否为成分股、以及当时的权重（不是成分股时为 NaN）
+    def lookup(self, dates, codes):
+        position = self._lookup(dates, codes)
+        return position >= 0, self._weight_of(position)
+
+    def is_member_at(self, dates, codes):
+        return self._lookup(dates, codes) >= 0
+
+    def weights_at(self, dates, codes):
+        return self._weight_of(self._lookup(dates, codes))
+
+    def _weight_of(self, position):
+        weights = np.full(position.shape, np.nan)
+        found = position >= 0
+        weights[found] = self.weights[position[found]]
+        return weights
+
+    # 日期×证券 网格上的查询，返回 T×N 数组
+    def _grid_lookup(self, dates, codes):
+        return self._positions(self._dates(dates)[:, None], self._code_index(codes)[None, :])
+
+    def membership(self, dates, codes):
+        return self._grid_lookup(dates, codes) >= 0
+
+    def weight_matrix(self, dates, codes):
+        return self._weight_of(self._grid_lookup(dates, codes))
+
+    # 某一天的成分股权重（按证券代码索引）
+    def members(self, date):
+        date = np.datetime64(pd.Timestamp(date), 'ns')
+        current = (self.starts <= date) & (date < self.ends)
+        return pd.Series(self.weights[current], index=self.codes[self.code_index[current]], name='weight')
+
+    # 面板加上当时的成分股权重字段 weight，mask 只保留当时是成分股的 (日期, 证券)；
+    # 行情数组与收益率等派生数组与原面板共享（收益率仍按全部收盘价计算，跨越调入调出时不中断）
+    def apply(self, panel):
+        position = self._grid_lookup(panel.dates, panel.codes)
+        return panel.with_fields(mask=panel.mask & (position >= 0), weight=self._weight_of(position))
+
+
+# 一次建立多个年份的面板并标记当时的成分股：行情按年读取后拼接（收益率跨年衔接），成分股由区间索引一次查询
+@instrument()
+def load_universe_panel(years, data_folder, fields=None, universe=None):
+    years = list(years)
+    if universe is None:
+        universe = Universe.load(years, data_folder)
+    panel = Panel.concat([Panel.from_kdata(year, data_folder, fields) for year in years])
+    return universe.apply(panel)
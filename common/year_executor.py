@@ -0,0 +1,66 @@
+import os
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from common import instrumentation
+
+# 单个年份的执行结果：成功时 error 为 None，失败时 value 为 None、error 为异常信息
+YearResult = namedtuple('YearResult', ['year', 'value', 'error'])
+
+
+# 在子进程中执行某一年的任务，异常只影响这一年
+def _run_year(func, year, args):
+    try:
+        with instrumentation.stage(f'{instrumentation.stage_name(func)}({year})'):
+            return YearResult(year, func(year, *args), None)
+    except Exception:
+        return YearResult(year, None, traceback.format_exc())
+
+
+# 子进程中执行，并把阶段统计记录随结果一起返回给主进程
+def _run_year_in_worker(func, year, args):
+    # fork 启动的子进程会继承主进程已有的记录，先清空
+    instrumentation.drain()
+    result = _run_year(func, year, args)
+    return result, instrumentation.drain()
+
+
+# 按年份并行执行 func(year, *args)，返回按年份顺序排列的结果
+# n_jobs 为 None 时使用全部CPU核心，为1时在当前进程中顺序执行；
+# 子进程异常退出（如内存不足被终止，进程池随之损坏）时，未能取得结果的年份记为失败，已完成的年份保留
+def run_years(func, years, *args, n_jobs=None):
+    years = list(years)
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, len(years)))
+
+    if n_jobs == 1:
+        return [_run_year(func, year, args) for year in years]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(_run_year_in_worker, func, year, args) for year in years]
+        results = []
+        for year, future in zip(years, futures):
+            try:
+                result, records = future.result()
+            except Exception:
+                results.append(YearResult(year, None, traceback.format_exc()))
+                continue
+            instrumentation.merge(records)
+            results.append(result)
+        return results
+
+
+# 汇总各年份的结果：打印失败的年份，成功的 DataFrame 一次性拼接；没有任何成功的年份时抛出异常
+def concat_year_results(results):
+    for result in results:
+        if result.error is not None:
+            print(f"{result.year}年的数据处理失败：\n{result.error}")
+    frames = [result.value for result in results if result.error is None]
+    if not frames:
+        failed = [result.year for result in results if result.error is not None]
+        raise RuntimeError(f"没有处理成功的年份，失败的年份: {failed}")
+    return pd.concat(frames, ignore_index=True)